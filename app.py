@@ -1,30 +1,42 @@
 import json
+import time
+import warnings
+
 import streamlit as st
 
 # ===================== Imports =====================
-from layers.dns_layer import resolve_dns
-from layers.ip_layer import tcp_latency
-from layers.traceroute_layer import traceroute_host
-from layers.tcp_layer import tcp_handshake
-from layers.tls_layer import inspect_tls
-from layers.http_layer import http_request
-from layers.quic_layer import quic_request
-from layers.llm_explainer import explain_with_llm
-from reports.report_builder import build_report
-
-from visuals.charts import (
-    latency_bar,
-    traceroute_chart,
-    tcp_handshake_timeline,
-    tls_status_card,
-    http_waterfall_chart,
-    quic_vs_tcp_chart,
-    request_time_breakdown
+# Only what the sidebar and inputs need; the monitoring views, a run and
+# the charts import their numpy-backed modules when they first draw
+from layers.scheduler import (
+    LAYER_PROBES,
+    DEFAULT_WORKERS,
+    TRACED_LAYERS,
+    resolved_ip,
+    run_layers,
+    sampled_probes,
+    traced_plan
 )
+from layers.dns_cache import default_cache as dns_cache
+from layers.dns_profiler import DEFAULT_RESOLVERS, profile_dns
+from layers.http_layer import http_keepalive_benchmark
+from layers.quic_layer import quic_request
+from layers.failure_injector import apply_simulation
+from layers.fault_proxy import FAULT_PROFILES, FaultProxy, routed
+from layers.result_cache import DEFAULT_TTL, ResultCache, cached_probes
+from layers.result_cache import default_cache as result_cache
+from layers.sampling import SAMPLE_METRICS, run_metrics
+from reports.baseline import BaselineStore
 
 # ===================== Page Config =====================
 st.set_page_config(page_title="NetScope", layout="wide")
 
+def charts():
+    """
+    visuals.charts, imported on first use; it loads numpy and Plotly.
+    """
+    import visuals.charts
+    return visuals.charts
+
 def show(fig):
     st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
 
@@ -47,12 +59,16 @@ st.caption("Observe • Break • Explain (smooth, progressive execution)")
 with st.sidebar:
     st.header("Layers")
     enable_dns = st.checkbox("DNS", True)
+    enable_dns_profile = st.checkbox("DNS Resolver Profiler", False)
     enable_ip = st.checkbox("IP / Reachability (TCP)", True)
+    enable_dual_stack = st.checkbox("IPv4 / IPv6 Race (Happy Eyeballs)", False)
     enable_trace = st.checkbox("Traceroute", True)
     enable_tcp = st.checkbox("TCP", True)
     enable_tls = st.checkbox("TLS", True)
+    enable_tls_handshake = st.checkbox("TLS Handshake Benchmark", False)
     enable_http = st.checkbox("HTTP", True)
     enable_quic = st.checkbox("QUIC", True)
+    enable_keepalive = st.checkbox("HTTP Keep-alive Benchmark", False)
 
     st.divider()
     st.header("Failure Simulation (Non-blocking)")
@@ -60,192 +76,644 @@ with st.sidebar:
     slow_tcp = st.checkbox("Simulate Slow TCP")
     fail_http = st.checkbox("Simulate HTTP Failure")
     delay_ms = st.slider("Injected latency (ms)", 100, 2000, 800, 100)
+    fault_proxy = st.checkbox(
+        "Route probes through fault proxy",
+        help="Degrade the real traffic (TCP, TLS, HTTP and DNS) instead of the results; "
+             "traceroute and QUIC are not routed"
+    )
+    faults = None
+    if fault_proxy:
+        fault_profile = st.selectbox("Network profile", ["Custom", *FAULT_PROFILES])
+        if fault_profile == "Custom":
+            proxy_latency = st.slider("Proxy latency (ms, one-way)", 0, 1000, 50, 10)
+            proxy_jitter = st.slider("Jitter (ms)", 0, 200, 10, 5)
+            proxy_loss = st.slider("Packet loss (%)", 0.0, 20.0, 1.0, 0.5)
+            proxy_kbps = st.slider("Bandwidth (kbit/s, 0 = unlimited)", 0, 20000, 0, 250)
+            proxy_resets = st.slider("Connection resets (%)", 0, 100, 0, 5)
+            faults = {
+                "latency": {"dist": "normal", "mean": proxy_latency, "stddev": proxy_jitter},
+                "drop_rate": proxy_loss / 100,
+                "bandwidth_bps": proxy_kbps * 1000 or None,
+                "reset_rate": proxy_resets / 100,
+            }
+        else:
+            faults = dict(FAULT_PROFILES[fault_profile])
 
-# ===================== Input =====================
-domain = st.text_input("Domain", "google.com")
-run = st.button("Run Analysis", type="primary")
+    st.divider()
+    st.header("Execution")
+    max_workers = st.slider("Concurrent layers", 1, len(LAYER_PROBES), DEFAULT_WORKERS)
+    shared_trace = st.checkbox(
+        "Shared connection trace",
+        help="One connect, TLS handshake and HTTP exchange feed the IP, TCP, TLS and HTTP sections"
+    )
+    cache_ttl = st.slider(
+        "Reuse results for (s)", 0, 600, DEFAULT_TTL, 10,
+        help="Layer results this recent (for the same domain and settings) are shown "
+             "without probing again, across all sessions; 0 always probes"
+    )
 
-# ===================== Execution =====================
-if run:
-    report_data = {}
-    summary = {}
+    st.divider()
+    st.header("DNS Resolvers")
+    resolver_list = st.text_input("Resolvers", ", ".join(DEFAULT_RESOLVERS),
+                                  help="system, an address, or address:port")
 
-    enabled_layers = sum([
-        enable_dns,
-        enable_ip,
-        enable_trace,
-        enable_tcp,
-        enable_tls,
-        enable_http,
-        enable_quic
-    ])
-
-    progress_bar, progress_label, total, step = init_progress(enabled_layers)
-
-    # ---------------- DNS ----------------
-    if enable_dns:
-        step += 1
-        advance(progress_bar, progress_label, step, total, "Resolving DNS")
-
-        st.subheader("🧭 DNS")
-        with st.spinner("Resolving DNS..."):
-            dns = resolve_dns(domain)
-
-        if dns["status"] == "ok":
-            if slow_dns:
-                dns["latency"] += delay_ms
-                dns["simulated"] = "slow_dns"
-
-            report_data["dns"] = dns
-            summary["DNS"] = dns["latency"]
-
-            show(latency_bar("DNS Resolution", dns["latency"]))
-
-            cache = dns.get("cache")
-            if cache:
-                st.info(f"Cache: {cache.get('status')} — {cache.get('reason')}")
-            else:
-                st.info("Cache: not inferred")
-        else:
-            st.error(dns["error"])
+    st.divider()
+    st.header("Keep-alive Benchmark")
+    keepalive_requests = st.slider("Requests", 2, 100, 10)
+    keepalive_connections = st.slider("Connections", 1, 16, 1)
+    keepalive_pipeline = st.checkbox("Pipeline requests")
 
-    # ---------------- IP (TCP Reachability) ----------------
-    if enable_ip:
-        step += 1
-        advance(progress_bar, progress_label, step, total, "Measuring TCP reachability")
+    st.divider()
+    st.header("QUIC vs TCP")
+    quic_samples = st.slider("Requests per protocol", 1, 20, 3)
+    quic_concurrency = st.slider("Requests in flight", 1, 16, 4)
 
-        st.subheader("📡 IP / Reachability (TCP)")
-        with st.spinner("Checking TCP connectivity..."):
-            ip = tcp_latency(domain)
+    st.divider()
+    st.header("Sampling")
+    sample_count = st.number_input("Samples per layer", 1, 1000, 1)
+    sample_interval_ms = st.slider("Sample spacing (ms)", 0, 1000, 100, 10)
+    sample_concurrency = st.slider("Samples in flight", 1, 32, 4)
 
-        if ip["status"] == "reachable":
-            report_data["ip"] = ip
-            summary["IP"] = ip["latency_ms"]
+# ===================== Input =====================
+domain = st.text_input("Domain", "google.com")
+run = st.button("Run Analysis", type="primary")
 
-            show(latency_bar(
-                "TCP Reachability (Port 443)",
-                ip["latency_ms"]
+# ===================== History =====================
+# Window -> (seconds, bucket seconds) for points written by monitor.py
+HISTORY_WINDOWS = {
+    "Last hour": (3600, None),
+    "Last day": (86400, 60),
+    "Last week": (7 * 86400, 600),
+    "Last 30 days": (30 * 86400, 3600),
+}
+
+def render_history():
+    from reports.timeseries import TimeSeriesStore
+
+    history_store = TimeSeriesStore()
+    if domain not in history_store.domains():
+        return
+
+    with st.expander("📈 Monitoring History", expanded=not run):
+        window = st.selectbox("Window", list(HISTORY_WINDOWS), index=1)
+        seconds, step = HISTORY_WINDOWS[window]
+        now = time.time()
+
+        history = {
+            metric: history_store.query(domain, metric, now - seconds, now, step)
+            for metric in history_store.metrics(domain)
+        }
+        history = {metric: points for metric, points in history.items() if len(points["ts"])}
+
+        if history:
+            show(charts().history_chart(history))
+        else:
+            st.caption(f"No monitoring data for {domain} in this window")
+
+# ===================== Fleet =====================
+# Time buckets across the fleet heatmap, whatever the window
+FLEET_COLUMNS = 300
+
+def render_fleet():
+    import numpy as np
+    from reports.timeseries import TimeSeriesStore
+
+    history_store = TimeSeriesStore()
+    monitored = history_store.domains()
+    if len(monitored) < 2:
+        return
+
+    with st.expander(f"🗺️ Fleet Heatmap ({len(monitored)} monitored domains)"):
+        if not st.checkbox("Load fleet heatmap"):
+            return
+
+        fleet_window = st.selectbox("Fleet window", list(HISTORY_WINDOWS), index=1)
+        metrics = sorted({metric for name in monitored for metric in history_store.metrics(name)})
+        view = st.selectbox("View", ["Median per layer"] + [metric.upper() for metric in metrics])
+
+        seconds, _ = HISTORY_WINDOWS[fleet_window]
+        now = time.time()
+        step = max(60, seconds // FLEET_COLUMNS)
+
+        if view == "Median per layer":
+            medians = []
+            for metric in metrics:
+                grid = history_store.grid(monitored, metric, now - seconds, now, step)
+                with warnings.catch_warnings():
+                    # Domains without data for a layer stay blank
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    medians.append(np.nanmedian(grid["mean"], axis=1))
+            show(charts().latency_heatmap(
+                np.column_stack(medians), monitored, [metric.upper() for metric in metrics],
+                f"Median Latency by Layer ({fleet_window.lower()})"
             ))
-
-            st.info(
-                f"Method: {ip['method']} • "
-                f"Port: {ip['port']} • "
-                f"Latency: {ip['latency_ms']} ms"
-            )
         else:
-            st.error(ip.get("error", "Host unreachable"))
-
-    # ---------------- Traceroute ----------------
-    if enable_trace:
-        step += 1
-        advance(progress_bar, progress_label, step, total, "Tracing network path")
-
-        st.subheader("🛰️ Traceroute")
-        with st.spinner("Tracing network path..."):
-            trace = traceroute_host(domain)
+            grid = history_store.grid(monitored, view.lower(), now - seconds, now, step)
+            show(charts().latency_heatmap(
+                grid["mean"], monitored, grid["ts"].astype("datetime64[ms]"),
+                f"{view} Latency ({fleet_window.lower()})", "Time"
+            ))
 
-        if trace["status"] == "ok":
-            report_data["traceroute"] = trace
-            show(traceroute_chart(trace["hops"]))
+# ===================== Regions =====================
+# Runs pushed by agents in other regions (monitor.py --collector) to collector.py
+REGION_WINDOW_S = 3600
+
+def render_regions():
+    from reports.regions import RegionStore
+
+    region_rows = RegionStore().latest(domain, REGION_WINDOW_S)
+    if not region_rows:
+        return
+
+    with st.expander("🌍 Latency by Region (last hour)", expanded=not run):
+        show(charts().region_latency_chart(region_rows))
+        st.dataframe([
+            {
+                "Region": row["region"],
+                "Layer": row["layer"].upper(),
+                "Median (ms)": row["median"],
+                "p95 (ms)": row["p95"],
+                "Runs": row["runs"],
+                "Lost": row["lost"],
+                "Last run": time.strftime("%H:%M:%S", time.localtime(row["last_ts"])),
+            }
+            for row in region_rows
+        ], use_container_width=True)
+
+# These views read numpy-backed stores, so numpy loads here, once the
+# sidebar and inputs are already on screen
+render_history()
+render_fleet()
+render_regions()
+
+# Per-layer latency baselines learned from earlier runs of each domain
+baselines = BaselineStore()
+
+# ===================== Layer Rendering =====================
+LAYER_SECTIONS = [
+    ("dns", enable_dns, "🧭 DNS", "Resolving DNS"),
+    ("dns_profile", enable_dns_profile, "🧪 DNS Resolvers", "Comparing resolvers"),
+    ("ip", enable_ip, "📡 IP / Reachability (TCP)", "Measuring TCP reachability"),
+    ("dual_stack", enable_dual_stack, "🏁 IPv4 / IPv6 Race", "Racing every address"),
+    ("traceroute", enable_trace, "🛰️ Traceroute", "Tracing network path"),
+    ("tcp", enable_tcp, "🔗 TCP", "Establishing TCP connection"),
+    ("tls", enable_tls, "🔐 TLS", "Inspecting TLS certificate"),
+    ("tls_handshake", enable_tls_handshake, "🤝 TLS Handshake", "Timing full and resumed handshakes"),
+    ("http", enable_http, "📄 HTTP", "Performing HTTP request"),
+    ("quic", enable_quic, "⚡ QUIC vs TCP", "Testing QUIC / HTTP/3"),
+    ("keepalive", enable_keepalive, "♻️ HTTP Keep-alive", "Benchmarking connection reuse"),
+]
+
+def render_sampling(result, title):
+    sampling = result.get("sampling")
+    if not sampling:
+        return
+
+    stats = sampling["stats"]
+    show(charts().ping_line(sampling["samples"], f"{title} — {stats['count']} Samples"))
+
+    cols = st.columns(6)
+    for col, key in zip(cols, ["min", "median", "p95", "p99", "stddev", "jitter"]):
+        value = stats[key]
+        col.metric(key, "—" if value is None else f"{value:.1f} ms")
+    st.caption(f"Loss: {stats['lost']}/{stats['count']} ({stats['loss_rate']:.1%})")
+
+def render_baseline(layer, result):
+    """
+    Caption with the layer's latency judged against this domain's
+    baseline; returns the verdict for colouring charts.
+    """
+    value = SAMPLE_METRICS[layer](result)
+    if value is None:
+        return None
+
+    judged = baselines.judge(domain, layer, value)
+    if judged["verdict"] == "learning":
+        st.caption(f"Baseline: learning ({judged['count']} runs so far)")
+    else:
+        st.caption(
+            f"Baseline: {judged['verdict']} • usual {judged['p50']:.1f} ms, "
+            f"p95 {judged['p95']:.1f} ms over {judged['count']} runs"
+        )
+    return judged["verdict"]
+
+def render_dns(dns, report_data, summary):
+    if dns["status"] == "ok":
+        report_data["dns"] = dns
+        summary["DNS"] = dns["latency"]
+
+        verdict = render_baseline("dns", dns)
+        show(charts().latency_bar("DNS Resolution", dns["latency"], verdict))
+
+        cache = dns.get("cache")
+        if cache:
+            st.info(f"Cache: {cache.get('status')} — {cache.get('reason')}")
         else:
-            st.warning("Traceroute blocked or incomplete (expected in cloud environments)")
+            st.info("Cache: not inferred — the DNS Resolver Profiler compares a repeat query")
+    else:
+        st.error(dns["error"])
+
+    stats = dns_cache.stats()
+    st.caption(
+        f"Local DNS cache: {stats['entries']} entries • "
+        f"{stats['hits']} hits / {stats['misses']} misses"
+    )
 
-    # ---------------- TCP ----------------
-    if enable_tcp:
-        step += 1
-        advance(progress_bar, progress_label, step, total, "Establishing TCP connection")
+    render_sampling(dns, "DNS Resolution")
+
+def render_dns_profile(profile, report_data, summary):
+    report_data["dns_profile"] = profile
+    rows = profile["resolvers"]
+
+    show(charts().resolver_latency_chart(rows))
+
+    st.dataframe([
+        {
+            "Resolver": row["resolver"],
+            "A (ms)": row.get("a_ms"),
+            "AAAA (ms)": row.get("aaaa_ms"),
+            "Repeat (ms)": row.get("warm_ms"),
+            "Cache": row["cache"]["status"] if "cache" in row else row.get("error"),
+            "CNAME hops": len(row.get("cname_chain", [])),
+            "Answer": ", ".join(row.get("a", []) + row.get("aaaa", [])),
+        }
+        for row in rows
+    ], use_container_width=True)
+
+    chain = next((row["cname_chain"] for row in rows if row.get("cname_chain")), None)
+    if chain:
+        st.caption("CNAME chain: " + " → ".join(
+            [chain[0]["name"]] + [f"{hop['target']} ({hop['ms']:.1f} ms)" for hop in chain]
+        ))
+    if profile["fastest"]:
+        st.info(f"Fastest resolver (repeat query): {profile['fastest']}")
+
+def render_ip(ip, report_data, summary):
+    if ip["status"] == "reachable":
+        report_data["ip"] = ip
+        summary["IP"] = ip["latency_ms"]
+
+        verdict = render_baseline("ip", ip)
+        show(charts().latency_bar(
+            "TCP Reachability (Port 443)",
+            ip["latency_ms"],
+            verdict
+        ))
+
+        st.info(
+            f"Method: {ip['method']} • "
+            f"Port: {ip['port']} • "
+            f"Latency: {ip['latency_ms']} ms"
+        )
+    else:
+        st.error(ip.get("error", "Host unreachable"))
+
+    render_sampling(ip, "TCP Reachability")
+
+def render_dual_stack(race, report_data, summary):
+    if "attempts" not in race:
+        st.error(race.get("error", "No addresses to race"))
+        return
+
+    report_data["dual_stack"] = race
+    show(charts().dual_stack_chart(race["attempts"]))
+
+    if race["status"] == "reachable":
+        col_winner, col_total, col_penalty = st.columns(3)
+        col_winner.metric("Winner", f"{race['ip']} ({race['family']})")
+        col_total.metric("Happy Eyeballs Connect", f"{race['happy_eyeballs_ms']:.1f} ms")
+        col_penalty.metric("Fallback Penalty", f"{race['fallback_penalty_ms']:.1f} ms")
+    else:
+        st.error(race["error"])
+
+    v6, v4 = race["families"]["ipv6"], race["families"]["ipv4"]
+    st.info(
+        f"Best IPv6: {f'{v6:.1f} ms' if v6 is not None else '—'} • "
+        f"Best IPv4: {f'{v4:.1f} ms' if v4 is not None else '—'}"
+    )
 
-        st.subheader("🔗 TCP")
-        with st.spinner("Establishing TCP connection..."):
-            tcp = tcp_handshake(domain, 80)
+    for attempt in race["attempts"]:
+        if attempt["status"] != "ok":
+            st.warning(f"{attempt['address']} ({attempt['family']}): {attempt['error']}")
+
+def render_traceroute(trace, report_data, summary):
+    if trace["status"] == "ok":
+        report_data["traceroute"] = trace
+        show(charts().traceroute_chart(trace["hops"]))
+
+        silent = sum(1 for hop in trace["hops"] if hop["latency"] is None)
+        st.caption(
+            f"Method: {trace['method']} • Hops: {len(trace['hops'])} • "
+            f"No reply: {silent}"
+            + ("" if trace.get("reached", True) else " • Destination not reached")
+        )
+    else:
+        st.warning("Traceroute blocked or incomplete (expected in cloud environments)")
+
+def render_tcp(tcp, report_data, summary):
+    if tcp["status"] == "ok":
+        report_data["tcp"] = tcp
+        summary["TCP"] = tcp["connect_time_ms"]
+        verdict = render_baseline("tcp", tcp)
+        show(charts().tcp_handshake_timeline(tcp["connect_time_ms"], verdict))
+    else:
+        st.error(tcp["error"])
+
+    render_sampling(tcp, "TCP Connect")
+
+def render_tls(tls, report_data, summary):
+    if tls["status"] == "ok":
+        report_data["tls"] = tls
+        show(charts().tls_status_card(tls["expired"]))
+    else:
+        st.error(tls["error"])
+
+def render_tls_handshake(handshake, report_data, summary):
+    if handshake["status"] != "ok":
+        st.error(handshake["error"])
+        return
+
+    report_data["tls_handshake"] = handshake
+    show(charts().tls_resumption_chart(
+        handshake["full_handshake_ms"],
+        handshake["resumed_handshake_ms"],
+        handshake["session_reused"]
+    ))
+
+    if handshake["chain_certs"] is None:
+        chain = "Chain: unavailable (needs Python 3.13+)"
+    else:
+        chain = f"Chain: {handshake['chain_certs']} cert(s), {handshake['chain_bytes']:,} bytes"
+    st.info(
+        f"{handshake['version']} • {handshake['cipher']} • "
+        f"ALPN: {handshake['alpn'] or 'none'} • {chain}"
+    )
+    if handshake["session_reused"]:
+        st.success(f"Resumption saved {handshake['saved_ms']:.1f} ms per handshake")
+    else:
+        st.warning("Origin did not resume the session — every connection pays a full handshake")
+
+def render_http(http, report_data, summary):
+    if http["status"] == "ok":
+        report_data["http"] = http
+        summary["HTTP"] = http["timings"]["total"]
+        verdict = render_baseline("http", http)
+        show(charts().http_waterfall_chart(http["timings"], verdict))
+
+        transfer = http.get("transfer")
+        if transfer:
+            details = [
+                http["status_line"],
+                f"Body: {transfer['body_bytes']:,} bytes" + (" (chunked)" if transfer["chunked"] else "")
+            ]
+            if transfer["bytes_per_s"]:
+                details.append(f"Throughput: {transfer['bytes_per_s'] / 1e6:.2f} MB/s")
+            st.info(" • ".join(details))
+    else:
+        st.error("HTTP request failed (simulated or real)")
+
+    render_sampling(http, "HTTP Total")
+
+def render_quic(quic, report_data, summary):
+    report_data["quic"] = quic
+
+    if quic["status"] == "ok":
+        show(charts().quic_vs_tcp_chart(quic["tcp_timings"], quic["timings"]))
+
+        tcp_ms = quic["tcp_time_ms"]
+        samples = quic["samples"]
+        st.info(
+            f"HTTP/{quic['http_version']} {quic['http_code']} • "
+            f"QUIC {quic['total_time_ms']:.1f} ms vs TCP "
+            + ("failed" if tcp_ms is None else f"{tcp_ms:.1f} ms")
+            + f" (median of {len(samples['http3'])} concurrent samples each)"
+        )
+        if quic["http_version"] != "3":
+            st.warning("curl fell back from HTTP/3: the origin did not negotiate QUIC")
+    elif quic["status"] == "unsupported":
+        st.info("QUIC unsupported (curl without HTTP/3)")
+    else:
+        st.warning("QUIC blocked or unavailable")
+
+def render_keepalive(keepalive, report_data, summary):
+    if keepalive["status"] != "ok":
+        st.error(keepalive["error"])
+        return
+
+    report_data["keepalive"] = keepalive
+
+    cold, warm = keepalive["cold_ms"], keepalive["warm_ms"]
+    col_cold, col_warm, col_rps, col_reconnects = st.columns(4)
+    col_cold.metric("Cold (median)", f"{cold['median']:.1f} ms" if cold else "—")
+    col_warm.metric("Warm (median)", f"{warm['median']:.1f} ms" if warm else "—")
+    col_rps.metric("Requests / sec", f"{keepalive['requests_per_sec']:.1f}")
+    col_reconnects.metric("Reconnects", keepalive["reconnects"])
+
+    show(charts().ping_line(
+        [sample["latency_ms"] for sample in keepalive["samples"]],
+        f"Request Latency — {keepalive['mode']}, {keepalive['connections']} connection(s)"
+    ))
+
+# Intermediate results streamed while a layer is still running
+PARTIAL_RENDERERS = {
+    "traceroute": lambda partial, placeholder, key: placeholder.plotly_chart(
+        charts().traceroute_chart(partial["hops"]),
+        use_container_width=True,
+        config={"displayModeBar": False},
+        key=key
+    ),
+}
+
+RENDERERS = {
+    "dns": render_dns,
+    "dns_profile": render_dns_profile,
+    "ip": render_ip,
+    "dual_stack": render_dual_stack,
+    "traceroute": render_traceroute,
+    "tcp": render_tcp,
+    "tls": render_tls,
+    "tls_handshake": render_tls_handshake,
+    "http": render_http,
+    "quic": render_quic,
+    "keepalive": render_keepalive,
+}
 
-        if tcp["status"] == "ok":
-            if slow_tcp:
-                tcp["connect_time_ms"] += delay_ms
-                tcp["simulated"] = "slow_tcp"
+# ===================== Execution =====================
+# Once a domain has been analysed, later reruns (any widget change) redraw
+# it from cached results instead of probing
+if run:
+    st.session_state["analysed"] = domain
+replay = not run and st.session_state.get("analysed") == domain
 
-            report_data["tcp"] = tcp
-            summary["TCP"] = tcp["connect_time_ms"]
-            show(tcp_handshake_timeline(tcp["connect_time_ms"]))
-        else:
-            st.error(tcp["error"])
+if "result_cache" not in st.session_state:
+    st.session_state["result_cache"] = ResultCache(max_entries=256)
 
-    # ---------------- TLS ----------------
-    if enable_tls:
-        step += 1
-        advance(progress_bar, progress_label, step, total, "Inspecting TLS certificate")
+if run or replay:
+    report_data = {}
+    summary = {}
 
-        st.subheader("🔐 TLS")
-        with st.spinner("Inspecting TLS certificate..."):
-            tls = inspect_tls(domain)
+    enabled = [(name, title, text) for name, on, title, text in LAYER_SECTIONS if on]
 
-        if tls["status"] == "ok":
-            report_data["tls"] = tls
-            show(tls_status_card(tls["expired"]))
-        else:
-            st.error(tls["error"])
-
-    # ---------------- HTTP ----------------
-    if enable_http:
-        step += 1
-        advance(progress_bar, progress_label, step, total, "Performing HTTP request")
-
-        st.subheader("📄 HTTP")
-        with st.spinner("Performing HTTP request..."):
-            if fail_http:
-                http = {"status": "failed"}
-            else:
-                http = http_request(domain)
-
-        if http["status"] == "ok":
-            report_data["http"] = http
-            summary["HTTP"] = http["timings"]["total"]
-            show(http_waterfall_chart(http["timings"]))
-        else:
-            st.error("HTTP request failed (simulated or real)")
+    progress_bar, progress_label, total, step = init_progress(len(enabled))
 
-    # ---------------- QUIC ----------------
-    if enable_quic:
-        step += 1
-        advance(progress_bar, progress_label, step, total, "Testing QUIC / HTTP/3")
+    layer_names = [n for n, _, _ in enabled]
+    probes, dependencies = dict(LAYER_PROBES), None
+    if sample_count > 1:
+        probes = sampled_probes(probes, sample_count, sample_interval_ms, sample_concurrency)
+    if shared_trace and set(layer_names) & set(TRACED_LAYERS):
+        probes, dependencies = traced_plan(probes)
+        layer_names.append("trace")
 
-        st.subheader("⚡ QUIC vs TCP")
-        with st.spinner("Attempting QUIC (HTTP/3)..."):
-            quic = quic_request(domain)
+    resolvers = [r.strip() for r in resolver_list.split(",") if r.strip()]
+    probes["dns_profile"] = lambda d, upstream: profile_dns(d, resolvers)
 
-        report_data["quic"] = quic
+    probes["keepalive"] = lambda d, upstream: http_keepalive_benchmark(
+        d,
+        ip=resolved_ip(upstream),
+        requests=keepalive_requests,
+        connections=keepalive_connections,
+        pipeline=keepalive_pipeline
+    )
 
-        if quic["status"] == "ok" and "http" in report_data:
-            show(quic_vs_tcp_chart(
-                report_data["http"]["timings"]["total"],
-                quic["total_time_ms"]
-            ))
-        elif quic["status"] == "unsupported":
-            st.info("QUIC unsupported (curl without HTTP/3)")
-        else:
-            st.warning("QUIC blocked or unavailable")
+    probes["quic"] = lambda d, upstream: quic_request(d, quic_samples, quic_concurrency)
+
+    # Everything that changes a layer's result is part of its cache key
+    sampling = (sample_count, sample_interval_ms, sample_concurrency) if sample_count > 1 else None
+    layer_options = {
+        name: (sampling if name in SAMPLE_METRICS else None, shared_trace and name in TRACED_LAYERS)
+        for name in probes
+    }
+    layer_options["dns_profile"] = tuple(resolvers)
+    layer_options["keepalive"] = (keepalive_requests, keepalive_connections, keepalive_pipeline)
+    layer_options["quic"] = (quic_samples, quic_concurrency)
+    if faults:
+        # Results probed through the proxy are only reused with the same faults
+        faults_key = json.dumps(faults, sort_keys=True)
+        layer_options = {name: (option, faults_key) for name, option in layer_options.items()}
+
+    # Layers that were really probed this run, not served from cache
+    probed = set()
+    probes = cached_probes(
+        probes, layer_options, cache_ttl,
+        (st.session_state["result_cache"], result_cache), probed, replay
+    )
+    if replay:
+        st.caption("Showing the last results for these settings — Run Analysis probes again")
+
+    # Sections keep their usual order and fill in as each layer finishes
+    sections = {}
+    placeholders = {}
+    for name, title, text in enabled:
+        sections[name] = st.container()
+        with sections[name]:
+            st.subheader(title)
+            placeholders[name] = st.empty()
+            placeholders[name].caption(f"⏳ {text}...")
+
+    if enabled:
+        advance(progress_bar, progress_label, step, total, "Running layers concurrently")
+
+    started = time.perf_counter()
+    updates = {}
+    # Every layer's final result, failures included, for the diagnosis
+    layer_results = {}
+
+    # Only started once a layer actually probes (cache hits never connect)
+    proxy = FaultProxy(faults) if faults else None
+
+    try:
+        with routed(proxy):
+            for name, result in run_layers(domain, layer_names, probes, max_workers, dependencies):
+                if name not in sections:
+                    continue
+
+                if result.get("status") == "partial":
+                    if name in PARTIAL_RENDERERS:
+                        updates[name] = updates.get(name, 0) + 1
+                        PARTIAL_RENDERERS[name](result, placeholders[name], f"{name}_partial_{updates[name]}")
+                    continue
+
+                step += 1
+                advance(progress_bar, progress_label, step, total, f"Finished {name.upper()}")
+
+                if result.get("status") == "not_run":
+                    placeholders[name].caption("No cached result with these settings — press Run Analysis")
+                    continue
+
+                # Simulated failures are a transform on the (possibly cached) result
+                result = apply_simulation(name, result, slow_dns, slow_tcp, fail_http, delay_ms)
+
+                placeholders[name].empty()
+                with sections[name]:
+                    RENDERERS[name](result, report_data, summary)
+                layer_results[name] = result
+        wall_ms = (time.perf_counter() - started) * 1000
+    finally:
+        # Stop the relays even if a layer or renderer raised
+        if proxy:
+            proxy.close()
+
+    # Judge against the baselines as they were before this run, then learn
+    # from the layers really probed; simulated failures would skew them
+    simulated = slow_dns or slow_tcp or fail_http or bool(faults)
+    latencies = run_metrics(layer_results)
+    verdicts = baselines.judge_all(domain, latencies)
+    if probed and not simulated:
+        baselines.observe(domain, {name: ms for name, ms in latencies.items() if name in probed})
+        baselines.save()
+
+    # Imported once the layers have run, so they never hold up the probes
+    from layers.diagnosis import baseline_context, diagnose, history_context
+    from layers.llm_explainer import BackgroundExplanation
+    from reports.report_builder import build_report
+    from reports.report_store import ReportStore
+
+    # This domain's past runs, for rules comparing against its history
+    history = history_context(ReportStore(), [domain])[domain]
+    history.update(baseline_context(verdicts))
+
+    # Runs on a worker thread while the rest of the page renders
+    explanation = BackgroundExplanation(layer_results, history)
 
     # ---------------- COMPLETE ----------------
     progress_bar.progress(100)
     progress_label.markdown("✅ **Analysis complete**")
+    if proxy:
+        st.caption("Fault proxy: " + ", ".join(
+            f"{count} {stat.replace('_', ' ')}" for stat, count in proxy.stats.items()
+        ))
 
     # ---------------- SUMMARY ----------------
     if summary:
         st.divider()
         st.subheader("🧠 Request Summary")
-        show(request_time_breakdown(summary))
-        st.metric("Total Time", f"{sum(summary.values()):.0f} ms")
+        show(charts().request_time_breakdown(summary))
+        col_total, col_wall = st.columns(2)
+        col_total.metric("Total Time", f"{sum(summary.values()):.0f} ms")
+        col_wall.metric("Wall-clock Time", f"{wall_ms:.0f} ms")
+
+    # ---------------- DIAGNOSIS ----------------
+    st.divider()
+    st.subheader("🩺 Diagnosis")
+    findings = diagnose(layer_results, history)
+    if not findings:
+        st.success("No major issues detected.")
+    for finding in findings:
+        {"critical": st.error, "warning": st.warning}.get(finding["severity"], st.info)(finding["message"])
 
     # ---------------- LLM ----------------
     st.divider()
     st.subheader("🤖 AI Explanation")
-    with st.spinner("Analyzing system behavior..."):
-        explanation = explain_with_llm(report_data)
-    st.markdown(explanation["text"])
+    llm_section = st.container()
 
     # ---------------- EXPORT ----------------
     st.divider()
     report = build_report(domain, report_data)
+    # Keep real runs for historical queries, once each; simulated failures would skew them
+    if probed and not simulated:
+        ReportStore().append(build_report(domain, {
+            name: result for name, result in report_data.items() if name in probed
+        }))
     st.download_button(
         "Download Report",
         json.dumps(report, indent=2),
@@ -253,4 +721,14 @@ if run:
         "application/json"
     )
 
+    with llm_section:
+        st.write_stream(explanation.stream())
+        if explanation.result["status"] == "cached":
+            st.caption("Cached explanation for matching diagnostics")
+        elif explanation.result["status"] == "fallback":
+            st.caption("Rule-based explanation (model server unavailable)")
+
 st.markdown("---\n🧠 **Professional observability UX achieved.**")
+
+# Load Plotly while the page sits idle, so the first analysis doesn't wait for it
+charts().warm_up()
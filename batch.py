@@ -0,0 +1,468 @@
+"""
+Headless batch runner for fleet sweeps.
+
+Reads domains from a file (or stdin) and writes one build_report record
+per domain as JSONL while it goes. The DNS/TCP/TLS/HTTP layers run on an
+asyncio event loop with a global and a per-host concurrency limit. Every
+report's latency sketches are merged as it is written, so the sweep ends
+with fleet-wide percentiles in constant memory.
+
+    python batch.py domains.txt -o results.jsonl --concurrency 200 --per-host 2
+
+With --workers N the domains are sharded across N processes, each with
+its own event loop, so TLS and parsing work is spread over N cores.
+
+With --faults PROFILE|JSON every probe goes through a fault proxy
+(layers/fault_proxy.py), e.g. to see how a fleet degrades on 3G.
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+from multiprocessing.connection import wait
+
+from layers.diagnosis import DEFAULT_RULESET, flatten_results, history_context
+from layers.dns_cache import default_cache
+from layers.dns_layer import resolve_dns_async
+from layers.fault_proxy import FAULT_PROFILES, FaultProxy, parse_faults, routed
+from layers.ip_layer import dual_stack_race_async, tcp_latency_async
+from layers.tcp_layer import tcp_handshake_async
+from layers.tls_layer import inspect_tls_async
+from layers.http_layer import http_request_async
+from layers.scheduler import resolved_ip
+from layers.sampling import SAMPLE_METRICS, sample_layer_async
+from reports.report_builder import build_report
+from reports.report_store import ReportStore
+from reports.sketch import merge_sketches
+
+
+BATCH_LAYERS = ("dns", "ip", "tcp", "tls", "http")
+
+# Reports diagnosed and written together
+WRITE_BATCH = 256
+
+ASYNC_PROBES = {
+    "dns": lambda domain, ip, timeout: resolve_dns_async(domain),
+    "ip": lambda domain, ip, timeout: tcp_latency_async(ip or domain, timeout=timeout),
+    "dual_stack": lambda domain, ip, timeout: dual_stack_race_async(domain, timeout=timeout),
+    "tcp": lambda domain, ip, timeout: tcp_handshake_async(ip or domain, 80, timeout=timeout),
+    "tls": lambda domain, ip, timeout: inspect_tls_async(domain, timeout=timeout, ip=ip),
+    "http": lambda domain, ip, timeout: http_request_async(domain, ip=ip, timeout=timeout),
+}
+
+
+class ProbeLimiter:
+    """
+    Caps probes in flight, both overall and against any single host.
+    """
+
+    def __init__(self, global_limit: int, per_host_limit: int):
+        self._global = asyncio.Semaphore(global_limit)
+        self._per_host_limit = per_host_limit
+        self._hosts = {}
+        self._users = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, host: str):
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self._per_host_limit)
+            self._users[host] = 0
+        self._users[host] += 1
+
+        try:
+            # Wait for the host first so a busy host never pins a global slot
+            async with self._hosts[host]:
+                async with self._global:
+                    yield
+        finally:
+            self._users[host] -= 1
+            if not self._users[host]:
+                del self._hosts[host]
+                del self._users[host]
+
+
+async def _limited_probe(name, domain, ip, limiter, timeout):
+    async with limiter.slot(domain):
+        return await asyncio.wait_for(
+            ASYNC_PROBES[name](domain, ip, timeout), timeout * 2
+        )
+
+
+async def _run_probe(name, domain, ip, limiter, timeout, sampling=None):
+    try:
+        if sampling and name in SAMPLE_METRICS:
+            return await sample_layer_async(
+                lambda: _limited_probe(name, domain, ip, limiter, timeout),
+                name, **sampling
+            )
+        return await _limited_probe(name, domain, ip, limiter, timeout)
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e) or type(e).__name__
+        }
+
+
+async def analyze_domain(domain: str, layers, limiter: ProbeLimiter, timeout: float,
+                         sampling=None):
+    """
+    Run the enabled layers for one domain and build its report.
+    DNS goes first so every other layer connects to the same address.
+    `sampling` (count, interval_ms, concurrency) repeats latency layers.
+    """
+    results = {}
+
+    if "dns" in layers:
+        results["dns"] = await _run_probe("dns", domain, None, limiter, timeout, sampling)
+
+    ip = resolved_ip(results)
+    rest = [name for name in layers if name != "dns"]
+
+    outcomes = await asyncio.gather(*(
+        _run_probe(name, domain, ip, limiter, timeout, sampling) for name in rest
+    ))
+    results.update(zip(rest, outcomes))
+
+    return build_report(domain, results)
+
+
+def read_domains(stream):
+    for line in stream:
+        domain = line.split("#", 1)[0].strip()
+        if domain:
+            yield domain
+
+
+async def run_batch(domains, out, layers=BATCH_LAYERS, concurrency: int = 100,
+                    per_host: int = 2, timeout: float = 5.0, sampling=None, store=None,
+                    sketches: dict = None):
+    """
+    Sweep `domains`, writing one JSON report per line to `out` and, when
+    a ReportStore is given, into its columnar segments as well. Each
+    report's sketches are merged into `sketches` ({field: DDSketch}) when
+    given.
+
+    Reports are written in blocks of WRITE_BATCH, each diagnosed by the
+    rule set in one pass (against the store's history when there is one).
+    Returns the number of domains processed.
+    """
+    limiter = ProbeLimiter(concurrency, per_host)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    done = 0
+    pending = []
+
+    def flush():
+        write_reports(pending, out, store, sketches)
+        pending.clear()
+
+    async def worker():
+        nonlocal done
+        while True:
+            domain = await queue.get()
+            if domain is None:
+                return
+
+            pending.append(await analyze_domain(domain, layers, limiter, timeout, sampling))
+            done += 1
+            if len(pending) >= WRITE_BATCH:
+                flush()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+
+    for domain in domains:
+        await queue.put(domain)
+    for _ in workers:
+        await queue.put(None)
+
+    await asyncio.gather(*workers)
+
+    if pending:
+        flush()
+    return done
+
+
+def write_reports(reports, out, store=None, sketches=None):
+    """
+    Diagnose a block of reports in one rule set pass (against the store's
+    history when there is one), write them as JSONL and add them to the
+    store and the merged sketches.
+    """
+    context = history_context(store, {r["meta"]["domain"] for r in reports}) if store else {}
+    rows = [
+        dict(flatten_results(r["results"]), **context.get(r["meta"]["domain"], {}))
+        for r in reports
+    ]
+
+    for report, findings in zip(reports, DEFAULT_RULESET.evaluate_many(rows)):
+        report["diagnosis"] = findings
+        out.write(json.dumps(report) + "\n")
+        if sketches is not None:
+            merge_sketches(sketches, report["sketches"])
+    out.flush()
+
+    if store is not None:
+        store.append_many(reports)
+
+
+def shard_of(domain: str, shards: int):
+    """
+    Stable shard for a domain, so its per-host limit and DNS cache
+    entries stay in one worker.
+    """
+    return zlib.crc32(domain.lower().encode()) % shards
+
+
+def run_sharded(domains, out, layers=BATCH_LAYERS, workers: int = None, concurrency: int = 100,
+                per_host: int = 2, timeout: float = 5.0, sampling=None, store=None,
+                sketches: dict = None, cache_stats: dict = None, faults: dict = None,
+                fault_stats: dict = None):
+    """
+    run_batch across `workers` processes (default: one per core).
+
+    Domains are hash-sharded to workers, and each worker has at most
+    concurrency / workers domains in flight: the parent only sends a
+    worker more when it returns results, and stops reading input while
+    the buffered backlog is full. Reports stream back over one pipe per
+    worker and are diagnosed and written here, in the order they finish.
+    Worker DNS cache counters are summed into `cache_stats` when given.
+    With `faults` each worker routes its probes through its own
+    FaultProxy, whose counters are summed into `fault_stats`.
+    Returns the number of domains processed.
+    """
+    workers = workers or os.cpu_count() or 1
+    window = max(1, concurrency // workers)
+
+    tasks, results, processes = [], [], []
+    for _ in range(workers):
+        task_recv, task_send = multiprocessing.Pipe(duplex=False)
+        result_recv, result_send = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_shard_worker,
+            args=(task_recv, result_send, layers, window, per_host, timeout, sampling, faults),
+            daemon=True
+        )
+        process.start()
+        task_recv.close()
+        result_send.close()
+        tasks.append(task_send)
+        results.append(result_recv)
+        processes.append(process)
+
+    backlog = [collections.deque() for _ in range(workers)]
+    buffered = 0
+    in_flight = [0] * workers
+    finished = [False] * workers
+    live = dict(zip(results, range(workers)))
+    source = iter(domains)
+    exhausted = False
+    pending = []
+    done = 0
+
+    try:
+        while live:
+            while not exhausted and buffered < workers * window:
+                domain = next(source, None)
+                if domain is None:
+                    exhausted = True
+                else:
+                    backlog[shard_of(domain, workers)].append(domain)
+                    buffered += 1
+
+            for i in range(workers):
+                count = min(window - in_flight[i], len(backlog[i]))
+                if count:
+                    tasks[i].send([backlog[i].popleft() for _ in range(count)])
+                    in_flight[i] += count
+                    buffered -= count
+                if exhausted and not backlog[i] and not finished[i]:
+                    tasks[i].send(None)
+                    finished[i] = True
+
+            for conn in wait(list(live)):
+                i = live[conn]
+                try:
+                    kind, payload = conn.recv()
+                except EOFError:
+                    raise RuntimeError(f"batch worker {i} exited unexpectedly") from None
+
+                if kind == "report":
+                    in_flight[i] -= 1
+                    pending.append(payload)
+                    done += 1
+                else:
+                    del live[conn]
+                    worker_cache, worker_faults = payload
+                    if cache_stats is not None:
+                        for key in ("entries", "hits", "misses"):
+                            cache_stats[key] = cache_stats.get(key, 0) + worker_cache[key]
+                    if fault_stats is not None and worker_faults:
+                        for key, count in worker_faults.items():
+                            fault_stats[key] = fault_stats.get(key, 0) + count
+
+            if len(pending) >= WRITE_BATCH or (pending and not live):
+                write_reports(pending, out, store, sketches)
+                pending.clear()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    return done
+
+
+def _shard_worker(tasks, results, layers, window, per_host, timeout, sampling, faults=None):
+    """
+    Worker process: probe every domain batch from `tasks` until None,
+    sending each report to `results` as soon as it is built.
+    """
+    async def work():
+        limiter = ProbeLimiter(window, per_host)
+        loop = asyncio.get_running_loop()
+        running = set()
+
+        def report_done(task):
+            running.discard(task)
+            results.send(("report", task.result()))
+
+        while True:
+            batch = await loop.run_in_executor(None, tasks.recv)
+            if batch is None:
+                break
+            for domain in batch:
+                task = asyncio.create_task(analyze_domain(domain, layers, limiter, timeout, sampling))
+                running.add(task)
+                task.add_done_callback(report_done)
+
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    proxy = FaultProxy(faults) if faults else None
+    with routed(proxy):
+        asyncio.run(work())
+    if proxy:
+        proxy.close()
+    results.send(("done", (default_cache.stats(), proxy and proxy.stats)))
+    results.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NetScope headless batch sweep")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="file with one domain per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSONL output file, or - for stdout")
+    parser.add_argument("--layers", default=",".join(BATCH_LAYERS),
+                        help="comma separated subset of: " + ", ".join(ASYNC_PROBES))
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="global limit on probes in flight")
+    parser.add_argument("--per-host", type=int, default=2,
+                        help="limit on probes in flight per host")
+    parser.add_argument("--timeout", type=float, default=5.0,
+                        help="per-probe timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes to shard domains across (0: one per core)")
+    parser.add_argument("--store", default=None,
+                        help="also append reports to this columnar report store directory")
+    parser.add_argument("--sketches", default=None,
+                        help="write the sweep's merged latency sketches to this JSON file")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="probes per latency layer (DNS, IP, TCP, HTTP)")
+    parser.add_argument("--sample-interval", type=float, default=100,
+                        help="spacing between samples in milliseconds")
+    parser.add_argument("--sample-concurrency", type=int, default=4,
+                        help="samples in flight per layer")
+    parser.add_argument("--faults", default=None,
+                        help="route probes through a fault proxy: a profile ("
+                             + ", ".join(FAULT_PROFILES) + ") or a JSON object of faults")
+    args = parser.parse_args(argv)
+
+    layers = [name for name in args.layers.split(",") if name]
+    unknown = set(layers) - set(ASYNC_PROBES)
+    if unknown:
+        parser.error(f"unknown layers: {', '.join(sorted(unknown))}")
+
+    sampling = None
+    if args.samples > 1:
+        sampling = {
+            "count": args.samples,
+            "interval_ms": args.sample_interval,
+            "concurrency": args.sample_concurrency
+        }
+
+    faults = None
+    if args.faults:
+        try:
+            faults = parse_faults(args.faults)
+            FaultProxy(faults)
+        except (ValueError, KeyError) as e:
+            parser.error(f"invalid --faults: {e}")
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    start = time.perf_counter()
+    sketches = {}
+    cache = {}
+    fault_stats = {}
+    store = ReportStore(args.store) if args.store else None
+    try:
+        if args.workers == 1:
+            proxy = FaultProxy(faults) if faults else None
+            with routed(proxy):
+                count = asyncio.run(run_batch(
+                    read_domains(source), out, layers,
+                    args.concurrency, args.per_host, args.timeout, sampling,
+                    store, sketches
+                ))
+            if proxy:
+                proxy.close()
+                fault_stats = proxy.stats
+            cache = default_cache.stats()
+        else:
+            count = run_sharded(
+                read_domains(source), out, layers, args.workers or None,
+                args.concurrency, args.per_host, args.timeout, sampling,
+                store, sketches, cache, faults, fault_stats
+            )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"NetScope batch: {count} domains in {elapsed:.1f}s "
+        f"(DNS cache: {cache['hits']} hits, {cache['misses']} misses)",
+        file=sys.stderr
+    )
+    if faults:
+        print("  fault proxy: " + ", ".join(
+            f"{count} {stat.replace('_', ' ')}" for stat, count in fault_stats.items()
+        ), file=sys.stderr)
+    print_percentiles(sketches)
+
+    if args.sketches:
+        # Other sweeps' files merge with DDSketch.from_dict(...).merge(...)
+        with open(args.sketches, "w") as f:
+            json.dump({field: sketch.to_dict() for field, sketch in sketches.items()}, f)
+
+
+def print_percentiles(sketches: dict):
+    for field, sketch in sorted(sketches.items()):
+        p50, p95, p99 = (sketch.quantile(q) for q in (0.5, 0.95, 0.99))
+        print(
+            f"  {field:<28} n={sketch.count:<7} p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms",
+            file=sys.stderr
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Central collector for probe agents.
+
+Agents (monitor.py --collector HOST:PORT --region NAME) keep one
+connection open and push batches of runs; the collector merges them by
+region into a store the app reads for its per-region comparison.
+
+    python collector.py --port 7070 --store netscope_regions
+
+Each batch is stored before it is acknowledged, and an agent sends its
+next batch only after the ack, so a slow store slows the agents' streams
+instead of piling up here.
+"""
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import time
+
+from reports.regions import DEFAULT_COLLECTOR_PORT, DEFAULT_REGION_PATH, MAX_LINE, RegionStore
+
+
+COMPACT_EVERY_S = 3600
+
+
+class Collector:
+    """
+    Stores the batches each agent connection sends under its region.
+    """
+
+    def __init__(self, store: RegionStore):
+        self.store = store
+        # Highest stored seq per agent, to skip batches resent after a reconnect
+        self.last_seq = {}
+        # Open agent connections and the tasks serving them
+        self.connections = {}
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        self.connections[writer] = asyncio.current_task()
+        try:
+            hello = json.loads(await reader.readline() or "null")
+            if not hello or "hello" not in hello:
+                return
+            agent, region = hello["hello"]["agent"], hello["hello"]["region"]
+            print(f"Agent {agent} ({region}) connected from {peer[0]}", file=sys.stderr)
+
+            while line := await reader.readline():
+                batch = json.loads(line)
+                seq = batch["seq"]
+
+                if seq > self.last_seq.get(agent, 0):
+                    # The store locks each series, so batches and compaction
+                    # can be written from threads side by side
+                    written, late = await asyncio.to_thread(self.store.append, region, batch["runs"])
+                    self.last_seq[agent] = seq
+
+                    if late or batch["dropped"]:
+                        print(f"{region}/{agent}: {written} runs, {late} late, "
+                              f"{batch['dropped']} dropped by the agent", file=sys.stderr)
+
+                writer.write(json.dumps({"ack": seq}).encode() + b"\n")
+                await writer.drain()
+
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Agent connection from {peer[0]} failed: {e!r}", file=sys.stderr)
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    async def close(self):
+        # Agents see the connection drop and resend their unacked batch later
+        tasks = list(self.connections.values())
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def compact_forever(self, stop):
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), COMPACT_EVERY_S)
+            except asyncio.TimeoutError:
+                pass
+            if stop.is_set():
+                return
+
+            rolled = await asyncio.to_thread(self.store.compact, time.time())
+            print(f"Compacted {rolled} points", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NetScope collector for probe agents")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (0.0.0.0 for remote agents)")
+    parser.add_argument("--port", type=int, default=DEFAULT_COLLECTOR_PORT,
+                        help="port to listen on")
+    parser.add_argument("--store", default=DEFAULT_REGION_PATH,
+                        help="per-region store directory the app reads")
+    args = parser.parse_args(argv)
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        collector = Collector(RegionStore(args.store))
+        server = await asyncio.start_server(collector.handle, args.host, args.port, limit=MAX_LINE)
+        print(f"NetScope collector on {args.host}:{args.port} -> {args.store}", file=sys.stderr)
+
+        async with server:
+            compactor = asyncio.create_task(collector.compact_forever(stop))
+            await stop.wait()
+            compactor.cancel()
+            await collector.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Import-time benchmark for NetScope's entry points.
+
+Each entry point's startup imports run in fresh interpreters; the median
+time and the heavy modules they loaded are reported. The headless entry
+points must not load Streamlit or Plotly, and the app's startup imports
+must leave the modules its views and runs load on first use; the run
+fails if either does. The app is also timed against bare Streamlit, and
+--app-budget fails the run when the app's own imports cost more.
+
+    python import_bench.py --runs 7
+    python import_bench.py app --app-budget 60
+    python import_bench.py --profile app   # slowest imports of one entry point
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+HEADLESS = ("batch", "monitor", "collector")
+HEAVY_MODULES = ("streamlit", "plotly", "numpy", "requests", "dns")
+# Only the app may pay for these
+APP_ONLY = ("streamlit", "plotly")
+# The app imports these on first use, never before the page draws
+APP_LAZY = ("numpy", "requests", "dns")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def app_imports():
+    """
+    app.py's top-level import statements, without running the page.
+    """
+    with open(os.path.join(ROOT, "app.py")) as f:
+        tree = ast.parse(f.read())
+    return "\n".join(
+        ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def entry_points():
+    return {
+        "batch": "import batch",
+        "monitor": "import monitor",
+        "collector": "import collector",
+        "launcher": "import launcher",
+        "charts": "import visuals.charts",
+        "streamlit": "import streamlit",
+        "app": app_imports(),
+    }
+
+
+def measure(imports: str, runs: int):
+    """
+    Returns:
+        {median_ms, min_ms, heavy: [top-level heavy modules loaded]}
+    """
+    times = []
+    modules = []
+
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, "-c", PROBE.format(imports=imports)],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if process.returncode != 0:
+            raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+        sample = json.loads(process.stdout.splitlines()[-1])
+        times.append(sample["ms"])
+        modules = sample["modules"]
+
+    return {
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "heavy": [name for name in HEAVY_MODULES if name in modules]
+    }
+
+
+def profile(imports: str, top: int = 15):
+    """
+    The `top` imports with the largest cumulative time (python -X importtime).
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", imports],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+
+    rows = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        rows.append((int(cumulative), name.strip()))
+
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    entries = entry_points()
+
+    parser = argparse.ArgumentParser(description="NetScope import-time benchmark")
+    parser.add_argument("entries", nargs="*", default=list(entries),
+                        help="entry points to measure: " + ", ".join(entries))
+    parser.add_argument("--runs", type=int, default=5,
+                        help="fresh interpreters per entry point")
+    parser.add_argument("--profile", choices=list(entries), default=None,
+                        help="list the slowest imports of one entry point instead")
+    parser.add_argument("--app-budget", type=float, default=None, metavar="MS",
+                        help="fail if the app's imports take longer than bare Streamlit by more than MS")
+    parser.add_argument("--json", action="store_true",
+                        help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        for cumulative, name in profile(entries[args.profile]):
+            print(f"{cumulative / 1000:9.1f} ms  {name}")
+        return 0
+
+    names = list(args.entries)
+    if "app" in names and "streamlit" not in names:
+        # The baseline the app's own startup cost is measured against
+        names.append("streamlit")
+    results = {name: measure(entries[name], args.runs) for name in names}
+
+    failures = []
+    for name, result in results.items():
+        banned = APP_ONLY if name in HEADLESS else APP_LAZY if name == "app" else ()
+        leaked = [module for module in result["heavy"] if module in banned]
+        if leaked:
+            failures.append(f"{name} imports {', '.join(leaked)} at startup; it must not")
+
+    overhead = None
+    if "app" in results:
+        overhead = results["app"]["median_ms"] - results["streamlit"]["median_ms"]
+        if args.app_budget is not None and overhead > args.app_budget:
+            failures.append(f"app imports take {overhead:.1f} ms beyond Streamlit; "
+                            f"budget is {args.app_budget:g} ms")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'entry':<10} {'median ms':>10} {'min ms':>8}  heavy modules")
+        for name, result in results.items():
+            print(f"{name:<10} {result['median_ms']:>10.1f} {result['min_ms']:>8.1f}  "
+                  f"{', '.join(result['heavy']) or '-'}")
+        if overhead is not None:
+            print(f"app imports beyond Streamlit: {overhead:.1f} ms")
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
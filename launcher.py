@@ -1,8 +1,29 @@
 import subprocess
 import sys
 import os
+import urllib.request
+
+PORT = 8501
+HEALTH_URL = f"http://localhost:{PORT}/_stcore/health"
+
+
+def server_running():
+    """
+    Whether a NetScope server from an earlier launch is still up. Its
+    imports are already loaded, so reusing it skips the cold start.
+    """
+    try:
+        with urllib.request.urlopen(HEALTH_URL, timeout=1) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
 
 def main():
+    if server_running():
+        print(f"NetScope is already running at http://localhost:{PORT}")
+        return
+
     if hasattr(sys, "_MEIPASS"):
         base_path = sys._MEIPASS
     else:
@@ -16,6 +37,7 @@ def main():
         "streamlit",
         "run",
         app_path,
+        f"--server.port={PORT}",
         "--server.headless=true",
         "--server.fileWatcherType=none",
         "--browser.serverAddress=localhost",
@@ -0,0 +1,349 @@
+import operator
+import re
+import time
+
+import numpy as np
+
+
+class Ref:
+    """
+    Threshold read from another input of the same report, scaled by
+    `factor`, e.g. Ref("http.timings.total", 0.6).
+    """
+
+    def __init__(self, column: str, factor: float = 1.0):
+        self.column = column
+        self.factor = factor
+
+
+# Rule inputs are flattened report fields ("tcp.connect_time_ms"), sampled
+# percentiles ("ip.sampling.stats.p95"), history baselines
+# ("history.<field>.p<q>", supplied by history_context) and latency
+# verdicts ("baseline.<layer>", supplied by baseline_context). A condition
+# on a missing input is false, so a rule never fires on data it doesn't
+# have; the fixed "slow" thresholds only stay quiet for a latency its
+# baseline judged normal.
+DEFAULT_RULES = [
+    {
+        "id": "dns_failed",
+        "severity": "critical",
+        "when": [("dns.status", "==", "error")],
+        "message": "DNS resolution failed: {dns.error}"
+    },
+    {
+        "id": "dns_cache_miss",
+        "severity": "info",
+        "when": [("dns.cache.status", "==", "cache_miss")],
+        "message": "DNS was slow due to a cache miss (recursive lookup)."
+    },
+    {
+        "id": "dns_slow",
+        "severity": "warning",
+        "when": [("dns.latency", ">", 100), ("baseline.dns", "!=", "normal")],
+        "message": "DNS resolution took {dns.latency:.0f} ms."
+    },
+    {
+        "id": "dns_anomaly",
+        "severity": "warning",
+        "when": [("baseline.dns", "==", "anomalous")],
+        "message": "DNS resolution ({dns.latency:.0f} ms) is anomalous for this domain "
+                   "(usually {baseline.dns.p50:.0f} ms, p95 {baseline.dns.p95:.0f} ms)."
+    },
+    {
+        "id": "ip_unreachable",
+        "severity": "critical",
+        "when": [("ip.status", "==", "unreachable")],
+        "message": "Host did not accept a TCP connection: {ip.error}"
+    },
+    {
+        "id": "ip_anomaly",
+        "severity": "warning",
+        "when": [("baseline.ip", "==", "anomalous")],
+        "message": "Reachability latency ({ip.latency_ms:.0f} ms) is anomalous for this domain "
+                   "(usually {baseline.ip.p50:.0f} ms, p95 {baseline.ip.p95:.0f} ms)."
+    },
+    {
+        "id": "packet_loss",
+        "severity": "warning",
+        "when": [("ip.sampling.stats.loss_rate", ">", 0.01)],
+        "message": "{ip.sampling.stats.loss_rate:.0%} of reachability probes were lost."
+    },
+    {
+        "id": "jitter",
+        "severity": "warning",
+        "when": [("ip.sampling.stats.jitter", ">", 20)],
+        "message": "Connect latency jitters by {ip.sampling.stats.jitter:.0f} ms between probes."
+    },
+    {
+        "id": "dual_stack_fallback",
+        "severity": "warning",
+        "when": [("dual_stack.fallback_penalty_ms", ">", 100)],
+        "message": "A broken or slow address family costs dual-stack clients "
+                   "{dual_stack.fallback_penalty_ms:.0f} ms of fallback."
+    },
+    {
+        "id": "tcp_failed",
+        "severity": "critical",
+        "when": [("tcp.status", "==", "error")],
+        "message": "TCP connection failed: {tcp.error}"
+    },
+    {
+        "id": "tcp_slow",
+        "severity": "warning",
+        "when": [("tcp.connect_time_ms", ">", 150), ("baseline.tcp", "!=", "normal")],
+        "message": "TCP handshake latency ({tcp.connect_time_ms:.0f} ms) suggests network delay."
+    },
+    {
+        "id": "tcp_anomaly",
+        "severity": "warning",
+        "when": [("baseline.tcp", "==", "anomalous")],
+        "message": "TCP connect ({tcp.connect_time_ms:.0f} ms) is anomalous for this domain "
+                   "(usually {baseline.tcp.p50:.0f} ms, p95 {baseline.tcp.p95:.0f} ms)."
+    },
+    {
+        "id": "tcp_regression",
+        "severity": "warning",
+        "when": [("tcp.connect_time_ms", ">", Ref("history.tcp.connect_time_ms.p95", 1.5))],
+        "message": "TCP connect ({tcp.connect_time_ms:.0f} ms) is well above its usual p95 "
+                   "({history.tcp.connect_time_ms.p95:.0f} ms)."
+    },
+    {
+        "id": "tls_failed",
+        "severity": "critical",
+        "when": [("tls.status", "==", "error")],
+        "message": "TLS handshake failed: {tls.error}"
+    },
+    {
+        "id": "tls_expired",
+        "severity": "critical",
+        "when": [("tls.expired", "==", True)],
+        "message": "The TLS certificate expired on {tls.not_after}."
+    },
+    {
+        "id": "http_failed",
+        "severity": "critical",
+        "when": [("http.status", "in", ("error", "failed"))],
+        "message": "HTTP request failed."
+    },
+    {
+        "id": "http_slow",
+        "severity": "warning",
+        "when": [("http.timings.total", ">", 300), ("baseline.http", "!=", "normal")],
+        "message": "HTTP dominated total latency (backend slowness)."
+    },
+    {
+        "id": "http_anomaly",
+        "severity": "warning",
+        "when": [("baseline.http", "==", "anomalous")],
+        "message": "HTTP request ({http.timings.total:.0f} ms) is anomalous for this domain "
+                   "(usually {baseline.http.p50:.0f} ms, p95 {baseline.http.p95:.0f} ms)."
+    },
+    {
+        "id": "http_server_time",
+        "severity": "info",
+        "when": [
+            ("http.timings.total", ">", 100),
+            ("http.timings.ttfb", ">", Ref("http.timings.total", 0.6))
+        ],
+        "message": "Time to first byte ({http.timings.ttfb:.0f} ms) is most of the request: "
+                   "the server is slow to respond, not the network."
+    },
+    {
+        "id": "http_regression",
+        "severity": "warning",
+        "when": [("http.timings.total", ">", Ref("history.http.timings.total.p95", 1.5))],
+        "message": "HTTP request ({http.timings.total:.0f} ms) is well above its usual p95 "
+                   "({history.http.timings.total.p95:.0f} ms)."
+    },
+]
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": lambda values, options: np.isin(values, list(options)),
+}
+
+SEVERITY_ORDER = {"critical": 0, "warning": 1, "info": 2}
+
+_FIELD = re.compile(r"\{([\w.]+)(:[^}]*)?\}")
+
+
+def flatten_results(results: dict):
+    """
+    Every scalar field of every layer as "layer.field" (nested dicts joined
+    with dots). Lists such as spans and samples are left out.
+    """
+    row = {}
+
+    def walk(prefix, value):
+        for key, item in value.items():
+            if isinstance(item, dict):
+                walk(f"{prefix}.{key}", item)
+            elif isinstance(item, (str, int, float, bool)):
+                row[f"{prefix}.{key}"] = item
+
+    for layer, result in results.items():
+        if isinstance(result, dict):
+            walk(layer, result)
+    return row
+
+
+class RuleSet:
+    """
+    Rules compiled for evaluation over many reports at once.
+
+    Each input a rule reads becomes one column (float, or object for
+    text), every condition one vectorised comparison over that column,
+    and a rule fires where all its conditions hold.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = list(rules)
+        self.columns = set()
+        self._conditions = []
+
+        for rule in self.rules:
+            conditions = []
+            for column, op, threshold in rule["when"]:
+                options = threshold if op == "in" else (threshold,)
+                kind = "text" if any(isinstance(t, str) for t in options) else "number"
+                conditions.append(((kind, column), OPERATORS[op], threshold))
+
+                self.columns.add((kind, column))
+                if isinstance(threshold, Ref):
+                    self.columns.add(("number", threshold.column))
+            self._conditions.append(conditions)
+
+        self.inputs = {column for _, column in self.columns}
+
+    def evaluate_many(self, rows):
+        """
+        Findings for each of `rows` (flatten_results output, optionally
+        merged with history_context), as one list per row.
+        """
+        rows = list(rows)
+        columns = {
+            (kind, column): (
+                np.array([row.get(column) for row in rows], dtype=object) if kind == "text"
+                else np.array([_number(row.get(column)) for row in rows], dtype=np.float64)
+            )
+            for kind, column in self.columns
+        }
+
+        findings = [[] for _ in rows]
+
+        for rule, conditions in zip(self.rules, self._conditions):
+            fired = np.ones(len(rows), dtype=bool)
+            for key, compare, threshold in conditions:
+                fired &= _holds(columns, key, compare, threshold)
+
+            for i in np.flatnonzero(fired):
+                findings[i].append({
+                    "id": rule["id"],
+                    "severity": rule["severity"],
+                    "message": _format(rule["message"], rows[i])
+                })
+
+        for row_findings in findings:
+            row_findings.sort(key=lambda f: SEVERITY_ORDER.get(f["severity"], 3))
+        return findings
+
+    def evaluate(self, row: dict):
+        return self.evaluate_many([row])[0]
+
+
+def _holds(columns, key, compare, threshold):
+    values = columns[key]
+    if key[0] == "text":
+        return np.asarray(compare(values, threshold), dtype=bool)
+
+    if isinstance(threshold, Ref):
+        threshold = columns[("number", threshold.column)] * threshold.factor
+
+    # A missing input (NaN) never satisfies a condition
+    with np.errstate(invalid="ignore"):
+        return np.asarray(compare(values, threshold), dtype=bool) & ~np.isnan(values)
+
+
+# Compiled once per process
+DEFAULT_RULESET = RuleSet()
+
+
+def diagnose(results: dict, context: dict = None, ruleset: RuleSet = DEFAULT_RULESET):
+    """
+    Findings for one run's layer results, most severe first. `context`
+    adds inputs that aren't in the results, such as history baselines.
+    """
+    row = flatten_results(results)
+    row.update(context or {})
+    return ruleset.evaluate(row)
+
+
+def rule_explanation(results: dict, context: dict = None):
+    """
+    Findings as a markdown bullet list, the explanation used without an LLM.
+    """
+    findings = diagnose(results, context)
+    return "\n".join(f"- {f['message']}" for f in findings) or "No major issues detected."
+
+
+def history_context(store, domains, ruleset: RuleSet = DEFAULT_RULESET, days: float = 7):
+    """
+    Values of the ruleset's "history.<field>.p<q>" inputs for `domains`
+    from a ReportStore, one query per input for all domains at once.
+
+    Returns:
+        {domain: {"history.<field>.p<q>": float}}
+    """
+    context = {domain: {} for domain in domains}
+    start = time.time() - days * 86400
+
+    for column in ruleset.inputs:
+        match = re.fullmatch(r"history\.(.+)\.p(\d+(?:\.\d+)?)", column)
+        if not match:
+            continue
+
+        field, q = match.group(1), float(match.group(2))
+        for domain, value in store.percentile(field, q, list(domains), start).items():
+            context[domain][column] = value
+
+    return context
+
+
+def baseline_context(verdicts: dict):
+    """
+    BaselineStore verdicts for one run as rule inputs.
+
+    Returns:
+        {"baseline.<layer>": verdict, "baseline.<layer>.<p50|p95|z>": float}
+    """
+    context = {}
+    for layer, judged in verdicts.items():
+        context[f"baseline.{layer}"] = judged["verdict"]
+        for key in ("p50", "p95", "z"):
+            if judged[key] is not None:
+                context[f"baseline.{layer}.{key}"] = judged[key]
+    return context
+
+
+def _number(value):
+    if value is None or isinstance(value, str):
+        return np.nan
+    return float(value)
+
+
+def _format(message, row):
+    def field(match):
+        value = row.get(match.group(1))
+        if value is None:
+            return "unknown"
+        try:
+            return format(value, (match.group(2) or ":")[1:])
+        except (TypeError, ValueError):
+            return str(value)
+
+    return _FIELD.sub(field, message)
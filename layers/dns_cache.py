@@ -0,0 +1,166 @@
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from layers.fault_proxy import resolver
+
+
+class DNSCache:
+    """
+    In-process DNS answer cache keyed by (name, rdtype).
+
+    Entries live for their record TTL (clamped to [min_ttl, max_ttl]) and
+    the least recently used entry is evicted once `max_entries` is reached.
+    Safe to share between threads and asyncio tasks.
+    """
+
+    def __init__(self, max_entries: int = 4096, min_ttl: float = 0, max_ttl: float = 3600,
+                 fallback_ttl: float = 60):
+        self.max_entries = max_entries
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.fallback_ttl = fallback_ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, name: str, rdtype: str = "A"):
+        """
+        Cached addresses for (name, rdtype), or None on a miss.
+        """
+        key = _key(name, rdtype)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            addresses, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return addresses
+
+    def put(self, name: str, rdtype: str, addresses, ttl: float):
+        ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+        key = _key(name, rdtype)
+
+        with self._lock:
+            self._entries[key] = (list(addresses), time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def resolve(self, name: str, rdtype: str = "A"):
+        """
+        Addresses for `name`, resolving and caching them on a miss.
+        IP literals are returned as-is.
+        """
+        if _is_ip(name):
+            return [name]
+
+        addresses = self.get(name, rdtype)
+        if addresses is None:
+            addresses, ttl = _lookup(name, rdtype)
+            self.put(name, rdtype, addresses, self.fallback_ttl if ttl is None else ttl)
+        return addresses
+
+    async def resolve_async(self, name: str, rdtype: str = "A"):
+        """
+        Non-blocking variant of resolve for the batch runner.
+        """
+        if _is_ip(name):
+            return [name]
+
+        addresses = self.get(name, rdtype)
+        if addresses is None:
+            addresses, ttl = await _lookup_async(name, rdtype)
+            self.put(name, rdtype, addresses, self.fallback_ttl if ttl is None else ttl)
+        return addresses
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every layer in the process
+default_cache = DNSCache()
+
+
+def resolve_host(name: str, rdtype: str = "A"):
+    """
+    First cached address for `name`.
+    """
+    return default_cache.resolve(name, rdtype)[0]
+
+
+async def resolve_host_async(name: str, rdtype: str = "A"):
+    return (await default_cache.resolve_async(name, rdtype))[0]
+
+
+def _key(name, rdtype):
+    return name.lower().rstrip("."), rdtype.upper()
+
+
+def _is_ip(name):
+    try:
+        ipaddress.ip_address(name)
+        return True
+    except ValueError:
+        return False
+
+
+_FAMILIES = {"A": socket.AF_INET, "AAAA": socket.AF_INET6}
+
+
+def _lookup(name, rdtype):
+    try:
+        answer = resolver().resolve(name, rdtype)
+        return [rdata.address for rdata in answer], answer.rrset.ttl
+    except Exception:
+        # Names only the system resolver knows (hosts file, search domains);
+        # it reports no TTL, so the cache's fallback TTL applies
+        infos = socket.getaddrinfo(name, None, _FAMILIES[rdtype.upper()], socket.SOCK_STREAM)
+        return _unique(info[4][0] for info in infos), None
+
+
+async def _lookup_async(name, rdtype):
+    try:
+        answer = await resolver(asynchronous=True).resolve(name, rdtype)
+        return [rdata.address for rdata in answer], answer.rrset.ttl
+    except Exception:
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(name, None, family=_FAMILIES[rdtype.upper()], type=socket.SOCK_STREAM)
+        return _unique(info[4][0] for info in infos), None
+
+
+def _unique(addresses):
+    return list(dict.fromkeys(addresses))
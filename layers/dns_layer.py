@@ -1,22 +1,62 @@
-def resolve_dns(domain):
-    import time
-    import dns.resolver
+from layers.dns_cache import default_cache
+from layers.dns_profiler import cache_verdict
+from layers.fault_proxy import resolver
+from layers.timing import SpanRecorder
 
-    start = time.time()
-    answer = dns.resolver.resolve(domain, "A")
-    latency = (time.time() - start) * 1000
 
-    ttl = answer.rrset.ttl
+def resolve_dns(domain, repeat: bool = False):
+    """
+    Time a fresh resolver query for `domain` and store the answer in the
+    shared DNS cache for the other layers. With `repeat` a second query
+    tells whether the first one was answered from the resolver's cache;
+    it doubles the DNS traffic, so routine runs leave that to the
+    resolver profiler.
+    """
+    dns_resolver = resolver()
 
-    cache = {
-        "status": "cache_hit" if ttl > 60 else "cache_miss",
-        "reason": "High TTL suggests cached response" if ttl > 60 else "Low TTL suggests fresh lookup"
-    }
+    recorder = SpanRecorder()
+    with recorder.span("dns_resolve") as span:
+        answer = dns_resolver.resolve(domain, "A")
+
+    again = repeated = None
+    if repeat:
+        with recorder.span("dns_repeat") as repeated:
+            again = dns_resolver.resolve(domain, "A")
+
+    return _dns_result(answer, span, again, repeated, recorder)
+
+
+async def resolve_dns_async(domain, repeat: bool = False):
+    """
+    Non-blocking variant of resolve_dns for the batch runner.
+    """
+    dns_resolver = resolver(asynchronous=True)
+
+    recorder = SpanRecorder()
+    with recorder.span("dns_resolve") as span:
+        answer = await dns_resolver.resolve(domain, "A")
+
+    again = repeated = None
+    if repeat:
+        with recorder.span("dns_repeat") as repeated:
+            again = await dns_resolver.resolve(domain, "A")
+
+    return _dns_result(answer, span, again, repeated, recorder)
+
+
+def _dns_result(answer, span, again, repeated, recorder):
+    ttl = answer.rrset.ttl
+    ips = [rdata.address for rdata in answer]
+    default_cache.put(answer.qname.to_text(), "A", ips, ttl)
 
-    return {
+    result = {
         "status": "ok",
-        "ips": [rdata.address for rdata in answer],
-        "latency": latency,
+        "ips": ips,
+        "latency": span.duration_ms,
         "ttl": ttl,
-        "cache": cache
+        "spans": recorder.export()
     }
+    if again is not None:
+        result["repeat_latency"] = repeated.duration_ms
+        result["cache"] = cache_verdict(span.duration_ms, repeated.duration_ms, ttl, again.rrset.ttl)
+    return result
@@ -0,0 +1,175 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from layers.fault_proxy import route_datagram
+from layers.timing import SpanRecorder
+
+
+# "system" is the first nameserver from the host's resolver configuration
+DEFAULT_RESOLVERS = ("system", "1.1.1.1", "8.8.8.8", "9.9.9.9")
+
+# A repeat query this much faster than the first means the first one missed
+CACHE_MISS_RATIO = 1.5
+CACHE_MISS_MIN_MS = 2.0
+
+
+def profile_dns(domain: str, resolvers=DEFAULT_RESOLVERS, timeout: float = 2.0):
+    """
+    Compare resolvers for `domain`. Every resolver is queried concurrently;
+    each one resolves A and AAAA in parallel, follows and times the CNAME
+    chain, then repeats the A query to measure its cache.
+
+    Resolvers are "system", an address ("1.1.1.1", "2606:4700::1111") or
+    an address with a port ("127.0.0.1:5353", "[::1]:5353").
+
+    Returns:
+        {
+            status: "ok",
+            resolvers: [per-resolver rows],
+            fastest: str | None
+        }
+    """
+    resolvers = list(resolvers)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(resolvers))) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, _profile_resolver, domain, spec, timeout)
+            for spec in resolvers
+        ]
+        rows = [future.result() for future in futures]
+
+    answered = [row for row in rows if row["status"] == "ok" and row["a"]]
+    fastest = min(answered, key=lambda row: row["warm_ms"])["resolver"] if answered else None
+
+    return {
+        "status": "ok",
+        "domain": domain,
+        "resolvers": rows,
+        "fastest": fastest
+    }
+
+
+def cache_verdict(cold_ms: float, warm_ms: float, cold_ttl=None, warm_ttl=None):
+    """
+    Whether the first of two back-to-back queries was answered from the
+    resolver's cache: a miss makes it clearly slower than the repeat.
+    """
+    delta_ms = cold_ms - warm_ms
+
+    if cold_ms > max(warm_ms * CACHE_MISS_RATIO, warm_ms + CACHE_MISS_MIN_MS):
+        return {
+            "status": "cache_miss",
+            "reason": f"First query {delta_ms:.1f} ms slower than the repeat"
+        }
+
+    counting_down = None not in (cold_ttl, warm_ttl) and warm_ttl < cold_ttl
+    return {
+        "status": "cache_hit",
+        "reason": "First query as fast as the repeat"
+        + (" and TTL counting down" if counting_down else "")
+    }
+
+
+def _profile_resolver(domain, spec, timeout):
+    recorder = SpanRecorder()
+
+    try:
+        where, port = _parse_resolver(spec)
+        # Queries go through the fault proxy's relay when one is active
+        server = route_datagram(where, port)
+
+        with recorder.span("resolver"), ThreadPoolExecutor(max_workers=2) as pool:
+            a_future = pool.submit(contextvars.copy_context().run, _query, domain, "A", *server, timeout, recorder)
+            aaaa_future = pool.submit(contextvars.copy_context().run, _query, domain, "AAAA", *server, timeout, recorder)
+            cold = a_future.result()
+            aaaa = aaaa_future.result()
+
+            warm = _query(domain, "A", *server, timeout, recorder)
+            chain = _time_cname_chain(cold["chain"], *server, timeout, recorder)
+
+    except Exception as e:
+        return {
+            "resolver": spec,
+            "status": "error",
+            "error": str(e) or type(e).__name__
+        }
+
+    return {
+        "resolver": spec,
+        "server": f"{where}:{port}",
+        "status": "ok",
+        "rcode": cold["rcode"],
+        "a": cold["addresses"],
+        "aaaa": aaaa["addresses"],
+        "a_ms": cold["ms"],
+        "aaaa_ms": aaaa["ms"],
+        "cold_ms": cold["ms"],
+        "warm_ms": warm["ms"],
+        "delta_ms": cold["ms"] - warm["ms"],
+        "ttl": cold["ttl"],
+        "cache": cache_verdict(cold["ms"], warm["ms"], cold["ttl"], warm["ttl"]),
+        "cname_chain": chain,
+        "spans": recorder.export()
+    }
+
+
+def _query(name, rdtype, where, port, timeout, recorder):
+    import dns.message
+    import dns.query
+    import dns.rcode
+    import dns.rdatatype
+
+    query = dns.message.make_query(name, rdtype)
+
+    with recorder.span(f"query_{rdtype.lower()}") as span:
+        response, _ = dns.query.udp_with_fallback(query, where, timeout=timeout, port=port)
+
+    wanted = dns.rdatatype.from_text(rdtype)
+    addresses, ttl, chain = [], None, []
+
+    for rrset in response.answer:
+        if rrset.rdtype == dns.rdatatype.CNAME:
+            chain.append({
+                "name": rrset.name.to_text(),
+                "target": rrset[0].target.to_text(),
+                "ttl": rrset.ttl
+            })
+        elif rrset.rdtype == wanted:
+            addresses.extend(rdata.address for rdata in rrset)
+            ttl = rrset.ttl if ttl is None else min(ttl, rrset.ttl)
+
+    return {
+        "rcode": dns.rcode.to_text(response.rcode()),
+        "addresses": addresses,
+        "ttl": ttl,
+        "chain": chain,
+        "ms": span.duration_ms
+    }
+
+
+def _time_cname_chain(chain, where, port, timeout, recorder):
+    """
+    Query every alias in the chain on its own so each hop gets a latency.
+    """
+    hops = []
+    for link in chain:
+        hop = _query(link["name"], "CNAME", where, port, timeout, recorder)
+        hops.append(dict(link, ms=hop["ms"]))
+    return hops
+
+
+def _parse_resolver(spec):
+    if spec == "system":
+        import dns.resolver
+        resolver = dns.resolver.get_default_resolver()
+        return resolver.nameservers[0], resolver.port
+
+    if spec.startswith("["):
+        host, _, port = spec[1:].partition("]")
+        return host, int(port.lstrip(":") or 53)
+
+    if spec.count(":") == 1:
+        host, port = spec.split(":")
+        return host, int(port)
+
+    return spec, 53
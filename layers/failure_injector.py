@@ -1,3 +1,4 @@
+import math
 import time
 import random
 
@@ -8,3 +9,56 @@ def inject_delay(enabled: bool, delay_ms: int):
 def inject_failure(enabled: bool, probability=0.3):
     if enabled and random.random() < probability:
         raise RuntimeError("Simulated failure injected")
+
+def apply_simulation(layer: str, result: dict, slow_dns: bool = False, slow_tcp: bool = False,
+                     fail_http: bool = False, delay_ms: float = 0):
+    """
+    Simulated failures applied to a finished layer result, so toggling
+    them re-renders the last results instead of probing again. Returns a
+    new dict; `result` itself is left alone.
+    """
+    if layer == "dns" and slow_dns and result.get("status") == "ok":
+        return dict(result, latency=result["latency"] + delay_ms, simulated="slow_dns")
+
+    if layer == "tcp" and slow_tcp and result.get("status") == "ok":
+        return dict(result, connect_time_ms=result["connect_time_ms"] + delay_ms, simulated="slow_tcp")
+
+    if layer == "http" and fail_http:
+        return {"status": "failed", "simulated": "fail_http"}
+
+    return result
+
+
+def sample_delay_ms(spec, rng=random):
+    """
+    One delay in ms drawn from `spec`: a number (constant), or a dict
+    naming a distribution and its parameters:
+
+        {"dist": "constant", "ms": 50}
+        {"dist": "uniform", "low": 20, "high": 80}
+        {"dist": "normal", "mean": 50, "stddev": 10}       # jitter around a mean
+        {"dist": "lognormal", "median": 40, "sigma": 0.5}  # long right tail
+        {"dist": "exponential", "mean": 30}
+        {"dist": "pareto", "scale": 10, "alpha": 1.5}      # heavy tail
+
+    Negative draws are clamped to 0.
+    """
+    if not isinstance(spec, dict):
+        return max(float(spec or 0), 0.0)
+
+    dist = spec.get("dist", "constant")
+    if dist == "constant":
+        value = spec["ms"]
+    elif dist == "uniform":
+        value = rng.uniform(spec["low"], spec["high"])
+    elif dist == "normal":
+        value = rng.gauss(spec["mean"], spec["stddev"])
+    elif dist == "lognormal":
+        value = spec["median"] * math.exp(spec["sigma"] * rng.gauss(0, 1))
+    elif dist == "exponential":
+        value = rng.expovariate(1 / spec["mean"]) if spec["mean"] > 0 else 0.0
+    elif dist == "pareto":
+        value = spec["scale"] * rng.paretovariate(spec["alpha"])
+    else:
+        raise ValueError(f"Unknown delay distribution: {dist}")
+    return max(float(value), 0.0)
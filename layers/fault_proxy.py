@@ -0,0 +1,454 @@
+import asyncio
+import contextlib
+import contextvars
+import copy
+import json
+import random
+import socket
+import struct
+import threading
+
+from layers.failure_injector import sample_delay_ms
+
+
+# Faults applied to routed traffic. Delays are ms, as a number or a
+# failure_injector.sample_delay_ms distribution, drawn per event.
+DEFAULT_FAULTS = {
+    "latency": 0,           # one-way delay of every TCP segment and UDP datagram
+    "connect": 0,           # before each TCP connection is set up
+    "dns": 0,               # before each DNS query is forwarded
+    "bandwidth_bps": None,  # cap per connection and direction
+    "drop_rate": 0.0,       # per TCP segment / UDP datagram
+    "retransmit_ms": 200,   # first retransmission timeout after a dropped segment
+    "reset_rate": 0.0,      # connections reset before the first reply byte
+    "seed": None,
+}
+
+FAULT_PROFILES = {
+    "lossy-wifi": {
+        "latency": {"dist": "lognormal", "median": 15, "sigma": 0.6},
+        "drop_rate": 0.02,
+    },
+    "3g": {
+        "latency": {"dist": "normal", "mean": 100, "stddev": 30},
+        "bandwidth_bps": 750_000,
+        "drop_rate": 0.01,
+    },
+    "satellite": {
+        "latency": {"dist": "normal", "mean": 300, "stddev": 20},
+        "bandwidth_bps": 5_000_000,
+    },
+    "slow-dns": {
+        "dns": {"dist": "exponential", "mean": 400},
+    },
+    "flaky-server": {
+        "connect": {"dist": "pareto", "scale": 20, "alpha": 1.5},
+        "reset_rate": 0.2,
+    },
+}
+
+# Bytes read per relay step, and the segment size drops are counted in
+CHUNK = 64 * 1024
+MSS = 1460
+# A segment lost this many times in a row aborts its connection, as TCP would
+MAX_RETRANSMITS = 6
+# Chunks in flight per direction before the relay stops reading
+QUEUE_CHUNKS = 64
+# How long a routed address waits for its client, and a UDP flow for replies
+ACCEPT_TIMEOUT_S = 30.0
+UDP_IDLE_S = 30.0
+
+# The proxy the current probe routes through (see routed)
+_active = contextvars.ContextVar("netscope_fault_proxy", default=None)
+
+
+def parse_faults(text: str):
+    """
+    Faults from a command-line value: a FAULT_PROFILES name, or a JSON
+    object of DEFAULT_FAULTS keys, optionally extending a "profile".
+    """
+    if text in FAULT_PROFILES:
+        return dict(FAULT_PROFILES[text])
+
+    faults = json.loads(text)
+    if not isinstance(faults, dict):
+        raise ValueError("faults must be a profile name or a JSON object")
+    base = FAULT_PROFILES[faults.pop("profile")] if "profile" in faults else {}
+    return dict(base, **faults)
+
+
+class FaultProxy:
+    """
+    In-process TCP and UDP relay that injects faults into real traffic.
+
+    Layers route through it (see route / route_async / resolver), so the
+    connect, TLS, request and DNS timings they measure, and the timeouts
+    and retries they hit, come from the degraded traffic itself. Every
+    routed TCP connection gets its own one-shot listener paired with an
+    upstream connection made up front, so the client's connect time
+    includes the real upstream connect. DNS goes through one UDP relay
+    per nameserver.
+
+    Relays run on their own event loop thread; use as a context manager
+    or call start() / close().
+    """
+
+    def __init__(self, faults: dict = None):
+        self.faults = dict(DEFAULT_FAULTS, **(faults or {}))
+        unknown = set(self.faults) - set(DEFAULT_FAULTS)
+        if unknown:
+            raise ValueError(f"Unknown faults: {', '.join(sorted(unknown))}")
+
+        self._rng = random.Random(self.faults["seed"])
+        # Fail on a bad distribution now rather than mid-run
+        for name in ("latency", "connect", "dns"):
+            sample_delay_ms(self.faults[name], self._rng)
+
+        self.stats = {"connections": 0, "resets": 0, "segments_dropped": 0,
+                      "datagrams": 0, "datagrams_dropped": 0}
+
+        self._loop = None
+        self._thread = None
+        self._relays = {}
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._thread = self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connect(self, address: str, port: int, timeout: float = None):
+        """
+        Connect upstream to (address, port) through the faults and return
+        the local (host, port) the client should connect to instead.
+        Raises the upstream connect's error if it fails.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._open(address, port, timeout), self.start()._loop)
+        return future.result()
+
+    async def connect_async(self, address: str, port: int, timeout: float = None):
+        future = asyncio.run_coroutine_threadsafe(self._open(address, port, timeout), self.start()._loop)
+        return await asyncio.wrap_future(future)
+
+    def datagram(self, address: str, port: int = 53):
+        """
+        Local (host, port) that relays UDP datagrams to (address, port)
+        through the faults, e.g. a DNS nameserver.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._datagram_relay(address, port), self.start()._loop)
+        return future.result()
+
+    # ---------------- faults ----------------
+    def _delay_s(self, name):
+        return sample_delay_ms(self.faults[name], self._rng) / 1000
+
+    def _dropped(self):
+        return self._rng.random() < self.faults["drop_rate"]
+
+    def _retransmit_s(self, size):
+        """
+        Extra delay for a chunk whose segments may be dropped: each loss
+        costs a retransmission timeout, doubling while retransmits are
+        lost too. Segments recover in parallel, so the worst one counts.
+
+        Returns (seconds, lost): lost when a segment was dropped on every
+        retransmission, after which the connection gives up.
+        """
+        if not self.faults["drop_rate"]:
+            return 0.0, False
+
+        worst = 0.0
+        for _ in range(-(-size // MSS)):
+            delay, timeout = 0.0, self.faults["retransmit_ms"]
+            for _ in range(MAX_RETRANSMITS + 1):
+                if not self._dropped():
+                    break
+                self.stats["segments_dropped"] += 1
+                delay += timeout
+                timeout *= 2
+            else:
+                return delay / 1000, True
+            worst = max(worst, delay)
+        return worst / 1000, False
+
+    # ---------------- TCP ----------------
+    async def _open(self, address, port, timeout):
+        await asyncio.sleep(self._delay_s("connect"))
+        upstream = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+
+        accepted = asyncio.get_running_loop().create_future()
+
+        def on_client(reader, writer):
+            if accepted.done():
+                writer.close()
+            else:
+                accepted.set_result((reader, writer))
+
+        server = await asyncio.start_server(on_client, _local_host(address), 0)
+        task = asyncio.get_running_loop().create_task(self._serve(server, accepted, upstream))
+        self._connections.add(task)
+        task.add_done_callback(self._connections.discard)
+        return server.sockets[0].getsockname()[:2]
+
+    async def _serve(self, server, accepted, upstream):
+        try:
+            client = await asyncio.wait_for(accepted, ACCEPT_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            upstream[1].close()
+            return
+        finally:
+            server.close()
+
+        self.stats["connections"] += 1
+        (client_reader, client_writer), (upstream_reader, upstream_writer) = client, upstream
+
+        try:
+            if self._rng.random() < self.faults["reset_rate"]:
+                # The request still reaches the server; the client never sees a reply
+                request = await client_reader.read(CHUNK)
+                upstream_writer.write(request)
+                self.stats["resets"] += 1
+                _reset(client_writer)
+                return
+
+            pumps = [
+                asyncio.ensure_future(self._pump(client_reader, upstream_writer)),
+                asyncio.ensure_future(self._pump(upstream_reader, client_writer))
+            ]
+            try:
+                await asyncio.gather(*pumps)
+            finally:
+                for pump in pumps:
+                    pump.cancel()
+        except OSError:
+            # Either side went away; the other sees its connection close
+            pass
+        finally:
+            client_writer.close()
+            upstream_writer.close()
+
+    async def _pump(self, reader, writer):
+        """
+        Copy one direction, delivering each chunk after its serialisation
+        time at the bandwidth cap, its latency and any retransmissions, in
+        order, while the next chunks are already being read. A chunk that
+        is lost for good aborts the connection once its retransmissions
+        have timed out.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_CHUNKS)
+
+        async def deliver():
+            while (item := await queue.get()) is not None:
+                at, chunk = item
+                await asyncio.sleep(max(at - loop.time(), 0))
+                if chunk is None:
+                    raise ConnectionAbortedError("Segment lost on every retransmission")
+                writer.write(chunk)
+                await writer.drain()
+            if writer.can_write_eof():
+                writer.write_eof()
+
+        delivery = loop.create_task(deliver())
+        link_free = last = 0.0
+        try:
+            while chunk := await reader.read(CHUNK):
+                bandwidth = self.faults["bandwidth_bps"]
+                link_free = max(loop.time(), link_free) + (len(chunk) * 8 / bandwidth if bandwidth else 0)
+                retransmit, lost = self._retransmit_s(len(chunk))
+                last = max(link_free + self._delay_s("latency") + retransmit, last)
+                if lost:
+                    await queue.put((last, None))
+                    break
+                await queue.put((last, chunk))
+            else:
+                await queue.put(None)
+            await delivery
+        finally:
+            delivery.cancel()
+
+    # ---------------- UDP ----------------
+    async def _datagram_relay(self, address, port):
+        key = (address, port)
+        if key not in self._relays:
+            relay = _DatagramRelay(self, key)
+            await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: relay, local_addr=(_local_host(address), 0)
+            )
+            self._relays[key] = relay
+        return self._relays[key].transport.get_extra_info("sockname")[:2]
+
+    async def _shutdown(self):
+        for relay in self._relays.values():
+            relay.close()
+        self._relays.clear()
+
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+
+class _DatagramRelay(asyncio.DatagramProtocol):
+    """
+    Forwards each client's datagrams to `target` from a socket of its own,
+    and the replies back, dropping and delaying both ways.
+    """
+
+    def __init__(self, proxy, target):
+        self.proxy = proxy
+        self.target = target
+        self.transport = None
+        self.flows = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, client):
+        proxy = self.proxy
+        proxy.stats["datagrams"] += 1
+        if proxy._dropped():
+            proxy.stats["datagrams_dropped"] += 1
+            return
+
+        delay = proxy._delay_s("dns") + proxy._delay_s("latency")
+        loop = asyncio.get_running_loop()
+        loop.call_later(delay, lambda: loop.create_task(self._forward(data, client)))
+
+    async def _forward(self, data, client):
+        loop = asyncio.get_running_loop()
+        if client not in self.flows:
+            self.flows[client] = loop.create_task(loop.create_datagram_endpoint(
+                lambda: _DatagramReply(self, client), remote_addr=self.target
+            ))
+            loop.call_later(UDP_IDLE_S, self._expire, client)
+
+        try:
+            upstream, _ = await self.flows[client]
+        except OSError:
+            return
+        upstream.sendto(data)
+
+    def reply(self, data, client):
+        proxy = self.proxy
+        proxy.stats["datagrams"] += 1
+        if proxy._dropped():
+            proxy.stats["datagrams_dropped"] += 1
+            return
+        if not self.transport.is_closing():
+            asyncio.get_running_loop().call_later(proxy._delay_s("latency"), self.transport.sendto, data, client)
+
+    def _expire(self, client):
+        flow = self.flows.pop(client, None)
+        if flow is not None and flow.done() and not flow.exception():
+            flow.result()[0].close()
+
+    def close(self):
+        for client in list(self.flows):
+            self._expire(client)
+        self.transport.close()
+
+
+class _DatagramReply(asyncio.DatagramProtocol):
+    def __init__(self, relay, client):
+        self.relay = relay
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.relay.reply(data, self.client)
+
+
+def _local_host(address):
+    return "::1" if ":" in address else "127.0.0.1"
+
+
+def _reset(writer):
+    # Linger 0 makes close() send RST instead of FIN
+    sock = writer.get_extra_info("socket")
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    writer.transport.abort()
+
+
+# ---------------- routing ----------------
+@contextlib.contextmanager
+def routed(proxy: FaultProxy):
+    """
+    Route the layers' traffic through `proxy` in this context: the
+    current thread or task, and the worker threads and tasks it starts.
+    """
+    token = _active.set(proxy)
+    try:
+        yield proxy
+    finally:
+        _active.reset(token)
+
+
+def route(address: str, port: int, timeout: float = None):
+    """
+    Address a layer should connect to for (address, port): itself, or a
+    local relay when a fault proxy is routing this context.
+    """
+    proxy = _active.get()
+    if proxy is None:
+        return address, port
+    return proxy.connect(address, port, timeout)
+
+
+async def route_async(address: str, port: int, timeout: float = None):
+    proxy = _active.get()
+    if proxy is None:
+        return address, port
+    return await proxy.connect_async(address, port, timeout)
+
+
+def route_datagram(address: str, port: int):
+    """
+    Like route, for UDP (DNS queries to a given server).
+    """
+    proxy = _active.get()
+    if proxy is None:
+        return address, port
+    return proxy.datagram(address, port)
+
+
+def resolver(asynchronous: bool = False):
+    """
+    dnspython resolver for the layers: the default one, or a copy whose
+    queries go through the active fault proxy's UDP relay.
+    """
+    if asynchronous:
+        import dns.asyncresolver as module
+    else:
+        import dns.resolver as module
+    import dns.nameserver
+
+    default = module.get_default_resolver()
+    proxy = _active.get()
+    if proxy is None:
+        return default
+
+    relayed = copy.copy(default)
+    relayed.nameservers = [
+        dns.nameserver.Do53Nameserver(*route_datagram(getattr(server, "address", server), default.port))
+        for server in default.nameservers
+    ]
+    return relayed
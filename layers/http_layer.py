@@ -1,52 +1,284 @@
+import asyncio
+import contextvars
 import socket
 import ssl
-import time
+from concurrent.futures import ThreadPoolExecutor
 
+from layers.dns_cache import resolve_host, resolve_host_async
+from layers.fault_proxy import route, route_async
+from layers.http_response import (
+    RECV_BUFFER_BYTES,
+    ClosedBeforeResponse,
+    read_response,
+    read_response_async,
+    record_response,
+    transfer_summary
+)
+from layers.sampling import summarize
+from layers.timing import SpanRecorder, now_ns
 
-def http_request(domain: str, path: str = "/", port: int = 443):
+
+def http_request(domain: str, path: str = "/", port: int = 443, ip: str = None,
+                 timeout: float = 10.0):
     """
     Perform a raw HTTPS GET request and measure timings.
+    The DNS phase is skipped when `ip` is already resolved.
     """
+    exchange = https_exchange(domain, path, port, ip, timeout)
 
-    timings = {}
-    start_total = time.time()
+    return {
+        "status": "ok",
+        "ip": exchange["ip"],
+        "status_line": exchange["status_line"],
+        "timings": exchange["timings"],
+        "transfer": exchange["transfer"],
+        "spans": exchange["spans"]
+    }
 
-    # DNS
-    start = time.time()
-    ip = socket.gethostbyname(domain)
-    timings["dns"] = (time.time() - start) * 1000
 
-    # TCP
-    start = time.time()
-    sock = socket.create_connection((ip, port))
-    timings["tcp"] = (time.time() - start) * 1000
+def https_exchange(domain: str, path: str = "/", port: int = 443, ip: str = None,
+                   timeout: float = 10.0):
+    """
+    One instrumented HTTPS exchange: connect, TLS handshake, request, then
+    the response split into time to first byte, header completion and body
+    transfer. Also returns the peer certificate so callers can reuse the
+    handshake. `timeout` bounds the connect and every read, so a stalled
+    server can't hold a worker.
+    """
 
-    # TLS
-    context = ssl.create_default_context()
-    start = time.time()
-    ssock = context.wrap_socket(sock, server_hostname=domain)
-    timings["tls"] = (time.time() - start) * 1000
+    recorder = SpanRecorder()
+    phases = {}
+
+    with recorder.span("http") as total:
+        # DNS
+        if ip is None:
+            with recorder.span("dns") as phases["dns"]:
+                ip = resolve_host(domain)
+
+        # TCP
+        with recorder.span("tcp") as phases["tcp"]:
+            sock = socket.create_connection(route(ip, port, timeout), timeout=timeout)
+
+        # TLS
+        context = ssl.create_default_context()
+        try:
+            with recorder.span("tls") as phases["tls"]:
+                ssock = context.wrap_socket(sock, server_hostname=domain)
+        except Exception:
+            sock.close()
+            raise
+
+        try:
+            cert = ssock.getpeercert()
+
+            # HTTP Request
+            request = f"GET {path} HTTP/1.1\r\nHost: {domain}\r\nConnection: close\r\n\r\n"
+            with recorder.span("request") as phases["request"]:
+                ssock.sendall(request.encode())
+
+            # HTTP Response
+            sent = now_ns()
+            parser, marks, received, _ = read_response(ssock)
+        finally:
+            ssock.close()
+        record_response(recorder, phases, sent, marks)
 
-    # HTTP Request
-    request = f"GET {path} HTTP/1.1\r\nHost: {domain}\r\nConnection: close\r\n\r\n"
-    start = time.time()
-    ssock.sendall(request.encode())
-    timings["request"] = (time.time() - start) * 1000
+    return {
+        "ip": ip,
+        "port": port,
+        "status_line": parser.status_line,
+        "timings": _phase_timings(phases, total),
+        "transfer": transfer_summary(parser, marks, received),
+        "spans": recorder.export(),
+        "cert": cert
+    }
+
+
+async def http_request_async(domain: str, path: str = "/", port: int = 443, ip: str = None,
+                             timeout: float = 10.0):
+    """
+    Non-blocking variant of http_request with the same phases and result shape.
+    """
+    recorder = SpanRecorder()
+    phases = {}
 
-    # HTTP Response
-    start = time.time()
-    response = ssock.recv(4096)
-    timings["response"] = (time.time() - start) * 1000
+    with recorder.span("http") as total:
+        # DNS
+        if ip is None:
+            with recorder.span("dns") as phases["dns"]:
+                ip = await resolve_host_async(domain)
 
-    ssock.close()
+        # TCP
+        with recorder.span("tcp") as phases["tcp"]:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(*await route_async(ip, port, timeout)), timeout
+            )
 
-    timings["total"] = (time.time() - start_total) * 1000
+        try:
+            # TLS
+            context = ssl.create_default_context()
+            with recorder.span("tls") as phases["tls"]:
+                await asyncio.wait_for(writer.start_tls(context, server_hostname=domain), timeout)
 
-    status_line = response.decode(errors="ignore").splitlines()[0]
+            # HTTP Request
+            request = f"GET {path} HTTP/1.1\r\nHost: {domain}\r\nConnection: close\r\n\r\n"
+            with recorder.span("request") as phases["request"]:
+                writer.write(request.encode())
+                await writer.drain()
+
+            # HTTP Response
+            sent = now_ns()
+            parser, marks, received = await asyncio.wait_for(read_response_async(reader), timeout)
+            record_response(recorder, phases, sent, marks)
+
+        finally:
+            writer.close()
 
     return {
         "status": "ok",
         "ip": ip,
-        "status_line": status_line,
-        "timings": timings
+        "status_line": parser.status_line,
+        "timings": _phase_timings(phases, total),
+        "transfer": transfer_summary(parser, marks, received),
+        "spans": recorder.export()
     }
+
+
+def http_keepalive_benchmark(domain: str, path: str = "/", port: int = 443, ip: str = None,
+                             requests: int = 10, connections: int = 1,
+                             pipeline: bool = False, timeout: float = 10.0):
+    """
+    Send `requests` GETs over `connections` persistent TLS connections
+    (optionally pipelined) and compare cold and warm request latency.
+
+    A cold request includes its connect and TLS handshake. When the origin
+    closes a connection, whether it says so (Connection: close, HTTP/1.0)
+    or just drops an idle one, the next request reconnects and counts as
+    cold.
+
+    Returns:
+        {
+            status: "ok" | "error",
+            cold_ms, warm_ms: latency statistics,
+            requests_per_sec: float,
+            reconnects: int,
+            samples: [{connection, cold, latency_ms, status_code}]
+        }
+    """
+    try:
+        if ip is None:
+            ip = resolve_host(domain)
+
+        connections = max(1, min(connections, requests))
+        shares = [requests // connections + (i < requests % connections) for i in range(connections)]
+
+        start = now_ns()
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, _keepalive_connection,
+                            domain, ip, port, path, count, index, pipeline, timeout)
+                for index, count in enumerate(shares)
+            ]
+            runs = [future.result() for future in futures]
+        wall_ns = now_ns() - start
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+
+    samples = [sample for run in runs for sample in run["samples"]]
+    cold = [s["latency_ms"] for s in samples if s["cold"]]
+    warm = [s["latency_ms"] for s in samples if not s["cold"]]
+
+    return {
+        "status": "ok",
+        "ip": ip,
+        "mode": "pipelined" if pipeline else "sequential",
+        "connections": connections,
+        "requests": len(samples),
+        "cold_ms": summarize(cold) if cold else None,
+        "warm_ms": summarize(warm) if warm else None,
+        "requests_per_sec": len(samples) * 1e9 / wall_ns,
+        "reconnects": sum(run["reconnects"] for run in runs),
+        "samples": samples
+    }
+
+
+def _keepalive_connection(domain, ip, port, path, count, index, pipeline, timeout):
+    request = f"GET {path} HTTP/1.1\r\nHost: {domain}\r\nConnection: keep-alive\r\n\r\n".encode()
+    context = ssl.create_default_context()
+    buffer = bytearray(RECV_BUFFER_BYTES)
+
+    samples = []
+    reconnects = 0
+    ssock = None
+    leftover = b""
+
+    try:
+        while len(samples) < count:
+            started = now_ns()
+            cold = ssock is None
+            if cold:
+                if samples:
+                    reconnects += 1
+                sock = socket.create_connection(route(ip, port, timeout), timeout=timeout)
+                try:
+                    ssock = context.wrap_socket(sock, server_hostname=domain)
+                except Exception:
+                    sock.close()
+                    raise
+                leftover = b""
+
+            # Pipelining sends everything left in one burst; responses
+            # are then timed from the burst to their completion
+            batch = count - len(samples) if pipeline else 1
+            sent = now_ns()
+            try:
+                ssock.sendall(request * batch)
+            except OSError:
+                if cold:
+                    raise
+                # The server dropped the idle connection; resend on a new one
+                ssock.close()
+                ssock = None
+                continue
+
+            for _ in range(batch):
+                try:
+                    parser, marks, _, leftover = read_response(ssock, buffer, initial=leftover)
+                except ClosedBeforeResponse:
+                    if cold:
+                        raise
+                    # Closed without saying so; the rest go out again
+                    ssock.close()
+                    ssock = None
+                    break
+
+                samples.append({
+                    "connection": index,
+                    "cold": cold,
+                    "latency_ms": (marks["end"] - (started if cold else sent)) / 1e6,
+                    "status_code": parser.status_code
+                })
+                cold = False
+
+                if parser.closes_connection:
+                    ssock.close()
+                    ssock = None
+                    break
+    finally:
+        if ssock is not None:
+            ssock.close()
+
+    return {
+        "samples": samples,
+        "reconnects": reconnects
+    }
+
+
+def _phase_timings(phases, total):
+    timings = {name: span.duration_ms for name, span in phases.items()}
+    timings["total"] = total.duration_ms
+    return timings
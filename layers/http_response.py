@@ -0,0 +1,268 @@
+from layers.timing import now_ns
+
+
+MAX_HEAD_BYTES = 64 * 1024
+RECV_BUFFER_BYTES = 64 * 1024
+
+
+class ClosedBeforeResponse(ConnectionError):
+    """
+    The peer closed the connection before sending any of the response,
+    as servers do with idle keep-alive connections.
+    """
+
+
+class HTTPResponseParser:
+    """
+    Incremental HTTP/1.1 response parser.
+
+    Feed it bytes as they arrive. It keeps the status line, headers and
+    chunk framing, and only counts body bytes, so a body of any size is
+    read through one reusable buffer.
+    """
+
+    def __init__(self, head_request: bool = False):
+        self.status_line = None
+        self.status_code = None
+        self.headers = {}
+        self.headers_complete = False
+        self.complete = False
+        self.chunked = False
+        self.body_bytes = 0
+
+        self._started = False
+        self._head_request = head_request
+        self._state = "head"
+        self._pending = bytearray()
+        self._remaining = 0
+
+    def feed(self, data) -> int:
+        """
+        Parse bytes from `data` (bytes or memoryview) and return how many
+        were consumed. Anything after the end of this response is left
+        unconsumed for the next one on the same connection.
+        """
+        view = memoryview(data)
+        pos = 0
+        self._started = self._started or len(view) > 0
+
+        while pos < len(view) and not self.complete:
+            if self._state == "head":
+                pos += self._feed_head(view[pos:])
+            elif self._state in ("length", "chunk_data"):
+                n = min(self._remaining, len(view) - pos)
+                self.body_bytes += n
+                self._remaining -= n
+                pos += n
+                if not self._remaining:
+                    if self._state == "length":
+                        self.complete = True
+                    else:
+                        self._state, self._remaining = "chunk_end", 2
+            elif self._state == "chunk_end":
+                n = min(self._remaining, len(view) - pos)
+                self._remaining -= n
+                pos += n
+                if not self._remaining:
+                    self._state = "chunk_size"
+            elif self._state in ("chunk_size", "trailers"):
+                pos += self._feed_line(view[pos:])
+            else:  # until_close
+                self.body_bytes += len(view) - pos
+                pos = len(view)
+
+        return pos
+
+    def feed_eof(self):
+        """
+        Signal the peer closed the connection.
+        """
+        if self._state == "until_close":
+            self.complete = True
+        if not self._started:
+            raise ClosedBeforeResponse("Connection closed before the response started")
+        if not self.complete:
+            raise ConnectionError("Connection closed before the response was complete")
+
+    @property
+    def closes_connection(self) -> bool:
+        """
+        Whether the server closes the connection after this response:
+        Connection: close, HTTP/1.0 without keep-alive, or a body read
+        until close.
+        """
+        connection = self.headers.get("connection", "").lower()
+        if self._state == "until_close" or "close" in connection:
+            return True
+        return self.status_line.startswith("HTTP/1.0") and "keep-alive" not in connection
+
+    def _feed_head(self, view) -> int:
+        before = len(self._pending)
+        self._pending += view
+        end = self._pending.find(b"\r\n\r\n", max(0, before - 3))
+
+        if end < 0:
+            if len(self._pending) > MAX_HEAD_BYTES:
+                raise ValueError("HTTP response head too large")
+            return len(view)
+
+        head = bytes(self._pending[:end]).decode("iso-8859-1")
+        del self._pending[:]
+        self._parse_head(head)
+        return end + 4 - before
+
+    def _parse_head(self, head: str):
+        lines = head.split("\r\n")
+        status_line = lines[0]
+        parts = status_line.split(" ", 2)
+        status_code = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+
+        # Skip interim responses such as 100 Continue
+        if 100 <= status_code < 200:
+            return
+
+        self.status_line = status_line
+        self.status_code = status_code
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            self.headers[name.strip().lower()] = value.strip()
+        self.headers_complete = True
+
+        encoding = self.headers.get("transfer-encoding", "").lower()
+        length = self.headers.get("content-length")
+
+        if self._head_request or status_code in (204, 304):
+            self.complete = True
+        elif "chunked" in encoding:
+            self.chunked = True
+            self._state = "chunk_size"
+        elif length is not None:
+            self._remaining = int(length)
+            self._state = "length"
+            self.complete = self._remaining == 0
+        else:
+            self._state = "until_close"
+
+    def _feed_line(self, view) -> int:
+        # Framing lines are short; only look at a small window of the body
+        window = bytes(view[:256])
+        end = window.find(b"\n")
+        if end < 0:
+            self._pending += window
+            if len(self._pending) > MAX_HEAD_BYTES:
+                raise ValueError("HTTP chunk framing line too large")
+            return len(window)
+
+        self._pending += window[:end]
+        line = bytes(self._pending).strip()
+        del self._pending[:]
+
+        if self._state == "chunk_size":
+            size = int(line.split(b";", 1)[0], 16)
+            if size:
+                self._state, self._remaining = "chunk_data", size
+            else:
+                self._state = "trailers"
+        elif not line:
+            self.complete = True
+
+        return end + 1
+
+
+def read_response(sock, buffer=None, head_request: bool = False, initial: bytes = b""):
+    """
+    Read one response from a blocking socket with recv_into on a reused
+    buffer. `initial` holds bytes already read past the previous response
+    on a persistent connection. Returns the parser, the phase timestamps,
+    the bytes of this response received (carried over ones included) and
+    any bytes read past its end.
+    """
+    view = memoryview(buffer or bytearray(RECV_BUFFER_BYTES))
+    parser = HTTPResponseParser(head_request)
+    marks = {"first_byte": None, "headers": None, "end": None}
+    received = 0
+    leftover = b""
+
+    if initial:
+        marks["first_byte"] = now_ns()
+        consumed = parser.feed(initial)
+        received += consumed
+        if parser.headers_complete:
+            marks["headers"] = marks["first_byte"]
+        leftover = initial[consumed:]
+
+    while not parser.complete:
+        try:
+            n = sock.recv_into(view)
+        except ConnectionResetError as e:
+            if received:
+                raise
+            # A closed connection the request was sent into answers with RST
+            raise ClosedBeforeResponse("Connection reset before the response started") from e
+        at = now_ns()
+        marks["first_byte"] = marks["first_byte"] or at
+
+        if not n:
+            parser.feed_eof()
+            break
+
+        consumed = parser.feed(view[:n])
+        received += consumed
+        if parser.headers_complete and marks["headers"] is None:
+            marks["headers"] = at
+        if consumed < n:
+            leftover = bytes(view[consumed:n])
+
+    marks["end"] = now_ns()
+    return parser, marks, received, leftover
+
+
+async def read_response_async(reader, head_request: bool = False):
+    """
+    Non-blocking variant of read_response on an asyncio StreamReader.
+    """
+    parser = HTTPResponseParser(head_request)
+    marks = {"first_byte": None, "headers": None, "end": None}
+    received = 0
+
+    while not parser.complete:
+        data = await reader.read(RECV_BUFFER_BYTES)
+        at = now_ns()
+        marks["first_byte"] = marks["first_byte"] or at
+
+        if not data:
+            parser.feed_eof()
+            break
+
+        received += len(data)
+        parser.feed(data)
+        if parser.headers_complete and marks["headers"] is None:
+            marks["headers"] = at
+
+    marks["end"] = now_ns()
+    return parser, marks, received
+
+
+def record_response(recorder, phases, sent_ns, marks):
+    """
+    Turn response timestamps into ttfb / headers / body spans.
+    """
+    phases["ttfb"] = recorder.record("ttfb", sent_ns, marks["first_byte"])
+    phases["headers"] = recorder.record("headers", marks["first_byte"], marks["headers"])
+    phases["body"] = recorder.record("body", marks["headers"], marks["end"])
+
+
+def transfer_summary(parser, marks, received):
+    """
+    Response size and throughput (bytes per second) from first byte to end
+    of body.
+    """
+    elapsed_ns = marks["end"] - marks["first_byte"]
+
+    return {
+        "status_code": parser.status_code,
+        "chunked": parser.chunked,
+        "body_bytes": parser.body_bytes,
+        "bytes_received": received,
+        "bytes_per_s": received * 1e9 / elapsed_ns if elapsed_ns > 0 else None
+    }
@@ -1,5 +1,9 @@
+import asyncio
 import socket
-import time
+
+from layers.dns_cache import default_cache, resolve_host, resolve_host_async
+from layers.fault_proxy import route, route_async
+from layers.timing import SpanRecorder
 
 
 def tcp_latency(host: str, port: int = 443, timeout: float = 3.0):
@@ -15,17 +19,21 @@ def tcp_latency(host: str, port: int = 443, timeout: float = 3.0):
             port: int
         }
     """
-    start = time.time()
+    recorder = SpanRecorder()
     try:
-        sock = socket.create_connection((host, port), timeout=timeout)
+        ip = resolve_host(host)
+        with recorder.span("tcp_connect") as span:
+            sock = socket.create_connection(route(ip, port, timeout), timeout=timeout)
         sock.close()
-        latency_ms = round((time.time() - start) * 1000, 2)
+        latency_ms = round(span.duration_ms, 2)
 
         return {
             "status": "reachable",
+            "ip": ip,
             "latency_ms": latency_ms,
             "method": "tcp_connect",
-            "port": port
+            "port": port,
+            "spans": recorder.export()
         }
 
     except Exception as e:
@@ -35,3 +43,195 @@ def tcp_latency(host: str, port: int = 443, timeout: float = 3.0):
             "method": "tcp_connect",
             "port": port
         }
+
+
+async def tcp_latency_async(host: str, port: int = 443, timeout: float = 3.0):
+    """
+    Non-blocking variant of tcp_latency with the same result shape.
+    """
+    recorder = SpanRecorder()
+    try:
+        ip = await resolve_host_async(host)
+        with recorder.span("tcp_connect") as span:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(*await route_async(ip, port, timeout)), timeout
+            )
+        latency_ms = round(span.duration_ms, 2)
+        writer.close()
+
+        return {
+            "status": "reachable",
+            "ip": ip,
+            "latency_ms": latency_ms,
+            "method": "tcp_connect",
+            "port": port,
+            "spans": recorder.export()
+        }
+
+    except Exception as e:
+        return {
+            "status": "unreachable",
+            "error": str(e) or type(e).__name__,
+            "method": "tcp_connect",
+            "port": port
+        }
+
+
+# RFC 8305 §5: wait this long before starting the next address's attempt
+CONNECTION_ATTEMPT_DELAY_MS = 250
+
+
+def dual_stack_race(host: str, port: int = 443, timeout: float = 3.0,
+                    attempt_delay_ms: float = CONNECTION_ATTEMPT_DELAY_MS):
+    """
+    IPv4/IPv6 reachability race (RFC 8305 Happy Eyeballs).
+
+    Connects to every resolved address concurrently so each one gets its
+    own connect time, then replays the Happy Eyeballs schedule (IPv6 first,
+    families interleaved, one new attempt every `attempt_delay_ms` or as
+    soon as the previous one fails) to show which address a dual-stack
+    client would end up on and how long the fallback cost it.
+
+    Returns:
+        {
+            status: "reachable" | "unreachable",
+            ip: winning address,
+            latency_ms: float,
+            happy_eyeballs_ms: float,
+            fallback_penalty_ms: float,
+            attempts: [per-address rows],
+            families: {"ipv6": ms | None, "ipv4": ms | None}
+        }
+    """
+    return asyncio.run(dual_stack_race_async(host, port, timeout, attempt_delay_ms))
+
+
+async def dual_stack_race_async(host: str, port: int = 443, timeout: float = 3.0,
+                                attempt_delay_ms: float = CONNECTION_ATTEMPT_DELAY_MS):
+    """
+    Non-blocking variant of dual_stack_race with the same result shape.
+    """
+    recorder = SpanRecorder()
+
+    try:
+        v6, v4 = await asyncio.gather(
+            _addresses(host, "AAAA"), _addresses(host, "A")
+        )
+        addresses = _interleave(v6, v4)
+        if not addresses:
+            raise OSError(f"No IPv4 or IPv6 addresses for {host}")
+
+        with recorder.span("dual_stack_race"):
+            attempts = await asyncio.gather(*(
+                _attempt(address, port, timeout, recorder) for address in addresses
+            ))
+
+    except Exception as e:
+        return {
+            "status": "unreachable",
+            "error": str(e) or type(e).__name__,
+            "method": "happy_eyeballs",
+            "port": port
+        }
+
+    _schedule(attempts, attempt_delay_ms)
+    connected = [a for a in attempts if a["status"] == "ok"]
+
+    families = {
+        family: min((a["connect_ms"] for a in connected if a["family"] == family), default=None)
+        for family in ("ipv6", "ipv4")
+    }
+
+    if not connected:
+        return {
+            "status": "unreachable",
+            "error": "No address accepted a connection",
+            "method": "happy_eyeballs",
+            "port": port,
+            "attempts": attempts,
+            "families": families,
+            "spans": recorder.export()
+        }
+
+    winner = min(connected, key=lambda a: a["start_ms"] + a["connect_ms"])
+    fastest = min(connected, key=lambda a: a["connect_ms"])
+    happy_eyeballs_ms = winner["start_ms"] + winner["connect_ms"]
+
+    return {
+        "status": "reachable",
+        "ip": winner["address"],
+        "family": winner["family"],
+        "latency_ms": round(winner["connect_ms"], 2),
+        "fastest": fastest["address"],
+        "happy_eyeballs_ms": round(happy_eyeballs_ms, 2),
+        "fallback_penalty_ms": round(happy_eyeballs_ms - fastest["connect_ms"], 2),
+        "attempt_delay_ms": attempt_delay_ms,
+        "method": "happy_eyeballs",
+        "port": port,
+        "attempts": attempts,
+        "families": families,
+        "spans": recorder.export()
+    }
+
+
+async def _addresses(host, rdtype):
+    try:
+        return await default_cache.resolve_async(host, rdtype)
+    except Exception:
+        # A missing family is normal on single-stack hosts
+        return []
+
+
+def _interleave(v6, v4):
+    """
+    RFC 8305 §4: alternate families, starting with IPv6.
+    """
+    ordered = []
+    for i in range(max(len(v6), len(v4))):
+        ordered.extend(addresses[i] for addresses in (v6, v4) if i < len(addresses))
+    return ordered
+
+
+async def _attempt(address, port, timeout, recorder):
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+
+    row = {
+        "address": address,
+        "family": "ipv6" if family == socket.AF_INET6 else "ipv4",
+        "status": "ok",
+        "connect_ms": None,
+        "error": None
+    }
+
+    try:
+        with recorder.span(f"tcp_connect {address}") as span:
+            await asyncio.wait_for(loop.sock_connect(sock, await route_async(address, port, timeout)), timeout)
+        row["connect_ms"] = round(span.duration_ms, 2)
+    except asyncio.TimeoutError:
+        row["status"] = "timeout"
+        row["error"] = f"No answer within {timeout:.1f} s"
+    except OSError as e:
+        row["status"] = "error"
+        row["error"] = e.strerror or str(e)
+        row["failed_ms"] = span.duration_ms
+    finally:
+        sock.close()
+
+    return row
+
+
+def _schedule(attempts, attempt_delay_ms):
+    """
+    When a Happy Eyeballs client would have started each attempt: one
+    delay after the previous start, or as soon as the previous one failed.
+    """
+    start = 0.0
+    for attempt in attempts:
+        attempt["start_ms"] = round(start, 2)
+        next_start = start + attempt_delay_ms
+        if attempt["status"] == "error":
+            next_start = min(next_start, start + attempt.pop("failed_ms"))
+        start = next_start
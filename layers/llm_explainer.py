@@ -1,55 +1,218 @@
-import subprocess
+import functools
+import hashlib
 import json
+import os
+import queue
+import threading
+from collections import OrderedDict
 
-def explain_with_llm(report_data: dict):
-    prompt = f"""
-You are a senior distributed systems engineer.
+from layers.diagnosis import rule_explanation
 
-Explain the following diagnostics:
+
+# Local model server speaking the Ollama /api/generate protocol
+LLM_URL = os.environ.get("NETSCOPE_LLM_URL", "http://127.0.0.1:11434")
+LLM_MODEL = os.environ.get("NETSCOPE_LLM_MODEL", "llama3")
+LLM_MAX_TOKENS = 300
+CONNECT_TIMEOUT = 2.0
+# Longest wait for the next token, not for the whole answer
+READ_TIMEOUT = 30.0
+
+# The fields of each layer the model gets to see
+PROMPT_FIELDS = {
+    "dns": ("status", "latency", "repeat_latency", "ttl", "cache.status", "error"),
+    "dns_profile": ("fastest",),
+    "ip": ("status", "latency_ms", "sampling.stats.loss_rate", "sampling.stats.p95", "error"),
+    "dual_stack": ("status", "family", "happy_eyeballs_ms", "fallback_penalty_ms", "families", "error"),
+    "traceroute": ("status", "reached", "error"),
+    "tcp": ("status", "connect_time_ms", "sampling.stats.p95", "error"),
+    "tls": ("status", "expired", "not_after", "error"),
+    "tls_handshake": ("status", "full_handshake_ms", "resumed_handshake_ms", "version", "session_reused", "error"),
+    "http": ("status", "timings", "transfer.status_code", "transfer.bytes_per_s", "error"),
+    "quic": ("status", "http_version", "total_time_ms", "tcp_time_ms", "error"),
+    "keepalive": ("status", "cold_ms.median", "warm_ms.median", "requests_per_sec", "reconnects", "error"),
+}
+
+PROMPT = """You are a senior distributed systems engineer.
+
+Explain these network diagnostics (JSON, times in ms):
 1. What was slow or failed
 2. Why it happened
 3. What to check next
 
-Diagnostics:
-{json.dumps(report_data, indent=2)}
-
 Be concise and technical.
-"""
 
-    try:
-        result = subprocess.run(
-            ["ollama", "run", "llama3"],
-            input=prompt.encode(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=30
-        )
-
-        if result.returncode != 0:
-            raise RuntimeError(result.stderr.decode())
-
-        return {
-            "status": "ok",
-            "text": result.stdout.decode()
-        }
+{diagnostics}"""
+
+CACHE_SIZE = 256
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
 
-    except Exception:
-        return {
-            "status": "fallback",
-            "text": fallback_explanation(report_data)
+def compact_diagnostics(report_data: dict):
+    """
+    Only the PROMPT_FIELDS of each layer, with latencies rounded to 0.1 ms.
+    """
+    compact = {}
+
+    for layer, result in report_data.items():
+        if not isinstance(result, dict) or layer not in PROMPT_FIELDS:
+            continue
+
+        fields = {}
+        for path in PROMPT_FIELDS[layer]:
+            value = result
+            for key in path.split("."):
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is not None:
+                fields[path] = _rounded(value, 1)
+        compact[layer] = fields
+
+    return compact
+
+
+def fingerprint(compact: dict):
+    """
+    Cache key for diagnostics: numbers are cut to two significant digits,
+    so runs that only differ by noise share an explanation.
+    """
+    normalised = json.dumps(_rounded(compact, None), sort_keys=True)
+    return hashlib.sha256(f"{LLM_MODEL}\n{normalised}".encode()).hexdigest()
+
+
+def explain_with_llm(report_data: dict, on_chunk=None, context: dict = None):
+    """
+    Explain the diagnostics with the local model, streaming each piece of
+    text to `on_chunk` as it arrives. Identical-looking diagnostics are
+    answered from cache; if the model server is unavailable the rule-based
+    explanation is used instead (`context` holds its extra inputs, such
+    as history baselines).
+
+    Returns:
+        {
+            status: "ok" | "cached" | "fallback" | "error",
+            text: str
         }
+    """
+    import requests
+
+    on_chunk = on_chunk or (lambda chunk: None)
+    compact = compact_diagnostics(report_data)
+    key = fingerprint(compact)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+
+    if cached is not None:
+        on_chunk(cached)
+        return {"status": "cached", "text": cached}
+
+    prompt = PROMPT.format(diagnostics=json.dumps(compact, separators=(",", ":")))
+    parts = []
+
+    try:
+        for chunk in _generate(prompt):
+            parts.append(chunk)
+            on_chunk(chunk)
+
+    except requests.RequestException as e:
+        if parts:
+            note = f"\n\n_(Explanation interrupted: {type(e).__name__})_"
+            on_chunk(note)
+            return {"status": "error", "text": "".join(parts) + note}
+
+        text = rule_explanation(report_data, context)
+        on_chunk(text)
+        return {"status": "fallback", "text": text}
+
+    text = "".join(parts)
+    with _cache_lock:
+        _cache[key] = text
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return {"status": "ok", "text": text}
+
+
+class BackgroundExplanation:
+    """
+    Runs explain_with_llm on a worker thread so the caller can keep
+    rendering. stream() yields the text as it arrives and `result` holds
+    the final explain_with_llm result once it is done.
+    """
+
+    def __init__(self, report_data: dict, context: dict = None):
+        self.result = None
+        self._chunks = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(report_data, context), daemon=True)
+        self._thread.start()
+
+    def _run(self, report_data, context):
+        try:
+            self.result = explain_with_llm(report_data, self._chunks.put, context)
+        except Exception as e:
+            self.result = {"status": "error", "text": str(e)}
+            self._chunks.put(self.result["text"])
+        finally:
+            self._chunks.put(None)
+
+    def stream(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+
+@functools.lru_cache(maxsize=None)
+def _session():
+    # One keep-alive connection pool for every request to the model server
+    import requests
+
+    return requests.Session()
+
+
+def _generate(prompt):
+    import requests
+
+    response = _session().post(
+        f"{LLM_URL}/api/generate",
+        json={
+            "model": LLM_MODEL,
+            "prompt": prompt,
+            "stream": True,
+            # Keep the model loaded between runs
+            "keep_alive": "10m",
+            "options": {"num_predict": LLM_MAX_TOKENS}
+        },
+        stream=True,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+    )
 
-def fallback_explanation(report_data):
-    notes = []
+    with response:
+        response.raise_for_status()
 
-    if "dns" in report_data:
-        if report_data["dns"]["cache"]["status"] == "cache_miss":
-            notes.append("DNS was slow due to a cache miss (recursive lookup).")
+        # One JSON object per line; reading to the end frees the connection for reuse
+        for line in response.iter_lines():
+            if not line:
+                continue
+            message = json.loads(line)
+            if message.get("error"):
+                raise requests.RequestException(message["error"])
+            if message.get("response"):
+                yield message["response"]
 
-    if "tcp" in report_data and report_data["tcp"]["connect_time_ms"] > 150:
-        notes.append("TCP handshake latency suggests network delay.")
 
-    if "http" in report_data and report_data["http"]["timings"]["total"] > 300:
-        notes.append("HTTP dominated total latency (backend slowness).")
+def _rounded(value, digits):
+    """
+    Round floats in `value` to `digits` decimals, or to two significant
+    digits when `digits` is None.
+    """
+    if isinstance(value, dict):
+        return {k: _rounded(v, digits) for k, v in value.items()}
+    if isinstance(value, float):
+        return round(value, digits) if digits is not None else float(f"{value:.2g}")
+    return value
 
-    return "\n".join(f"- {n}" for n in notes) or "No major issues detected."
@@ -1,55 +1,91 @@
+import functools
+import json
 import subprocess
-import time
+from concurrent.futures import ThreadPoolExecutor
 
+from layers.timing import SpanRecorder
 
-def quic_request(domain: str):
+
+# curl's own cumulative timers (seconds from the start of the transfer),
+# so process startup never counts towards a phase
+CURL_TIMERS = {
+    "namelookup": "time_namelookup",
+    "connect": "time_connect",
+    "appconnect": "time_appconnect",
+    "starttransfer": "time_starttransfer",
+    "total": "time_total",
+}
+
+PROTOCOL_FLAGS = {
+    "http3": "--http3",
+    "http1": "--http1.1",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def curl_features():
     """
-    Measure HTTP/3 (QUIC) request time using curl.
+    Features of the installed curl ("HTTP3", "HTTP2", ...), checked once
+    per process. Empty when curl is missing.
     """
+    try:
+        version = subprocess.run(
+            ["curl", "-V"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=5
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return frozenset()
 
-    # Check if curl supports HTTP/3
-    version = subprocess.run(
-        ["curl", "-V"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
+    for line in version.stdout.splitlines():
+        if line.startswith("Features:"):
+            return frozenset(line.split()[1:])
+    return frozenset()
 
-    if "HTTP3" not in version.stdout:
-        return {
-            "status": "unsupported",
-            "reason": "curl built without HTTP/3 support"
-        }
 
-    try:
-        start = time.time()
+def curl_probe(domain: str, protocol: str = "http3", timeout: float = 10):
+    """
+    One fresh-connection request with curl, timed by curl itself.
 
+    Returns:
+        {
+            status: "ok" | "error",
+            http_code, http_version,
+            timings: {namelookup, connect, appconnect, starttransfer, total}
+                (ms from the start of the transfer)
+        }
+    """
+    try:
         process = subprocess.run(
             [
                 "curl",
-                "--http3",
+                PROTOCOL_FLAGS[protocol],
                 "-s",
                 "-o",
                 "/dev/null",
+                "--max-time",
+                str(timeout),
                 "-w",
-                "%{http_code}",
+                "%{json}",
                 f"https://{domain}"
             ],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            timeout=10
+            timeout=timeout + 5
         )
-
-        total_time = (time.time() - start) * 1000
+        info = json.loads(process.stdout)
 
         if process.returncode != 0:
-            raise Exception(process.stderr.strip())
+            raise Exception(info.get("errormsg") or process.stderr.strip() or f"curl exit {process.returncode}")
 
         return {
             "status": "ok",
-            "http_code": process.stdout.strip(),
-            "total_time_ms": total_time
+            "http_code": str(info["http_code"]),
+            "http_version": info["http_version"],
+            "timings": {phase: info[timer] * 1000 for phase, timer in CURL_TIMERS.items()}
         }
 
     except Exception as e:
@@ -57,3 +93,77 @@ def quic_request(domain: str):
             "status": "error",
             "error": str(e)
         }
+
+
+def quic_request(domain: str, samples: int = 3, concurrency: int = 4, timeout: float = 10):
+    """
+    Compare HTTP/3 (QUIC) with HTTP/1.1 (TCP + TLS) using the same client.
+
+    `samples` fresh-connection requests per protocol run interleaved, at
+    most `concurrency` at a time. Phase timings are medians over the
+    successful samples of each protocol.
+
+    Returns:
+        {
+            status: "ok" | "unsupported" | "error",
+            http_code, http_version,
+            total_time_ms, tcp_time_ms,
+            timings, tcp_timings: {namelookup, connect, appconnect, starttransfer, total},
+            samples: {http3: [total ms | None], http1: [...]},
+            spans
+        }
+    """
+    if "HTTP3" not in curl_features():
+        return {
+            "status": "unsupported",
+            "reason": "curl built without HTTP/3 support"
+        }
+
+    recorder = SpanRecorder()
+    protocols = ["http3", "http1"] * samples
+
+    with recorder.span("quic_probes"):
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            probes = list(pool.map(lambda protocol: curl_probe(domain, protocol, timeout), protocols))
+
+    results = {
+        protocol: [p for proto, p in zip(protocols, probes) if proto == protocol]
+        for protocol in PROTOCOL_FLAGS
+    }
+    quic_ok = [p for p in results["http3"] if p["status"] == "ok"]
+    tcp_ok = [p for p in results["http1"] if p["status"] == "ok"]
+
+    if not quic_ok:
+        return {
+            "status": "error",
+            "error": results["http3"][0]["error"],
+            "spans": recorder.export()
+        }
+
+    timings = _median_timings(quic_ok)
+    tcp_timings = _median_timings(tcp_ok) if tcp_ok else None
+
+    return {
+        "status": "ok",
+        "http_code": quic_ok[0]["http_code"],
+        # Below 3 when curl fell back to TCP
+        "http_version": quic_ok[0]["http_version"],
+        "total_time_ms": timings["total"],
+        "tcp_time_ms": tcp_timings["total"] if tcp_timings else None,
+        "timings": timings,
+        "tcp_timings": tcp_timings,
+        "samples": {
+            protocol: [p["timings"]["total"] if p["status"] == "ok" else None for p in probes]
+            for protocol, probes in results.items()
+        },
+        "spans": recorder.export()
+    }
+
+
+def _median_timings(probes):
+    import numpy as np
+
+    return {
+        phase: float(np.median([p["timings"][phase] for p in probes]))
+        for phase in CURL_TIMERS
+    }
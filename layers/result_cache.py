@@ -0,0 +1,157 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+# Seconds a finished layer result is reused for by default
+DEFAULT_TTL = 60
+
+
+class ResultCache:
+    """
+    Finished layer results keyed by (domain, layer, options).
+
+    Each reader decides how old a result it accepts (`ttl`), so sessions
+    with different settings can share one cache. Concurrent requests for
+    the same key wait for a single probe instead of all probing. Results
+    are copied in and out, so callers may modify what they get.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_age: float = 3600):
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+        self._entries = OrderedDict()
+        self._running = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, ttl: float = DEFAULT_TTL):
+        """
+        (copy of the result, time.monotonic() it was stored) for `key` if
+        younger than `ttl` seconds, otherwise None.
+        """
+        with self._lock:
+            entry = self._fresh(key, ttl)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return copy.deepcopy(entry[0]), entry[1]
+
+    def put(self, key, result: dict, stored_at: float = None):
+        with self._lock:
+            self._store(key, copy.deepcopy(result), stored_at or time.monotonic())
+
+    def get_or_run(self, key, run, ttl: float = DEFAULT_TTL):
+        """
+        Cached result for `key`, or run `run()` and cache what it returns.
+
+        Returns:
+            (result, stored_at, probed: bool)
+        """
+        with self._lock:
+            entry = self._fresh(key, ttl)
+            if entry is not None:
+                self.hits += 1
+                return copy.deepcopy(entry[0]), entry[1], False
+
+            self.misses += 1
+            pending = self._running.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._running[key] = Future()
+
+        if not owner:
+            # Someone else is probing this key; share their result
+            result, stored_at = pending.result()
+            return copy.deepcopy(result), stored_at, False
+
+        try:
+            result = run()
+        except BaseException as e:
+            with self._lock:
+                del self._running[key]
+            pending.set_exception(e)
+            raise
+
+        stored_at = time.monotonic()
+        with self._lock:
+            self._store(key, copy.deepcopy(result), stored_at)
+            del self._running[key]
+        pending.set_result((copy.deepcopy(result), stored_at))
+        return result, stored_at, True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _fresh(self, key, ttl):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] >= min(ttl, self.max_age):
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, result, stored_at):
+        self._entries[key] = (result, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Shared by every session in the process
+default_cache = ResultCache()
+
+
+def cached_probes(probes, options: dict, ttl: float = DEFAULT_TTL, caches=(default_cache,),
+                  probed: set = None, replay: bool = False):
+    """
+    Wrap `probes` so each layer's result is looked up in `caches` (first
+    match wins, e.g. a session cache in front of default_cache) under
+    (domain, layer, options[layer]) before probing.
+
+    Layers that really probed are added to `probed`. With `replay` a
+    missing result is never probed; the layer returns
+    {"status": "not_run"} instead. Replays redraw what the front caches
+    hold (what this session last saw) whatever its age, so a `ttl` of 0
+    still means "always probe" only when probing.
+    """
+    wrapped = {}
+    front_ttl = float("inf") if replay else ttl
+
+    for name, probe in probes.items():
+        def cached(domain, upstream, name=name, probe=probe):
+            key = (domain.lower(), name, options.get(name))
+
+            for cache in caches[:-1]:
+                found = cache.lookup(key, front_ttl)
+                if found is not None:
+                    return found[0]
+
+            if replay:
+                found = caches[-1].lookup(key, ttl)
+                if found is None:
+                    return {"status": "not_run"}
+                (result, stored_at), fresh = found, False
+            else:
+                result, stored_at, fresh = caches[-1].get_or_run(key, lambda: probe(domain, upstream), ttl)
+
+            # Keep the original age so a result never outlives its TTL
+            for cache in caches[:-1]:
+                cache.put(key, result, stored_at)
+            if fresh and probed is not None:
+                probed.add(name)
+            return result
+
+        wrapped[name] = cached
+
+    return wrapped
@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import math
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Latency each sampled layer reports, or None when the probe failed
+SAMPLE_METRICS = {
+    "dns": lambda r: r["latency"] if r.get("status") == "ok" else None,
+    "ip": lambda r: r["latency_ms"] if r.get("status") == "reachable" else None,
+    "tcp": lambda r: r["connect_time_ms"] if r.get("status") == "ok" else None,
+    "http": lambda r: r["timings"]["total"] if r.get("status") == "ok" else None,
+}
+
+
+def run_metrics(results: dict):
+    """
+    Latency of every sampled layer in one run, None for a failed probe.
+    """
+    return {
+        layer: SAMPLE_METRICS[layer](result)
+        for layer, result in results.items()
+        if layer in SAMPLE_METRICS and isinstance(result, dict)
+    }
+
+
+def summarize(samples):
+    """
+    Latency statistics over samples in milliseconds, NaN marking a lost probe.
+
+    Accepts one run (1-D) or many runs stacked as rows (2-D) and computes
+    every statistic along the last axis, so a whole fleet is summarised in
+    a handful of array operations.
+
+    Returns:
+        {
+            count, lost: int,
+            loss_rate, min, median, p95, p99, mean, stddev, jitter: float
+        }
+    """
+    # numpy loads on the first sampled run, not with the app
+    import numpy as np
+
+    samples = np.asarray(samples, dtype=np.float64)
+    lost = np.isnan(samples).sum(axis=-1)
+    count = samples.shape[-1]
+
+    # A fully lost run is expected; don't warn about all-NaN rows
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        p50, p95, p99 = np.nanpercentile(samples, [50, 95, 99], axis=-1)
+        stats = {
+            "count": count,
+            "lost": lost,
+            "loss_rate": lost / count if count else np.nan,
+            "min": np.nanmin(samples, axis=-1),
+            "median": p50,
+            "p95": p95,
+            "p99": p99,
+            "mean": np.nanmean(samples, axis=-1),
+            "stddev": np.nanstd(samples, axis=-1),
+            # Mean absolute difference between consecutive samples (RFC 3550 style)
+            "jitter": np.nanmean(np.abs(np.diff(samples, axis=-1)), axis=-1),
+        }
+
+    if samples.ndim == 1:
+        return {key: _scalar(value) for key, value in stats.items()}
+    return stats
+
+
+def sample_layer(probe, layer: str, count: int, interval_ms: float = 0,
+                 concurrency: int = 1):
+    """
+    Run `probe()` `count` times, starting one every `interval_ms` with at
+    most `concurrency` in flight.
+
+    Returns the result closest to the median latency (so it renders like a
+    single probe) with a "sampling" section holding every sample and the
+    summary statistics.
+    """
+    results = [None] * count
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = []
+        for i in range(count):
+            delay = start + i * interval_ms / 1000 - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(contextvars.copy_context().run, _safe_probe, probe))
+
+        for i, future in enumerate(futures):
+            results[i] = future.result()
+
+    return _sampled_result(results, layer, interval_ms)
+
+
+async def sample_layer_async(probe, layer: str, count: int, interval_ms: float = 0,
+                             concurrency: int = 1):
+    """
+    Non-blocking variant of sample_layer; `probe()` returns an awaitable.
+    """
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(i):
+        await asyncio.sleep(i * interval_ms / 1000)
+        async with limit:
+            try:
+                return await probe()
+            except Exception as e:
+                return {"status": "error", "error": str(e) or type(e).__name__}
+
+    results = await asyncio.gather(*(one(i) for i in range(count)))
+    return _sampled_result(results, layer, interval_ms)
+
+
+def _safe_probe(probe):
+    try:
+        return probe()
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+
+def _sampled_result(results, layer, interval_ms):
+    import numpy as np
+
+    metric = SAMPLE_METRICS[layer]
+    samples = np.array(
+        [np.nan if (value := metric(r)) is None else value for r in results],
+        dtype=np.float64
+    )
+    stats = summarize(samples)
+
+    if stats["lost"] == len(results):
+        representative = dict(results[-1])
+    else:
+        index = int(np.nanargmin(np.abs(samples - stats["median"])))
+        representative = dict(results[index])
+
+    representative["sampling"] = {
+        "interval_ms": interval_ms,
+        "samples": [None if np.isnan(v) else float(v) for v in samples],
+        "stats": stats
+    }
+    return representative
+
+
+def _scalar(value):
+    value = value.item() if hasattr(value, "item") else value
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
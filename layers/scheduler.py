@@ -0,0 +1,184 @@
+import contextvars
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from layers.dns_layer import resolve_dns
+from layers.dns_profiler import profile_dns
+from layers.ip_layer import dual_stack_race, tcp_latency
+from layers.traceroute_layer import traceroute_host
+from layers.tcp_layer import tcp_handshake
+from layers.tls_layer import inspect_tls, tls_handshake_benchmark
+from layers.http_layer import http_request, http_keepalive_benchmark
+from layers.quic_layer import quic_request
+from layers.trace_layer import connection_trace, trace_section
+from layers.sampling import SAMPLE_METRICS, sample_layer
+
+
+DEFAULT_WORKERS = 4
+
+# Where the running probe's partial results go (see report_progress)
+_progress = contextvars.ContextVar("netscope_layer_progress", default=None)
+
+# Layers that must finish before a layer may start. Dependencies on layers
+# that are not enabled for a run are ignored.
+LAYER_DEPENDENCIES = {
+    "dns": (),
+    "dns_profile": ("dns",),
+    "ip": ("dns",),
+    "dual_stack": ("dns",),
+    "traceroute": (),
+    "tcp": ("dns",),
+    "tls": ("dns",),
+    "tls_handshake": ("tls",),
+    "http": ("dns",),
+    # QUIC and keep-alive run after HTTP so their requests don't compete with it
+    "quic": ("http",),
+    "keepalive": ("http",),
+}
+
+
+def resolved_ip(upstream: dict):
+    """
+    First address from a successful DNS result, or None.
+    """
+    dns = upstream.get("dns")
+    if dns and dns.get("status") == "ok" and dns.get("ips"):
+        return dns["ips"][0]
+    return None
+
+
+LAYER_PROBES = {
+    "dns": lambda domain, upstream: resolve_dns(domain),
+    "dns_profile": lambda domain, upstream: profile_dns(domain),
+    "ip": lambda domain, upstream: tcp_latency(resolved_ip(upstream) or domain),
+    "dual_stack": lambda domain, upstream: dual_stack_race(domain),
+    "traceroute": lambda domain, upstream: traceroute_host(
+        domain, on_hop=lambda hops: report_progress({"hops": hops})
+    ),
+    "tcp": lambda domain, upstream: tcp_handshake(resolved_ip(upstream) or domain, 80),
+    "tls": lambda domain, upstream: inspect_tls(domain, ip=resolved_ip(upstream)),
+    "tls_handshake": lambda domain, upstream: tls_handshake_benchmark(domain, ip=resolved_ip(upstream)),
+    "http": lambda domain, upstream: http_request(domain, ip=resolved_ip(upstream)),
+    "quic": lambda domain, upstream: quic_request(domain),
+    "keepalive": lambda domain, upstream: http_keepalive_benchmark(domain, ip=resolved_ip(upstream)),
+}
+
+
+# Layers that read from one shared connection trace in trace mode
+TRACED_LAYERS = ("ip", "tcp", "tls", "http")
+
+
+def traced_plan(probes=None):
+    """
+    Probes and dependencies for connection-trace mode: a single "trace"
+    layer makes one connection and the traced layers read their section
+    from it instead of connecting on their own.
+    """
+    probes = dict(probes or LAYER_PROBES)
+    dependencies = dict(LAYER_DEPENDENCIES)
+
+    probes["trace"] = lambda domain, upstream: connection_trace(
+        domain, ip=resolved_ip(upstream)
+    )
+    dependencies["trace"] = ("dns",)
+
+    for name in TRACED_LAYERS:
+        probes[name] = lambda domain, upstream, name=name: trace_section(upstream["trace"], name)
+        dependencies[name] = ("trace",)
+
+    return probes, dependencies
+
+
+def sampled_probes(probes, count: int, interval_ms: float = 0, concurrency: int = 1):
+    """
+    Wrap every layer with a latency metric so it takes `count` samples
+    instead of one. Layers read from a connection trace are left alone.
+    """
+    probes = dict(probes)
+
+    for name in SAMPLE_METRICS:
+        if name in probes:
+            probe = probes[name]
+            probes[name] = lambda domain, upstream, probe=probe, name=name: sample_layer(
+                lambda: probe(domain, upstream), name, count, interval_ms, concurrency
+            )
+
+    return probes
+
+
+def report_progress(partial: dict):
+    """
+    Called from inside a probe to stream an intermediate result. run_layers
+    yields it as (layer, {"status": "partial", ...}) ahead of the final
+    result; outside run_layers it is a no-op.
+    """
+    emit = _progress.get()
+    if emit:
+        emit(dict(partial, status="partial"))
+
+
+def _run_probe(probe, domain, upstream, emit):
+    token = _progress.set(emit)
+    try:
+        return probe(domain, upstream)
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+    finally:
+        _progress.reset(token)
+
+
+def run_layers(domain: str, layers, probes=None, max_workers: int = DEFAULT_WORKERS,
+               dependencies=None):
+    """
+    Run layers concurrently on a bounded worker pool.
+
+    Each layer starts as soon as the enabled layers it depends on have
+    finished and receives their results. Yields (layer, result) pairs in
+    completion order, preceded by any partial results the layer reported.
+    """
+    probes = probes or LAYER_PROBES
+    graph = dependencies or LAYER_DEPENDENCIES
+    layers = [name for name in layers if name in probes]
+
+    dependencies = {
+        name: tuple(d for d in graph.get(name, ()) if d in layers)
+        for name in layers
+    }
+
+    results = {}
+    pending = list(layers)
+    running = set()
+    # Partial results and finished futures, in the order they happened
+    events = queue.Queue()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+
+        def submit_ready():
+            for name in list(pending):
+                if all(d in results for d in dependencies[name]):
+                    pending.remove(name)
+                    upstream = {d: results[d] for d in dependencies[name]}
+                    emit = lambda partial, name=name: events.put((name, partial))
+                    # Probes see the caller's context, e.g. an active fault proxy
+                    future = pool.submit(contextvars.copy_context().run,
+                                         _run_probe, probes[name], domain, upstream, emit)
+                    future.add_done_callback(lambda f, name=name: events.put((name, f)))
+                    running.add(name)
+
+        submit_ready()
+
+        while running:
+            name, event = events.get()
+
+            if not isinstance(event, Future):
+                yield name, event
+                continue
+
+            running.remove(name)
+            results[name] = event.result()
+            yield name, results[name]
+
+            submit_ready()
@@ -1,5 +1,9 @@
+import asyncio
 import socket
-import time
+
+from layers.dns_cache import resolve_host, resolve_host_async
+from layers.fault_proxy import route, route_async
+from layers.timing import SpanRecorder
 
 
 def tcp_handshake(host: str, port: int = 80, timeout: float = 3.0):
@@ -13,18 +17,21 @@ def tcp_handshake(host: str, port: int = 80, timeout: float = 3.0):
         }
     """
     try:
+        ip = resolve_host(host)
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(timeout)
 
-        start = time.time()
-        sock.connect((host, port))
-        end = time.time()
+        recorder = SpanRecorder()
+        with recorder.span("tcp_handshake") as span:
+            sock.connect(route(ip, port, timeout))
 
         sock.close()
 
         return {
             "status": "ok",
-            "connect_time_ms": (end - start) * 1000
+            "ip": ip,
+            "connect_time_ms": span.duration_ms,
+            "spans": recorder.export()
         }
 
     except Exception as e:
@@ -32,3 +39,34 @@ def tcp_handshake(host: str, port: int = 80, timeout: float = 3.0):
             "status": "error",
             "error": str(e)
         }
+
+
+async def tcp_handshake_async(host: str, port: int = 80, timeout: float = 3.0):
+    """
+    Non-blocking variant of tcp_handshake on an event-loop socket.
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+
+    try:
+        ip = await resolve_host_async(host)
+        recorder = SpanRecorder()
+        with recorder.span("tcp_handshake") as span:
+            await asyncio.wait_for(loop.sock_connect(sock, await route_async(ip, port, timeout)), timeout)
+
+        return {
+            "status": "ok",
+            "ip": ip,
+            "connect_time_ms": span.duration_ms,
+            "spans": recorder.export()
+        }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e) or type(e).__name__
+        }
+
+    finally:
+        sock.close()
@@ -0,0 +1,111 @@
+import contextlib
+import contextvars
+import itertools
+import time
+
+
+# Innermost open span for the current thread / asyncio task
+_current_span = contextvars.ContextVar("netscope_current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+def now_ns():
+    """
+    Monotonic high-resolution clock shared by every probe.
+    """
+    return time.perf_counter_ns()
+
+
+class Span:
+    """
+    One timed phase on the shared monotonic clock.
+    """
+    __slots__ = ("id", "name", "parent", "start_ns", "end_ns")
+
+    def __init__(self, name: str, parent=None):
+        self.id = next(_span_ids)
+        self.name = name
+        self.parent = parent
+        self.start_ns = now_ns()
+        self.end_ns = None
+
+    @property
+    def duration_ns(self):
+        return (self.end_ns or now_ns()) - self.start_ns
+
+    @property
+    def duration_ms(self):
+        return self.duration_ns / 1e6
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "parent": self.parent,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns
+        }
+
+
+class SpanRecorder:
+    """
+    Collects the spans of one probe. Spans opened inside another span
+    (in the same thread or task) record it as their parent.
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        parent = _current_span.get()
+        span = Span(name, parent.id if parent else None)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            span.end_ns = now_ns()
+            _current_span.reset(token)
+            self.spans.append(span)
+
+    def record(self, name: str, start_ns: int, end_ns: int):
+        """
+        Add a span from timestamps taken with now_ns(), for phases that are
+        only known after the fact (e.g. first byte of a response).
+        """
+        parent = _current_span.get()
+        span = Span(name, parent.id if parent else None)
+        span.start_ns = start_ns
+        span.end_ns = end_ns
+        self.spans.append(span)
+        return span
+
+    def export(self):
+        return [span.to_dict() for span in sorted(self.spans, key=lambda s: s.start_ns)]
+
+
+def union_ns(spans):
+    """
+    Time covered by at least one of `spans` (dicts with start_ns/end_ns).
+    """
+    covered = 0
+    edge = None
+
+    for start, end in sorted((s["start_ns"], s["end_ns"]) for s in spans if s["end_ns"]):
+        if edge is None or start > edge:
+            covered += end - start
+            edge = end
+        elif end > edge:
+            covered += end - edge
+            edge = end
+
+    return covered
+
+
+def overlap_ns(spans):
+    """
+    Time saved by running `spans` concurrently: their summed durations
+    minus the time they actually covered.
+    """
+    total = sum(s["end_ns"] - s["start_ns"] for s in spans if s["end_ns"])
+    return total - union_ns(spans)
@@ -1,11 +1,19 @@
+import asyncio
 import ssl
 import socket
 import datetime
+import time
 
+from layers.dns_cache import resolve_host, resolve_host_async
+from layers.fault_proxy import route, route_async
+from layers.http_response import read_response
+from layers.timing import SpanRecorder
 
-def inspect_tls(domain: str, port: int = 443, timeout: float = 3.0):
+
+def inspect_tls(domain: str, port: int = 443, timeout: float = 3.0, ip: str = None):
     """
     Inspect TLS certificate of a server.
+    Connects to `ip` when the address is already resolved.
 
     Returns:
         {
@@ -17,36 +25,194 @@ def inspect_tls(domain: str, port: int = 443, timeout: float = 3.0):
             expired: bool
         }
     """
+    recorder = SpanRecorder()
     try:
         context = ssl.create_default_context()
+        ip = ip or resolve_host(domain)
 
-        with socket.create_connection((domain, port), timeout=timeout) as sock:
-            with context.wrap_socket(sock, server_hostname=domain) as ssock:
-                cert = ssock.getpeercert()
+        with recorder.span("tls_inspect"):
+            with recorder.span("tcp_connect"):
+                sock = socket.create_connection(route(ip, port, timeout), timeout=timeout)
+            with sock, recorder.span("tls_handshake"):
+                with context.wrap_socket(sock, server_hostname=domain) as ssock:
+                    cert = ssock.getpeercert()
 
-        not_before = datetime.datetime.strptime(
-            cert["notBefore"], "%b %d %H:%M:%S %Y %Z"
-        )
-        not_after = datetime.datetime.strptime(
-            cert["notAfter"], "%b %d %H:%M:%S %Y %Z"
-        )
+        return dict(certificate_summary(cert), ip=ip, spans=recorder.export())
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+
+
+async def inspect_tls_async(domain: str, port: int = 443, timeout: float = 3.0, ip: str = None):
+    """
+    Non-blocking variant of inspect_tls with the same result shape.
+    """
+    recorder = SpanRecorder()
+    try:
+        context = ssl.create_default_context()
+        ip = ip or await resolve_host_async(domain)
 
-        now = datetime.datetime.utcnow()
+        with recorder.span("tls_inspect"):
+            with recorder.span("tcp_connect"):
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(*await route_async(ip, port, timeout)), timeout
+                )
+            try:
+                with recorder.span("tls_handshake"):
+                    await asyncio.wait_for(
+                        writer.start_tls(context, server_hostname=domain), timeout
+                    )
+                cert = writer.get_extra_info("peercert")
+            finally:
+                writer.close()
 
-        subject = dict(x[0] for x in cert["subject"])
-        issuer = dict(x[0] for x in cert["issuer"])
+        return dict(certificate_summary(cert), ip=ip, spans=recorder.export())
 
+    except Exception as e:
         return {
-            "status": "ok",
-            "subject": subject.get("commonName", "Unknown"),
-            "issuer": issuer.get("commonName", "Unknown"),
-            "not_before": not_before.strftime("%Y-%m-%d"),
-            "not_after": not_after.strftime("%Y-%m-%d"),
-            "expired": now > not_after
+            "status": "error",
+            "error": str(e) or type(e).__name__
         }
 
+
+def tls_handshake_benchmark(domain: str, port: int = 443, timeout: float = 5.0, ip: str = None):
+    """
+    Time a full TLS handshake, then a resumed one reusing the session
+    from the first connection.
+
+    Python's ssl module cannot send 0-RTT early data or read a stapled
+    OCSP response, so those are reported as unavailable rather than
+    guessed.
+
+    Returns:
+        {
+            status: "ok" | "error",
+            full_handshake_ms, resumed_handshake_ms, saved_ms: float,
+            session_reused: bool,
+            version, cipher, alpn: str,
+            chain_certs, chain_bytes: int | None (None where the
+                interpreter can't expose the chain)
+        }
+    """
+    recorder = SpanRecorder()
+    context = ssl.create_default_context()
+    context.set_alpn_protocols(["h2", "http/1.1"])
+
+    try:
+        ip = ip or resolve_host(domain)
+
+        with recorder.span("tls_full"):
+            ssock, full_ms, full_cpu_ms = _timed_handshake(
+                context, domain, ip, port, timeout, recorder
+            )
+            with ssock:
+                details = _negotiated(ssock)
+                # TLS 1.3 tickets arrive after the handshake, so complete
+                # one exchange before taking the session
+                _exchange_once(ssock, domain, details["alpn"])
+                session = ssock.session
+
+        with recorder.span("tls_resumed"):
+            resumed, resumed_ms, resumed_cpu_ms = _timed_handshake(
+                context, domain, ip, port, timeout, recorder, session
+            )
+            with resumed:
+                reused = resumed.session_reused
+
     except Exception as e:
         return {
             "status": "error",
             "error": str(e)
         }
+
+    return dict(
+        details,
+        status="ok",
+        ip=ip,
+        full_handshake_ms=full_ms,
+        full_handshake_cpu_ms=full_cpu_ms,
+        resumed_handshake_ms=resumed_ms,
+        resumed_handshake_cpu_ms=resumed_cpu_ms,
+        saved_ms=full_ms - resumed_ms if reused else 0.0,
+        session_ticket=bool(session and session.has_ticket),
+        session_reused=reused,
+        early_data="unsupported by client",
+        ocsp_stapled=None,
+        spans=recorder.export()
+    )
+
+
+# HTTP/2 client preface followed by an empty SETTINGS frame
+H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n" + b"\x00\x00\x00\x04\x00\x00\x00\x00\x00"
+
+
+def _exchange_once(ssock, domain, alpn):
+    if alpn == "h2":
+        ssock.sendall(H2_PREFACE)
+        ssock.recv(4096)
+    else:
+        ssock.sendall(
+            f"HEAD / HTTP/1.1\r\nHost: {domain}\r\nConnection: close\r\n\r\n".encode()
+        )
+        read_response(ssock, head_request=True)
+
+
+def _timed_handshake(context, domain, address, port, timeout, recorder, session=None):
+    with recorder.span("tcp_connect"):
+        sock = socket.create_connection(route(address, port, timeout), timeout=timeout)
+
+    try:
+        cpu_start = time.thread_time_ns()
+        with recorder.span("tls_handshake") as span:
+            ssock = context.wrap_socket(sock, server_hostname=domain, session=session)
+        cpu_ms = (time.thread_time_ns() - cpu_start) / 1e6
+    except Exception:
+        sock.close()
+        raise
+
+    return ssock, span.duration_ms, cpu_ms
+
+
+def _negotiated(ssock):
+    cipher = ssock.cipher()
+
+    # get_verified_chain (DER bytes) is public from Python 3.13; older
+    # versions only expose the leaf certificate, so the chain is unknown
+    get_chain = getattr(ssock, "get_verified_chain", None)
+    chain = get_chain() if get_chain else None
+
+    return {
+        "version": ssock.version(),
+        "cipher": cipher[0] if cipher else None,
+        "cipher_bits": cipher[2] if cipher else None,
+        "alpn": ssock.selected_alpn_protocol(),
+        "chain_certs": len(chain) if chain is not None else None,
+        "chain_bytes": sum(len(cert) for cert in chain) if chain is not None else None,
+        "chain_complete": chain is not None
+    }
+
+
+def certificate_summary(cert):
+    not_before = datetime.datetime.strptime(
+        cert["notBefore"], "%b %d %H:%M:%S %Y %Z"
+    )
+    not_after = datetime.datetime.strptime(
+        cert["notAfter"], "%b %d %H:%M:%S %Y %Z"
+    )
+
+    now = datetime.datetime.utcnow()
+
+    subject = dict(x[0] for x in cert["subject"])
+    issuer = dict(x[0] for x in cert["issuer"])
+
+    return {
+        "status": "ok",
+        "subject": subject.get("commonName", "Unknown"),
+        "issuer": issuer.get("commonName", "Unknown"),
+        "not_before": not_before.strftime("%Y-%m-%d"),
+        "not_after": not_after.strftime("%Y-%m-%d"),
+        "expired": now > not_after
+    }
@@ -0,0 +1,72 @@
+from layers.http_layer import https_exchange
+from layers.tls_layer import certificate_summary
+
+
+def connection_trace(domain: str, path: str = "/", port: int = 443, ip: str = None):
+    """
+    Trace a single HTTPS connection and derive the IP, TCP, TLS and HTTP
+    sections from it, so one connect, one TLS handshake and one HTTP
+    exchange back every per-phase number.
+
+    Returns:
+        {
+            status: "ok" | "error",
+            ip, tcp, tls, http: layer results in their usual shapes
+        }
+    """
+    try:
+        exchange = https_exchange(domain, path, port, ip)
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
+
+    timings = exchange["timings"]
+    spans = exchange["spans"]
+
+    def phase_spans(name):
+        return [span for span in spans if span["name"] == name]
+
+    tls = certificate_summary(exchange["cert"])
+    tls["handshake_ms"] = timings["tls"]
+    tls["spans"] = phase_spans("tls")
+
+    return {
+        "status": "ok",
+        "ip": {
+            "status": "reachable",
+            "latency_ms": round(timings["tcp"], 2),
+            "method": "connection_trace",
+            "port": port,
+            "spans": phase_spans("tcp")
+        },
+        "tcp": {
+            "status": "ok",
+            "connect_time_ms": timings["tcp"],
+            "port": port,
+            "spans": phase_spans("tcp")
+        },
+        "tls": tls,
+        "http": {
+            "status": "ok",
+            "ip": exchange["ip"],
+            "status_line": exchange["status_line"],
+            "timings": timings,
+            "transfer": exchange["transfer"],
+            "spans": spans
+        }
+    }
+
+
+def trace_section(trace: dict, layer: str):
+    """
+    One layer's result from a connection trace, or the trace error.
+    """
+    if trace.get("status") != "ok":
+        return {
+            "status": "error",
+            "error": trace.get("error", "Connection trace failed")
+        }
+
+    return dict(trace[layer], source="connection_trace")
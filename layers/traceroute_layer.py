@@ -1,38 +1,231 @@
+import select
+import socket
+import struct
 import subprocess
+import sys
 import re
+import time
+
+from layers.dns_cache import resolve_host
+from layers.timing import SpanRecorder, now_ns
+
+
+BASE_PORT = 33434
+
+# <linux/in.h>; the socket module does not export it
+IP_RECVERR = getattr(socket, "IP_RECVERR", 11)
+
+# <linux/errqueue.h>: struct sock_extended_err, then the offender sockaddr_in
+_EXTENDED_ERR = struct.Struct("=IBBBBII")
+_SO_EE_ORIGIN_ICMP = 2
+_ICMP_DEST_UNREACH = 3
+_ICMP_PORT_UNREACH = 3
+
+# How long the system traceroute waits for each probe's reply
+PROBE_WAIT_S = 1.0
+
+
+def traceroute_host(host, max_hops=15, deadline=5.0, probes_per_hop=3, on_hop=None):
+    """
+    Discover the path to `host`, preferring the in-process UDP prober and
+    falling back to the system traceroute where it is unavailable.
+    `on_hop(hops)` receives the hops found so far as they arrive. Both
+    stop after `deadline` seconds overall.
+    """
+    started = time.monotonic()
+    try:
+        return udp_traceroute(host, max_hops, deadline, probes_per_hop, on_hop)
+    except OSError:
+        remaining = max(0.0, deadline - (time.monotonic() - started))
+        return _subprocess_traceroute(host, max_hops, probes_per_hop, remaining)
+
+
+def udp_traceroute(host, max_hops=15, deadline=5.0, probes_per_hop=3, on_hop=None):
+    """
+    Unprivileged UDP path prober (Linux).
+
+    Sends every TTL's probes at once and reads the ICMP replies from each
+    socket's error queue (IP_RECVERR), so no raw sockets are needed and
+    hops are timed individually as their replies arrive. Stops at the
+    destination or after `deadline` seconds; silent hops are kept as "*".
+    """
+    if not sys.platform.startswith("linux"):
+        raise OSError("The UDP prober needs Linux IP_RECVERR")
+
+    recorder = SpanRecorder()
+    ip = resolve_host(host)
+
+    sockets = {}
+    sent = {}
+    replies = {}
+    poller = select.poll()
 
-def traceroute_host(host, max_hops=15):
     try:
-        process = subprocess.run(
-            ["traceroute", "-m", str(max_hops), host],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        if process.returncode != 0:
+        with recorder.span("traceroute"):
+            for ttl in range(1, max_hops + 1):
+                for probe in range(probes_per_hop):
+                    # One socket per probe: a queued error would fail the next send
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    sockets[sock.fileno()] = (ttl, sock)
+                    sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+                    sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+                    sock.setblocking(False)
+                    poller.register(sock, select.POLLERR)
+
+                    # The payload comes back with the error, identifying the probe
+                    sent[(ttl, probe)] = now_ns()
+                    sock.sendto(struct.pack("!HH", ttl, probe), (ip, BASE_PORT + ttl))
+
+            end_ns = now_ns() + int(deadline * 1e9)
+            destination = None
+
+            while now_ns() < end_ns and not _finished(replies, sent, destination, probes_per_hop):
+                timeout_ms = max(0, (end_ns - now_ns()) // 1_000_000)
+                for fd, _ in poller.poll(timeout_ms):
+                    ttl, sock = sockets[fd]
+                    reply = _read_error(sock, sent, ip)
+                    if reply is None:
+                        continue
+
+                    replies.setdefault(ttl, []).append(reply)
+                    if reply["reached"] and (destination is None or ttl < destination):
+                        destination = ttl
+
+                    if on_hop and ttl <= (destination or max_hops):
+                        on_hop(_hops(replies, destination or max_hops))
+
+    finally:
+        for _, sock in sockets.values():
+            sock.close()
+
+    return {
+        "status": "ok",
+        "method": "udp_recverr",
+        "ip": ip,
+        "reached": destination is not None,
+        "hops": _hops(replies, destination or max_hops),
+        "spans": recorder.export()
+    }
+
+
+def _read_error(sock, sent, ip):
+    try:
+        data, ancillary, _, _ = sock.recvmsg(64, 512, socket.MSG_ERRQUEUE)
+    except (BlockingIOError, InterruptedError):
+        return None
+    received = now_ns()
+
+    for level, kind, payload in ancillary:
+        if level != socket.IPPROTO_IP or kind != IP_RECVERR:
+            continue
+
+        _, origin, icmp_type, icmp_code, _, _, _ = _EXTENDED_ERR.unpack_from(payload)
+        if origin != _SO_EE_ORIGIN_ICMP or len(data) < 4:
+            continue
+
+        ttl, probe = struct.unpack_from("!HH", data)
+        if (ttl, probe) not in sent:
+            continue
+
+        offender = socket.inet_ntoa(payload[_EXTENDED_ERR.size + 4:_EXTENDED_ERR.size + 8])
+
+        return {
+            "ip": offender,
+            "rtt": (received - sent[(ttl, probe)]) / 1e6,
+            # Only the destination answers an unused UDP port with "port
+            # unreachable"; net/host/admin unreachable come from routers
+            "reached": (icmp_type, icmp_code) == (_ICMP_DEST_UNREACH, _ICMP_PORT_UNREACH)
+                       and offender == ip,
+            "icmp": (icmp_type, icmp_code)
+        }
+
+    return None
+
+
+def _finished(replies, sent, destination, probes_per_hop):
+    last = destination or max(ttl for ttl, _ in sent)
+    return all(len(replies.get(ttl, ())) >= probes_per_hop for ttl in range(1, last + 1))
+
+
+def _hops(replies, last):
+    hops = []
+    for ttl in range(1, last + 1):
+        answers = replies.get(ttl)
+        if answers:
+            rtts = [a["rtt"] for a in answers]
+            hops.append({
+                "hop": ttl,
+                "host": answers[0]["ip"],
+                "ip": answers[0]["ip"],
+                "latency": min(rtts),
+                "rtts": rtts
+            })
+        else:
+            hops.append({"hop": ttl, "host": "*", "ip": None, "latency": None, "rtts": []})
+    return hops
+
+
+def _subprocess_traceroute(host, max_hops, probes_per_hop=3, deadline=None):
+    """
+    System traceroute with a per-probe wait of PROBE_WAIT_S. It is given
+    long enough for every hop to time out, or `deadline` seconds if that
+    is shorter; if it overruns, the hops printed so far are kept.
+    """
+    recorder = SpanRecorder()
+    timeout = max_hops * probes_per_hop * PROBE_WAIT_S
+    if deadline is not None:
+        timeout = min(timeout, deadline)
+    try:
+        with recorder.span("traceroute"):
+            try:
+                process = subprocess.run(
+                    ["traceroute", "-m", str(max_hops), "-q", str(probes_per_hop),
+                     "-w", str(PROBE_WAIT_S), host],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    timeout=timeout
+                )
+                output, complete = process.stdout, True
+            except subprocess.TimeoutExpired as e:
+                # On POSIX the partial output comes back as bytes
+                output = e.stdout or ""
+                if isinstance(output, bytes):
+                    output = output.decode(errors="replace")
+                process, complete = None, False
+
+        if process is not None and process.returncode != 0:
             raise Exception(process.stderr)
 
         hops = []
 
-        for line in process.stdout.splitlines():
-            match = re.match(r"\s*(\d+)\s+(.+?)\s+\(([\d\.]+)\)\s+([\d\.]+)\s+ms", line)
-            if match:
-                hop_num = int(match.group(1))
-                host_name = match.group(2)
-                ip = match.group(3)
-                latency = float(match.group(4))
-
-                hops.append({
-                    "hop": hop_num,
-                    "host": host_name,
-                    "ip": ip,
-                    "latency": latency
-                })
+        for line in output.splitlines():
+            match = re.match(r"\s*(\d+)\s+(.*)", line)
+            if not match:
+                continue
+
+            hop_num = int(match.group(1))
+            rest = match.group(2)
+            named = re.search(r"(\S+)\s+\(([\d\.]+)\)", rest)
+            rtts = [float(v) for v in re.findall(r"([\d\.]+)\s+ms", rest)]
+
+            hops.append({
+                "hop": hop_num,
+                "host": named.group(1) if named else "*",
+                "ip": named.group(2) if named else None,
+                "latency": min(rtts) if rtts else None,
+                "rtts": rtts
+            })
+
+        if not hops and not complete:
+            raise Exception(f"traceroute printed no hops within {timeout:g} s")
 
         return {
             "status": "ok",
-            "hops": hops
+            "method": "traceroute",
+            "complete": complete,
+            "hops": hops,
+            "spans": recorder.export()
         }
 
     except Exception as e:
@@ -0,0 +1,199 @@
+"""
+Continuous monitor.
+
+Probes every target on its own interval and appends each run's latencies
+to the rolling time-series store the app charts as history. Start times
+are jittered so targets sharing an interval don't fire together, and old
+points are rolled up into 1-minute / 1-hour buckets as they age. Every
+run also updates the per-domain baselines and is judged against them;
+slow layers are flagged in the output.
+
+    python monitor.py targets.txt --interval 60 --jitter 0.1 --store netscope_data
+
+As an agent (--collector HOST:PORT --region NAME) every run is also
+pushed to a central collector.py, which merges agents by region.
+
+Target lines are "domain [interval_seconds]"; # starts a comment.
+"""
+import argparse
+import asyncio
+import heapq
+import random
+import signal
+import sys
+import time
+
+from batch import BATCH_LAYERS, ProbeLimiter, analyze_domain
+from layers.sampling import run_metrics
+from reports.baseline import DEFAULT_BASELINE_PATH, BaselineStore
+from reports.regions import DEFAULT_COLLECTOR_PORT, CollectorClient
+from reports.timeseries import DEFAULT_STORE_PATH, TimeSeriesStore
+
+
+COMPACT_EVERY_S = 3600
+BASELINE_SAVE_S = 60
+
+# Wall-clock time anchored to the monotonic clock, so run timestamps never
+# step backwards when the system clock does
+_EPOCH_OFFSET = time.time() - time.monotonic()
+
+
+def read_targets(stream, default_interval: float):
+    """
+    (domain, interval_seconds) for every target line.
+    """
+    for line in stream:
+        fields = line.split("#", 1)[0].split()
+        if fields:
+            yield fields[0], float(fields[1]) if len(fields) > 1 else default_interval
+
+
+async def probe_target(domain, layers, limiter, timeout, store, baselines, client=None):
+    report = await analyze_domain(domain, layers, limiter, timeout)
+    metrics = run_metrics(report["results"])
+    now = wall_time()
+    if not store.append(domain, now, metrics):
+        # Behind data already rolled up, e.g. from a run whose clock was ahead
+        print(f"{domain}: run older than the stored history, not stored", file=sys.stderr)
+    verdicts = baselines.observe(domain, metrics)
+    if client is not None:
+        client.push(domain, now, metrics)
+
+    print(
+        f"{domain}: " + " ".join(
+            f"{name}={'lost' if value is None else f'{value:.1f}ms'}"
+            + _flag(verdicts.get(name))
+            for name, value in metrics.items()
+        ),
+        file=sys.stderr
+    )
+
+
+def wall_time():
+    return _EPOCH_OFFSET + time.monotonic()
+
+
+def _flag(verdict):
+    if verdict is None or verdict["verdict"] in ("normal", "learning"):
+        return ""
+    return f"[{verdict['verdict'].upper()} p95={verdict['p95']:.1f}ms]"
+
+
+async def monitor(targets, store: TimeSeriesStore, layers=BATCH_LAYERS, jitter: float = 0.1,
+                  timeout: float = 5.0, concurrency: int = 50, stop: asyncio.Event = None,
+                  baselines: BaselineStore = None, client: CollectorClient = None):
+    """
+    Probe `targets` [(domain, interval_seconds)] until `stop` is set.
+
+    Each target's next run is its interval after the last one, give or
+    take `jitter` (a fraction of the interval). A target whose previous
+    run is still going skips its turn rather than piling up. Runs are
+    also pushed to `client` when given.
+    """
+    stop = stop or asyncio.Event()
+    baselines = baselines or BaselineStore()
+    limiter = ProbeLimiter(concurrency, 2)
+    running = {}
+
+    # Spread first runs over one interval instead of firing all at once
+    now = time.monotonic()
+    due = [(now + random.uniform(0, interval), domain, interval) for domain, interval in targets]
+    heapq.heapify(due)
+    next_compact = now + COMPACT_EVERY_S
+    next_save = now + BASELINE_SAVE_S
+
+    while due and not stop.is_set():
+        at, domain, interval = due[0]
+        wait = min(at, next_compact, next_save) - time.monotonic()
+
+        if wait > 0:
+            try:
+                await asyncio.wait_for(stop.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        if time.monotonic() >= next_compact:
+            rolled = await asyncio.to_thread(store.compact)
+            print(f"Compacted {rolled} points", file=sys.stderr)
+            next_compact += COMPACT_EVERY_S
+            continue
+
+        if time.monotonic() >= next_save:
+            await asyncio.to_thread(baselines.save)
+            next_save += BASELINE_SAVE_S
+            continue
+
+        heapq.heapreplace(due, (at + interval * (1 + random.uniform(-jitter, jitter)), domain, interval))
+
+        if domain in running:
+            continue
+
+        task = asyncio.create_task(probe_target(domain, layers, limiter, timeout, store, baselines, client))
+        running[domain] = task
+        task.add_done_callback(lambda _, domain=domain: running.pop(domain, None))
+
+    if running:
+        await asyncio.gather(*running.values(), return_exceptions=True)
+    baselines.save()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NetScope continuous monitor")
+    parser.add_argument("targets", nargs="?", default="-",
+                        help="file with one target per line, or - for stdin")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH,
+                        help="time-series store directory")
+    parser.add_argument("--baselines", default=DEFAULT_BASELINE_PATH,
+                        help="baseline file shared with the app")
+    parser.add_argument("--interval", type=float, default=60,
+                        help="default seconds between runs of a target")
+    parser.add_argument("--jitter", type=float, default=0.1,
+                        help="random spread of each interval, as a fraction")
+    parser.add_argument("--layers", default=",".join(BATCH_LAYERS),
+                        help="comma separated subset of: " + ", ".join(BATCH_LAYERS))
+    parser.add_argument("--concurrency", type=int, default=50,
+                        help="global limit on probes in flight")
+    parser.add_argument("--timeout", type=float, default=5.0,
+                        help="per-probe timeout in seconds")
+    parser.add_argument("--collector", default=None,
+                        help=f"HOST[:PORT] of a collector to push runs to (port {DEFAULT_COLLECTOR_PORT})")
+    parser.add_argument("--region", default="local",
+                        help="region name this agent reports as")
+    args = parser.parse_args(argv)
+
+    layers = [name for name in args.layers.split(",") if name]
+    unknown = set(layers) - set(BATCH_LAYERS)
+    if unknown:
+        parser.error(f"unknown layers: {', '.join(sorted(unknown))}")
+
+    source = sys.stdin if args.targets == "-" else open(args.targets)
+    with source:
+        targets = list(read_targets(source, args.interval))
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        client = pusher = None
+        if args.collector:
+            host, _, port = args.collector.partition(":")
+            client = CollectorClient(host, int(port or DEFAULT_COLLECTOR_PORT), args.region)
+            pusher = asyncio.create_task(client.run(stop))
+
+        await monitor(targets, TimeSeriesStore(args.store), layers,
+                      args.jitter, args.timeout, args.concurrency, stop,
+                      BaselineStore(args.baselines), client)
+
+        if pusher is not None:
+            # Ship what is still buffered before exiting
+            await pusher
+
+    print(f"NetScope monitor: {len(targets)} targets -> {args.store}", file=sys.stderr)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import contextlib
+import fcntl
+import json
+import math
+import os
+import threading
+
+
+DEFAULT_BASELINE_PATH = os.environ.get("NETSCOPE_BASELINES", "netscope_baselines.json")
+
+EWMA_ALPHA = 0.1
+# Samples a baseline needs before it judges anything
+MIN_SAMPLES = 20
+ELEVATED_Z = 2.0
+ANOMALY_Z = 3.0
+# Differences below this are noise however steady the history is
+MIN_DELTA_MS = 1.0
+
+
+class P2Quantile:
+    """
+    Streaming estimate of one quantile in constant space (the P² algorithm,
+    Jain & Chlamtac 1985): five markers track the minimum, the quantile,
+    the maximum and the points halfway between, and are nudged towards
+    their ideal positions with a parabolic fit as samples arrive.
+    """
+
+    def __init__(self, q: float):
+        self.q = q
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self.increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def add(self, x: float):
+        h, n = self.heights, self.positions
+
+        if len(h) < 5:
+            h.append(x)
+            h.sort()
+            return
+
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if h[i] <= x < h[i + 1])
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not h[i - 1] < height < h[i + 1]:
+                    height = h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+                h[i] = height
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        h, n = self.heights, self.positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    @property
+    def value(self):
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            # Too few samples for the markers; nearest rank
+            return self.heights[min(len(self.heights) - 1, int(self.q * len(self.heights)))]
+        return self.heights[2]
+
+    def to_dict(self):
+        return {
+            "q": self.q,
+            # Copies: update() changes the markers in place
+            "heights": list(self.heights),
+            "positions": list(self.positions),
+            "desired": list(self.desired)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        estimator = cls(data["q"])
+        estimator.heights = data["heights"]
+        estimator.positions = data["positions"]
+        estimator.desired = data["desired"]
+        return estimator
+
+
+class Baseline:
+    """
+    What is normal for one (domain, layer) latency: an exponentially
+    weighted mean and variance plus streaming p50 / p95, all updated in
+    O(1) per sample.
+    """
+
+    def __init__(self, alpha: float = EWMA_ALPHA):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.p50 = P2Quantile(0.5)
+        self.p95 = P2Quantile(0.95)
+
+    def update(self, x: float):
+        if self.count == 0:
+            self.mean = x
+        else:
+            diff = x - self.mean
+            step = self.alpha * diff
+            self.mean += step
+            self.var = (1 - self.alpha) * (self.var + diff * step)
+
+        self.count += 1
+        self.p50.add(x)
+        self.p95.add(x)
+
+    def judge(self, x: float):
+        """
+        Verdict on `x` against this history, only flagging the slow side:
+        "learning" until MIN_SAMPLES, then "anomalous" when above p95 and
+        ANOMALY_Z deviations over the mean, "elevated" when either holds,
+        otherwise "normal".
+
+        Returns:
+            {verdict, mean, p50, p95, z, count}
+        """
+        std = math.sqrt(self.var)
+        delta = x - self.mean
+        z = delta / std if std > 0 else (math.inf if delta > 0 else 0.0)
+        p95 = self.p95.value
+
+        if self.count < MIN_SAMPLES:
+            verdict = "learning"
+        elif delta < MIN_DELTA_MS:
+            verdict = "normal"
+        elif x > p95 and z >= ANOMALY_Z:
+            verdict = "anomalous"
+        elif x > p95 or z >= ELEVATED_Z:
+            verdict = "elevated"
+        else:
+            verdict = "normal"
+
+        return {
+            "verdict": verdict,
+            "mean": self.mean,
+            "p50": self.p50.value,
+            "p95": p95,
+            "z": None if math.isinf(z) else z,
+            "count": self.count
+        }
+
+    def to_dict(self):
+        return {
+            "alpha": self.alpha,
+            "count": self.count,
+            "mean": self.mean,
+            "var": self.var,
+            "p50": self.p50.to_dict(),
+            "p95": self.p95.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        baseline = cls(data["alpha"])
+        baseline.count = data["count"]
+        baseline.mean = data["mean"]
+        baseline.var = data["var"]
+        baseline.p50 = P2Quantile.from_dict(data["p50"])
+        baseline.p95 = P2Quantile.from_dict(data["p95"])
+        return baseline
+
+
+class BaselineStore:
+    """
+    Baselines for every (domain, layer), kept in one JSON file.
+
+    observe() judges a run against the history and then learns from it in
+    memory; save() writes back only the baselines this process changed,
+    so the app and the monitor can share the file. save() may run on
+    another thread than observe().
+    """
+
+    def __init__(self, path: str = DEFAULT_BASELINE_PATH):
+        self.path = path
+        self._baselines = self._load()
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def judge(self, domain: str, layer: str, value: float):
+        baseline = self._baselines.get(domain, {}).get(layer)
+        if baseline is None:
+            return {"verdict": "learning", "mean": None, "p50": None, "p95": None, "z": None, "count": 0}
+        return baseline.judge(value)
+
+    def judge_all(self, domain: str, latencies: dict):
+        """
+        Verdicts for one run's {layer: latency_ms}; lost probes (None) are skipped.
+        """
+        return {
+            layer: self.judge(domain, layer, value)
+            for layer, value in latencies.items() if value is not None
+        }
+
+    def observe(self, domain: str, latencies: dict):
+        """
+        Judge one run, then add it to the baselines. Returns the verdicts.
+        """
+        with self._lock:
+            verdicts = self.judge_all(domain, latencies)
+
+            for layer in verdicts:
+                baselines = self._baselines.setdefault(domain, {})
+                baselines.setdefault(layer, Baseline()).update(latencies[layer])
+                self._dirty.add((domain, layer))
+
+        return verdicts
+
+    def save(self):
+        # Snapshot what changed; runs observed meanwhile wait for the next save
+        with self._lock:
+            written = {key: self._baselines[key[0]][key[1]].to_dict() for key in self._dirty}
+            self._dirty = set()
+        if not written:
+            return
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+
+            with open(self.path + ".lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+                # Someone else may have saved other baselines since we loaded
+                merged = self._load()
+                data = {
+                    domain: {layer: b.to_dict() for layer, b in layers.items()}
+                    for domain, layers in merged.items()
+                }
+                for (domain, layer), baseline in written.items():
+                    data.setdefault(domain, {})[layer] = baseline
+
+                with open(self.path + ".tmp", "w") as f:
+                    json.dump(data, f)
+                os.replace(self.path + ".tmp", self.path)
+        except BaseException:
+            with self._lock:
+                self._dirty |= written.keys()
+            raise
+
+        # Pick up other writers' baselines, except ours and any changed since
+        with self._lock:
+            for domain, layers in merged.items():
+                for layer, baseline in layers.items():
+                    if (domain, layer) not in written and (domain, layer) not in self._dirty:
+                        self._baselines.setdefault(domain, {})[layer] = baseline
+
+    def _load(self):
+        with contextlib.suppress(FileNotFoundError):
+            with open(self.path) as f:
+                data = json.load(f)
+            return {
+                domain: {layer: Baseline.from_dict(b) for layer, b in layers.items()}
+                for domain, layers in data.items()
+            }
+        return {}
@@ -0,0 +1,210 @@
+import asyncio
+import collections
+import json
+import os
+import socket
+import sys
+import time
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from reports.timeseries import TimeSeriesStore
+
+
+DEFAULT_REGION_PATH = os.environ.get("NETSCOPE_REGIONS", "netscope_regions")
+DEFAULT_COLLECTOR_PORT = 7070
+
+# Agent side: runs per batch, the buffer kept while the collector is slow
+# or away, and how long to wait for an ack before reconnecting
+BATCH_SIZE = 500
+FLUSH_S = 1.0
+MAX_BUFFER = 50000
+ACK_TIMEOUT_S = 30.0
+MAX_BACKOFF_S = 30.0
+
+# Longest protocol line (one batch) either side accepts
+MAX_LINE = 16 * 1024 * 1024
+
+
+class RegionStore:
+    """
+    Agent results merged by region: one TimeSeriesStore per region under
+    `root`, so every region's history can be queried and rolled up like
+    the local monitor's.
+    """
+
+    def __init__(self, root: str = DEFAULT_REGION_PATH):
+        self.root = root
+
+    def regions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(unquote(name) for name in os.listdir(self.root))
+
+    def store(self, region: str):
+        return TimeSeriesStore(os.path.join(self.root, quote(region, safe="")))
+
+    def append(self, region: str, runs):
+        """
+        Store agent runs ({domain, ts, metrics}) for `region`. Agents in a
+        region interleave, so runs may arrive in any order and are merged
+        into place; only runs older than the region's rolled-up history
+        are skipped.
+
+        Returns:
+            (written, late)
+        """
+        store = self.store(region)
+        by_domain = {}
+        for run in runs:
+            by_domain.setdefault(run["domain"], []).append((run["ts"], run["metrics"]))
+
+        late = sum(store.append_many(domain, points) for domain, points in by_domain.items())
+        return len(runs) - late, late
+
+    def latest(self, domain: str, seconds: float = 3600):
+        """
+        Per-region latency summary of `domain` over the last `seconds`.
+
+        Returns:
+            [{region, layer, median, p95, runs, lost, last_ts}]
+        """
+        start = time.time() - seconds
+        rows = []
+
+        for region in self.regions():
+            store = self.store(region)
+            for layer in store.metrics(domain):
+                series = store.query(domain, layer, start)
+                values = series["mean"][series["count"] > 0]
+                if not len(series["ts"]):
+                    continue
+                rows.append({
+                    "region": region,
+                    "layer": layer,
+                    "median": float(np.median(values)) if len(values) else None,
+                    "p95": float(np.percentile(values, 95)) if len(values) else None,
+                    "runs": int(series["count"].sum() + series["lost"].sum()),
+                    "lost": int(series["lost"].sum()),
+                    "last_ts": int(series["ts"][-1]) / 1000
+                })
+        return rows
+
+    def compact(self, now: float = None):
+        return sum(self.store(region).compact(now) for region in self.regions())
+
+
+class CollectorClient:
+    """
+    Agent side of the collector protocol.
+
+    push() buffers a run and never blocks the prober; run() ships the
+    buffer over one persistent connection as newline-delimited JSON:
+
+        -> {"hello": {"agent": id, "region": name}}
+        -> {"seq": n, "runs": [{domain, ts, metrics}], "dropped": k}
+        <- {"ack": n}
+
+    Only one batch is unacknowledged at a time, so a slow collector slows
+    the stream rather than queueing in its socket buffers. If the buffer
+    reaches `max_buffer` runs the oldest are dropped and counted. An
+    unacknowledged batch is resent with the same seq after reconnecting;
+    the collector skips seqs it has already stored.
+    """
+
+    def __init__(self, host: str, port: int, region: str, agent: str = None,
+                 batch_size: int = BATCH_SIZE, max_buffer: int = MAX_BUFFER):
+        self.host = host
+        self.port = port
+        self.region = region
+        self.agent = agent or f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+        self.batch_size = batch_size
+        self.buffer = collections.deque(maxlen=max_buffer)
+        self.dropped = 0
+        self.sent = 0
+        self._seq = 0
+        self._ready = asyncio.Event()
+
+    def push(self, domain: str, timestamp: float, metrics: dict):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append({"domain": domain, "ts": timestamp, "metrics": metrics})
+        if len(self.buffer) >= self.batch_size:
+            self._ready.set()
+
+    async def run(self, stop: asyncio.Event):
+        """
+        Ship batches until `stop` is set and the buffer is empty,
+        reconnecting with exponential backoff.
+        """
+        batch = None
+        backoff = 0.5
+
+        while not (stop.is_set() and not self.buffer and batch is None):
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_LINE)
+            except OSError as e:
+                print(f"Collector {self.host}:{self.port} unavailable ({e}); "
+                      f"retrying in {backoff:.1f}s", file=sys.stderr)
+                if stop.is_set():
+                    return
+                await _sleep(stop, backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_S)
+                continue
+
+            try:
+                await _send(writer, {"hello": {"agent": self.agent, "region": self.region}})
+                backoff = 0.5
+
+                while True:
+                    if batch is None:
+                        if not self.buffer:
+                            if stop.is_set():
+                                break
+                            await self._wait_for_runs(stop)
+                            continue
+                        batch = self._next_batch()
+
+                    await _send(writer, batch)
+                    ack = json.loads(await asyncio.wait_for(reader.readline(), ACK_TIMEOUT_S) or "null")
+                    if not ack or ack.get("ack") != batch["seq"]:
+                        raise ConnectionError(f"unexpected reply from collector: {ack}")
+
+                    self.sent += len(batch["runs"])
+                    batch = None
+
+            except (OSError, asyncio.TimeoutError, ConnectionError, ValueError) as e:
+                print(f"Collector connection lost ({e or type(e).__name__})", file=sys.stderr)
+            finally:
+                writer.close()
+
+            if stop.is_set() and not self.buffer and batch is None:
+                return
+
+    def _next_batch(self):
+        runs = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+        self._seq += 1
+        batch = {"seq": self._seq, "runs": runs, "dropped": self.dropped}
+        self.dropped = 0
+        return batch
+
+    async def _wait_for_runs(self, stop):
+        # A partial batch goes out after FLUSH_S so the collector stays current
+        self._ready.clear()
+        waiters = [asyncio.ensure_future(e.wait()) for e in (self._ready, stop)]
+        await asyncio.wait(waiters, timeout=FLUSH_S, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+
+
+async def _send(writer, message):
+    writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+    await writer.drain()
+
+
+async def _sleep(stop, seconds):
+    try:
+        await asyncio.wait_for(stop.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
@@ -1,9 +1,13 @@
 from datetime import datetime
 
+from layers.timing import overlap_ns, union_ns
+from reports.sketch import report_sketches
+
 
 def build_report(domain: str, results: dict):
     """
-    Build a structured diagnostic report.
+    Build a structured diagnostic report. "sketches" holds a mergeable
+    latency sketch per timing field (reports.sketch) for aggregation.
     """
 
     return {
@@ -12,5 +16,40 @@ def build_report(domain: str, results: dict):
             "domain": domain,
             "timestamp": datetime.utcnow().isoformat() + "Z"
         },
-        "results": results
+        "results": results,
+        "timeline": build_timeline(results),
+        "sketches": report_sketches(results)
+    }
+
+
+def build_timeline(results: dict):
+    """
+    Every layer's raw nanosecond spans on one monotonic timeline, with how
+    long the layers took end to end and how much of that ran concurrently.
+    """
+    spans = {}
+
+    for layer, result in results.items():
+        if not isinstance(result, dict):
+            continue
+        for span in result.get("spans") or []:
+            # Layers read from a shared connection trace repeat its spans
+            spans.setdefault(span["id"], dict(span, layer=layer))
+
+    spans = sorted(spans.values(), key=lambda s: s["start_ns"])
+    roots = [s for s in spans if s["parent"] is None and s["end_ns"]]
+
+    if not roots:
+        return {"spans": spans}
+
+    start_ns = min(s["start_ns"] for s in roots)
+    end_ns = max(s["end_ns"] for s in roots)
+
+    return {
+        "spans": spans,
+        "start_ns": start_ns,
+        "end_ns": end_ns,
+        "wall_ns": end_ns - start_ns,
+        "busy_ns": union_ns(roots),
+        "overlap_ns": overlap_ns(roots)
     }
@@ -0,0 +1,289 @@
+import contextlib
+import fcntl
+import json
+import os
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import numpy as np
+
+
+DEFAULT_REPORT_PATH = os.environ.get("NETSCOPE_REPORTS", "netscope_reports")
+
+# Rows per segment before a new one is started
+SEGMENT_ROWS = 65536
+
+# Per-layer fields that are not metrics
+SKIPPED_FIELDS = {"spans", "cert", "port"}
+
+
+def flatten_report(report: dict):
+    """
+    One run's numeric results as flat "layer.field" columns: every numeric
+    field (nested dicts joined with dots), "<layer>.ok" for success, and
+    "<layer>.spans.<name>_ms" for each span's duration.
+    """
+    row = {}
+
+    for layer, result in report["results"].items():
+        if not isinstance(result, dict):
+            continue
+
+        row[f"{layer}.ok"] = float(result.get("status") in ("ok", "reachable"))
+        _flatten_into(row, layer, result)
+
+        for span in result.get("spans") or []:
+            # Per-target spans ("tcp_connect 10.0.0.1") would add a column each
+            name = span["name"]
+            if span["end_ns"] and name.isidentifier():
+                row.setdefault(f"{layer}.spans.{name}_ms", (span["end_ns"] - span["start_ns"]) / 1e6)
+
+    return row
+
+
+def _flatten_into(row, prefix, value):
+    for key, item in value.items():
+        if key in SKIPPED_FIELDS:
+            continue
+        if isinstance(item, dict):
+            _flatten_into(row, f"{prefix}.{key}", item)
+        elif isinstance(item, (int, float)) and not isinstance(item, bool):
+            row[f"{prefix}.{key}"] = float(item)
+
+
+class ReportStore:
+    """
+    Columnar store of flattened reports for querying many runs at once.
+
+    Rows go into segments of up to `segment_rows` runs. A segment is a
+    directory with one flat float64 file per column, plus the run
+    timestamps (epoch ms) and domain ids. index.json records each
+    segment's row count, time range, domains and columns, so a query only
+    memory-maps the segments that can match and filters them with array
+    masks. A column missing from a run is NaN.
+    """
+
+    def __init__(self, root: str = DEFAULT_REPORT_PATH, segment_rows: int = SEGMENT_ROWS):
+        self.root = root
+        self.segment_rows = segment_rows
+
+    def append(self, report: dict):
+        self.append_many([report])
+
+    def append_many(self, reports):
+        """
+        Flatten and store `reports` (build_report output). Returns the
+        number of rows written.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        written = 0
+
+        with self._locked():
+            index = self._load_index()
+            domain_ids = {name: i for i, name in enumerate(index["domains"])}
+
+            rows = []
+            for report in reports:
+                domain = report["meta"]["domain"]
+                if domain not in domain_ids:
+                    domain_ids[domain] = len(index["domains"])
+                    index["domains"].append(domain)
+                rows.append((_epoch_ms(report["meta"]["timestamp"]), domain_ids[domain], flatten_report(report)))
+
+            while rows:
+                segment = index["segments"][-1] if index["segments"] else None
+                if segment is None or segment["rows"] >= self.segment_rows:
+                    segment = self._new_segment(index)
+
+                space = self.segment_rows - segment["rows"]
+                self._write_rows(segment, rows[:space])
+                written += len(rows[:space])
+                rows = rows[space:]
+
+            # Data first, then the index: readers never see rows that aren't written
+            self._save_index(index)
+
+        return written
+
+    def query(self, columns, domains=None, start: float = None, end: float = None):
+        """
+        Values of `columns` for runs of `domains` (all when None) between
+        `start` and `end` (epoch seconds).
+
+        Returns:
+            {
+                ts: int64 epoch ms,
+                domain_id: int32 (indexes "domains"),
+                domains: [name],
+                <column>: float64
+            }
+        """
+        index = self._load_index()
+        lo = -2**63 if start is None else int(start * 1000)
+        hi = 2**63 - 1 if end is None else int(end * 1000)
+
+        wanted = None
+        if domains is not None:
+            ids = {name: i for i, name in enumerate(index["domains"])}
+            wanted = np.array([ids[d] for d in domains if d in ids], dtype=np.int32)
+
+        parts = []
+        for segment in index["segments"]:
+            if not segment["rows"] or segment["ts_max"] < lo or segment["ts_min"] > hi:
+                continue
+            if wanted is not None and not np.intersect1d(segment["domains"], wanted).size:
+                continue
+
+            path = os.path.join(self.root, segment["name"])
+            ts = _map(path, "ts", np.int64, segment["rows"])
+            domain_id = _map(path, "domain", np.int32, segment["rows"])
+
+            mask = (ts >= lo) & (ts <= hi)
+            if wanted is not None:
+                mask &= np.isin(domain_id, wanted)
+
+            part = {"ts": ts[mask], "domain_id": domain_id[mask]}
+            for column in columns:
+                if column in segment["columns"]:
+                    part[column] = _map(path, _column_file(column), np.float64, segment["rows"])[mask]
+                else:
+                    part[column] = np.full(int(mask.sum()), np.nan)
+            parts.append(part)
+
+        result = {
+            name: np.concatenate([part[name] for part in parts]) if parts else np.empty(0, dtype)
+            for name, dtype in [("ts", np.int64), ("domain_id", np.int32)]
+            + [(column, np.float64) for column in columns]
+        }
+        result["domains"] = index["domains"]
+        return result
+
+    def percentile(self, column: str, q: float = 95, domains=None, start: float = None,
+                   end: float = None, by_domain: bool = True):
+        """
+        The q-th percentile of `column`, e.g. p95 TLS handshake time for a
+        set of domains over the last day:
+
+            store.percentile("tls.spans.tls_handshake_ms", 95, domains, time.time() - 86400)
+
+        Per domain ({domain: value}) by default, or one value across all
+        of them. Missing values (NaN) are ignored.
+        """
+        data = self.query([column], domains, start, end)
+        values = data[column]
+        keep = ~np.isnan(values)
+
+        if not by_domain:
+            return float(np.percentile(values[keep], q)) if keep.any() else None
+
+        groups, p = _grouped_percentile(data["domain_id"][keep], values[keep], q)
+        names = data["domains"]
+        return {names[g]: float(v) for g, v in zip(groups, p)}
+
+    def columns(self):
+        return sorted({c for segment in self._load_index()["segments"] for c in segment["columns"]})
+
+    def domains(self):
+        return list(self._load_index()["domains"])
+
+    def _new_segment(self, index):
+        segment = {
+            "name": f"segment-{len(index['segments']):06d}",
+            "rows": 0,
+            "ts_min": None,
+            "ts_max": None,
+            "domains": [],
+            "columns": []
+        }
+        os.makedirs(os.path.join(self.root, segment["name"]), exist_ok=True)
+        index["segments"].append(segment)
+        return segment
+
+    def _write_rows(self, segment, rows):
+        path = os.path.join(self.root, segment["name"])
+        columns = list(dict.fromkeys(
+            segment["columns"] + [column for _, _, values in rows for column in values]
+        ))
+
+        ts = np.array([r[0] for r in rows], dtype=np.int64)
+        domain_id = np.array([r[1] for r in rows], dtype=np.int32)
+
+        _append(path, "ts", ts, segment["rows"])
+        _append(path, "domain", domain_id, segment["rows"])
+
+        for column in columns:
+            if column not in segment["columns"]:
+                # Backfill rows written before this column first appeared
+                _append(path, _column_file(column), np.full(segment["rows"], np.nan), 0)
+            values = np.array([r[2].get(column, np.nan) for r in rows], dtype=np.float64)
+            _append(path, _column_file(column), values, segment["rows"])
+
+        segment["rows"] += len(rows)
+        segment["columns"] = columns
+        bounds = [ts.min(), ts.max()] + [b for b in (segment["ts_min"], segment["ts_max"]) if b is not None]
+        segment["ts_min"] = int(min(bounds))
+        segment["ts_max"] = int(max(bounds))
+        segment["domains"] = sorted(set(segment["domains"]) | set(domain_id.tolist()))
+
+    def _load_index(self):
+        path = os.path.join(self.root, "index.json")
+        if not os.path.exists(path):
+            return {"domains": [], "segments": []}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_index(self, index):
+        path = os.path.join(self.root, "index.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(path + ".tmp", path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # The app and batch/monitor processes may write to the same store
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _epoch_ms(timestamp: str):
+    when = datetime.fromisoformat(timestamp.rstrip("Z"))
+    return int(when.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _column_file(column):
+    return quote(column, safe="") + ".f8"
+
+
+def _append(path, name, values, rows):
+    with open(os.path.join(path, name), "ab") as f:
+        # Drop anything past the indexed rows left by a writer that died
+        # before saving the index
+        f.truncate(rows * values.itemsize)
+        f.write(values.tobytes())
+
+
+def _map(path, name, dtype, rows):
+    return np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=(rows,))
+
+
+def _grouped_percentile(groups, values, q):
+    """
+    Linear-interpolated percentile of `values` within each group, for all
+    groups at once: sort by (group, value) and index into each run.
+    """
+    if not len(values):
+        return np.empty(0, np.int32), np.empty(0)
+
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    ids, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+
+    position = starts + (counts - 1) * (q / 100)
+    below = np.floor(position).astype(np.int64)
+    above = np.ceil(position).astype(np.int64)
+
+    return ids, values[below] + (values[above] - values[below]) * (position - below)
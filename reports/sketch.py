@@ -0,0 +1,211 @@
+import math
+
+import numpy as np
+
+
+RELATIVE_ACCURACY = 0.01
+# Bins kept before the lowest are folded together; 2048 bins at 1%
+# accuracy cover ~18 decades of latency
+MAX_BINS = 2048
+
+
+class DDSketch:
+    """
+    Mergeable latency distribution with bounded relative error (DDSketch,
+    Masson et al. 2019).
+
+    Values fall into logarithmic bins of ratio gamma = (1 + a) / (1 - a),
+    so any quantile is within `relative_accuracy` (a) of the true value.
+    Merging adds bin counts, which makes the result the same however runs
+    are split across workers or nodes, and memory depends on the value
+    range, not on how many values were added.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, max_bins: int = MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        self.bins = {}
+        # Values too small to bin (0 ms and below)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.add_many([value])
+
+    def add_many(self, values):
+        """
+        Add latencies; None and NaN (lost probes) are skipped.
+        """
+        values = np.asarray([v for v in values if v is not None], dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+
+        keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma), return_counts=True)
+        for key, count in zip(keys.astype(np.int64).tolist(), counts.tolist()):
+            self.bins[key] = self.bins.get(key, 0) + count
+        self._collapse()
+
+    def merge(self, other: "DDSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge sketches with different relative accuracy")
+
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+        return self
+
+    def quantile(self, q: float):
+        """
+        Value at quantile `q` (0..1), or None for an empty sketch.
+        """
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return max(self.min, 0.0)
+
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # Midpoint of the bin in relative terms, clamped to what was seen
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def _collapse(self):
+        # Fold the lowest bins into one: only the low quantiles lose accuracy
+        if len(self.bins) <= self.max_bins:
+            return
+        keys = sorted(self.bins)
+        folded = keys[:len(keys) - self.max_bins + 1]
+        self.bins[folded[-1]] = sum(self.bins.pop(key) for key in folded[:-1]) + self.bins[folded[-1]]
+
+    def to_dict(self):
+        """
+        JSON form: bin counts as a dense list starting at bin `offset`.
+        """
+        data = {
+            "relative_accuracy": self.relative_accuracy,
+            "count": self.count,
+            "zero_count": self.zero_count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "offset": 0,
+            "counts": []
+        }
+        if self.bins:
+            low, high = min(self.bins), max(self.bins)
+            data["offset"] = low
+            data["counts"] = [self.bins.get(key, 0) for key in range(low, high + 1)]
+        return data
+
+    @classmethod
+    def from_dict(cls, data, max_bins: int = MAX_BINS):
+        sketch = cls(data["relative_accuracy"], max_bins)
+        sketch.count = data["count"]
+        sketch.zero_count = data["zero_count"]
+        sketch.sum = data["sum"]
+        if data["count"]:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        sketch.bins = {
+            data["offset"] + i: count for i, count in enumerate(data["counts"]) if count
+        }
+        return sketch
+
+
+# Timing fields sketched per layer; a dict field ("timings") is sketched
+# per key ("http.timings.ttfb")
+SKETCH_FIELDS = {
+    "dns": ("latency",),
+    "ip": ("latency_ms",),
+    "tcp": ("connect_time_ms",),
+    "http": ("timings",),
+}
+
+# The field each layer's sampling repeats (layers.sampling.SAMPLE_METRICS)
+SAMPLED_FIELDS = {
+    "dns": "dns.latency",
+    "ip": "ip.latency_ms",
+    "tcp": "tcp.connect_time_ms",
+    "http": "http.timings.total",
+}
+
+
+def report_sketches(results: dict):
+    """
+    One sketch per timing field of a run ("dns.latency", "ip.latency_ms",
+    "tcp.connect_time_ms", "http.timings.<phase>"), as to_dict() output.
+    A sampled layer contributes every sample, not just the representative
+    one.
+    """
+    sketches = {}
+
+    for layer, fields in SKETCH_FIELDS.items():
+        result = results.get(layer)
+        if not isinstance(result, dict) or result.get("status") not in ("ok", "reachable"):
+            continue
+
+        values = {}
+        for name in fields:
+            value = result.get(name)
+            if isinstance(value, dict):
+                values.update({f"{layer}.{name}.{key}": v for key, v in value.items()})
+            else:
+                values[f"{layer}.{name}"] = value
+
+        sampling = result.get("sampling")
+        if sampling and SAMPLED_FIELDS[layer] in values:
+            values[SAMPLED_FIELDS[layer]] = sampling["samples"]
+
+        for field, value in values.items():
+            sketch = DDSketch()
+            if isinstance(value, list):
+                sketch.add_many(value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                sketch.add(value)
+            if sketch.count:
+                sketches[field] = sketch.to_dict()
+
+    return sketches
+
+
+def merge_sketches(merged: dict, sketches: dict):
+    """
+    Merge serialised `sketches` ({field: to_dict()}) into `merged`
+    ({field: DDSketch}), e.g. every report of a sweep. Returns `merged`.
+    """
+    for field, data in sketches.items():
+        sketch = DDSketch.from_dict(data)
+        if field in merged:
+            merged[field].merge(sketch)
+        else:
+            merged[field] = sketch
+    return merged
@@ -0,0 +1,325 @@
+import contextlib
+import fcntl
+import os
+import time
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+
+DEFAULT_STORE_PATH = os.environ.get("NETSCOPE_STORE", "netscope_data")
+
+# Raw points are rolled up into 1-minute buckets once older than the raw
+# retention, and 1-minute buckets into 1-hour buckets after theirs
+RAW_RETENTION_S = 7 * 86400
+MINUTE_RETENTION_S = 90 * 86400
+
+# One file per column; each file is a flat little-endian array
+RAW_COLUMNS = {"ts": "<i8", "value": "<f8"}
+ROLLUP_COLUMNS = {"ts": "<i8", "mean": "<f8", "min": "<f8", "max": "<f8",
+                  "count": "<i4", "lost": "<i4"}
+ROLLUPS = (("1m", 60), ("1h", 3600))
+
+
+class TimeSeriesStore:
+    """
+    Append-only, column-oriented store of per-domain latency series.
+
+    Every (domain, metric) series is a directory with one file per column
+    and tier: raw points, then 1-minute and 1-hour rollups (mean/min/max,
+    sample and loss counts) for data past its retention. Timestamps are
+    epoch milliseconds and only ever appended in order, so a time range
+    is found by binary search over a memory-mapped column instead of a
+    scan. NaN values mark lost probes. Appends and compaction lock the
+    series, so they may run on different threads or processes.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_PATH, raw_retention_s: float = RAW_RETENTION_S,
+                 minute_retention_s: float = MINUTE_RETENTION_S):
+        self.root = root
+        self.retention = {"raw": raw_retention_s, "1m": minute_retention_s}
+
+    def append(self, domain: str, timestamp: float, metrics: dict):
+        """
+        Record one observation per metric at `timestamp` (epoch seconds).
+        None is stored as NaN, i.e. a lost probe. Returns False if the
+        point was too old to store (see append_many).
+        """
+        return not self.append_many(domain, [(timestamp, metrics)])
+
+    def append_many(self, domain: str, points):
+        """
+        Record [(timestamp, {metric: value})] for `domain`, in any order.
+        Points older than a series' latest are merged into place; points
+        older than what has already been rolled up are skipped.
+        Returns how many points were skipped.
+        """
+        by_metric = {}
+        for index, (timestamp, metrics) in enumerate(points):
+            for metric, value in metrics.items():
+                by_metric.setdefault(metric, []).append(
+                    (int(timestamp * 1000), np.nan if value is None else value, index)
+                )
+
+        skipped = set()
+        for metric, rows in by_metric.items():
+            path = self._series_path(domain, metric)
+            os.makedirs(path, exist_ok=True)
+            rows.sort(key=lambda row: row[0])
+            ts = np.array([row[0] for row in rows], dtype=np.int64)
+            value = np.array([row[1] for row in rows], dtype=np.float64)
+
+            with _locked(path):
+                # Rollup tiers are append-only, so a point can't go behind them
+                late = ts < self._rolled_up_to(path)
+                skipped.update(row[2] for row, old in zip(rows, late) if old)
+                ts, value = ts[~late], value[~late]
+                if not len(ts):
+                    continue
+
+                raw = self._read(path, "raw", RAW_COLUMNS)
+                if not len(raw["ts"]) or ts[0] >= raw["ts"][-1]:
+                    _append_columns(path, "raw", RAW_COLUMNS, {"ts": ts, "value": value})
+                    continue
+
+                # Only the tail from the first late point on is re-sorted
+                split = int(np.searchsorted(raw["ts"], ts[0], side="right"))
+                tail_ts = np.concatenate([raw["ts"][split:], ts])
+                order = np.argsort(tail_ts, kind="stable")
+                _rewrite_columns(path, "raw", RAW_COLUMNS, {
+                    "ts": np.concatenate([raw["ts"][:split], tail_ts[order]]),
+                    "value": np.concatenate([raw["value"][:split],
+                                             np.concatenate([raw["value"][split:], value])[order]])
+                })
+
+        return len(skipped)
+
+    def query(self, domain: str, metric: str, start: float = None, end: float = None,
+              step_s: int = None):
+        """
+        Points of one series between `start` and `end` (epoch seconds),
+        oldest first, stitched together from every tier. With `step_s`
+        the points are downsampled into buckets of that many seconds.
+
+        Returns:
+            {
+                ts: int64 epoch ms,
+                mean, min, max: float64,
+                count, lost: int
+            } as NumPy arrays
+        """
+        path = self._series_path(domain, metric)
+        lo = -2**63 if start is None else int(start * 1000)
+        hi = 2**63 - 1 if end is None else int(end * 1000)
+
+        parts = [
+            _window(self._read(path, tier, ROLLUP_COLUMNS), lo, hi)
+            for tier, _ in reversed(ROLLUPS)
+        ]
+        parts.append(_as_rollup(_window(self._read(path, "raw", RAW_COLUMNS), lo, hi)))
+
+        series = {name: np.concatenate([part[name] for part in parts]) for name in ROLLUP_COLUMNS}
+
+        if step_s:
+            series = _downsample(series, step_s * 1000)
+        return series
+
+    def grid(self, domains, metric: str, start: float, end: float, step_s: int):
+        """
+        Mean of `metric` for each domain on one shared grid of `step_s`
+        buckets between `start` and `end`, for fleet-wide views.
+
+        Returns:
+            {
+                ts: int64 epoch ms of each bucket,
+                mean: float64 array of shape (len(domains), len(ts)),
+                    NaN where a domain has no data
+            }
+        """
+        step_ms = step_s * 1000
+        first = int(start * 1000) // step_ms * step_ms
+        ts = np.arange(first, int(end * 1000) + 1, step_ms, dtype=np.int64)
+        mean = np.full((len(domains), len(ts)), np.nan)
+
+        for row, domain in enumerate(domains):
+            series = self.query(domain, metric, start, end, step_s)
+            mean[row, (series["ts"] - first) // step_ms] = series["mean"]
+
+        return {"ts": ts, "mean": mean}
+
+    def domains(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(unquote(name) for name in os.listdir(self.root))
+
+    def metrics(self, domain: str):
+        path = os.path.join(self.root, quote(domain, safe=""))
+        if not os.path.isdir(path):
+            return []
+        return sorted(unquote(name) for name in os.listdir(path))
+
+    def compact(self, now: float = None):
+        """
+        Roll raw points and 1-minute buckets past their retention up into
+        the next tier. Returns how many points were rolled up.
+        """
+        now_ms = int((now or time.time()) * 1000)
+        rolled = 0
+
+        for domain in self.domains():
+            for metric in self.metrics(domain):
+                path = self._series_path(domain, metric)
+                with _locked(path):
+                    rolled += self._compact_series(path, now_ms)
+
+        return rolled
+
+    def _compact_series(self, path, now_ms):
+        rolled = 0
+        source, columns = "raw", RAW_COLUMNS
+
+        for tier, bucket_s in ROLLUPS:
+            # Only whole buckets move, so a bucket never spans two tiers
+            bucket_ms = bucket_s * 1000
+            cutoff = (now_ms - int(self.retention[source] * 1000)) // bucket_ms * bucket_ms
+
+            data = self._read(path, source, columns)
+            split = int(np.searchsorted(data["ts"], cutoff))
+
+            if split:
+                old = {name: np.array(col[:split]) for name, col in data.items()}
+                if source == "raw":
+                    old = _as_rollup(old)
+                _append_columns(path, tier, ROLLUP_COLUMNS, _downsample(old, bucket_ms))
+                _rewrite_columns(path, source, columns,
+                                 {name: np.array(col[split:]) for name, col in data.items()})
+                rolled += split
+
+            if tier == ROLLUPS[-1][0]:
+                break
+            source, columns = tier, ROLLUP_COLUMNS
+
+        return rolled
+
+    def _rolled_up_to(self, path):
+        """
+        Start of the newest rollup bucket of a series, or the minimum int64.
+        """
+        newest = -2**63
+        for tier, _ in ROLLUPS:
+            last = self._read(path, tier, ROLLUP_COLUMNS)["ts"][-1:]
+            if len(last):
+                newest = max(newest, int(last[0]))
+        return newest
+
+    def _series_path(self, domain, metric):
+        return os.path.join(self.root, quote(domain, safe=""), quote(metric, safe=""))
+
+    def _read(self, path, tier, columns):
+        """
+        Memory-map every column of a tier, trimmed to the rows all columns
+        have (a reader may race an append).
+        """
+        rows = _rows(path, tier, columns)
+        if not rows:
+            return {name: np.empty(0, dtype) for name, dtype in columns.items()}
+
+        return {
+            name: np.memmap(_column_file(path, tier, name), dtype=dtype, mode="r", shape=(rows,))
+            for name, dtype in columns.items()
+        }
+
+
+@contextlib.contextmanager
+def _locked(path):
+    # Held across read -> rewrite, so a compaction can't drop a concurrent append
+    with open(os.path.join(path, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _column_file(path, tier, name):
+    return os.path.join(path, f"{tier}.{name}")
+
+
+def _rows(path, tier, columns):
+    """
+    Rows every column file of a tier holds.
+    """
+    sizes = []
+    for name, dtype in columns.items():
+        file = _column_file(path, tier, name)
+        sizes.append(os.path.getsize(file) // np.dtype(dtype).itemsize if os.path.exists(file) else 0)
+    return min(sizes)
+
+
+def _append_columns(path, tier, columns, data):
+    # Called under the series lock. Drop any rows past those every column
+    # has, left by a writer that died mid-append, so the columns stay aligned
+    rows = _rows(path, tier, columns)
+    for name, dtype in columns.items():
+        with open(_column_file(path, tier, name), "ab") as f:
+            f.truncate(rows * np.dtype(dtype).itemsize)
+            f.write(np.asarray(data[name], dtype=dtype).tobytes())
+
+
+def _rewrite_columns(path, tier, columns, data):
+    for name, dtype in columns.items():
+        file = _column_file(path, tier, name)
+        with open(file + ".tmp", "wb") as f:
+            f.write(np.asarray(data[name], dtype=dtype).tobytes())
+        # Readers keep their old mapping; new readers see the new file
+        os.replace(file + ".tmp", file)
+
+
+def _window(data, lo, hi):
+    first = np.searchsorted(data["ts"], lo, side="left")
+    last = np.searchsorted(data["ts"], hi, side="right")
+    return {name: np.asarray(col[first:last]) for name, col in data.items()}
+
+
+def _as_rollup(raw):
+    """
+    Raw points as one-sample buckets.
+    """
+    value = raw["value"]
+    lost = np.isnan(value)
+    return {
+        "ts": raw["ts"],
+        "mean": value,
+        "min": value,
+        "max": value,
+        "count": (~lost).astype(np.int32),
+        "lost": lost.astype(np.int32)
+    }
+
+
+def _downsample(series, bucket_ms):
+    """
+    Merge buckets that fall into the same `bucket_ms` window.
+    """
+    if not len(series["ts"]):
+        return series
+
+    buckets = series["ts"] // bucket_ms * bucket_ms
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+
+    count = np.add.reduceat(series["count"], starts)
+    weighted = np.where(series["count"] > 0, series["mean"] * series["count"], 0.0)
+    total = np.add.reduceat(weighted, starts)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+
+    return {
+        "ts": buckets[starts],
+        "mean": mean,
+        # fmin/fmax skip NaN from buckets that were entirely lost
+        "min": np.fmin.reduceat(series["min"], starts),
+        "max": np.fmax.reduceat(series["max"], starts),
+        "count": count.astype(np.int32),
+        "lost": np.add.reduceat(series["lost"], starts).astype(np.int32)
+    }
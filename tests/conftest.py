@@ -0,0 +1,189 @@
+import os
+import shutil
+import socketserver
+import ssl
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TLSServer(socketserver.ThreadingTCPServer):
+    """
+    Loopback TLS server for "localhost"; each accepted connection is
+    wrapped and handed to `handle(conn)`. Accepted connections are
+    counted in `connections`.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, context, handle):
+        super().__init__(("127.0.0.1", 0), _TLSHandler)
+        self.context = context
+        self.handle = handle
+        self.connections = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class _TLSHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        try:
+            with self.server.context.wrap_socket(self.request, server_side=True) as conn:
+                self.server.handle(conn)
+        except OSError:
+            pass
+
+
+class DNSStub(socketserver.ThreadingUDPServer):
+    """
+    Loopback DNS server answering from `zone`: {(name, rdtype): rrsets}
+    where rrsets are (name, rdtype, ttl, value) tuples. Every query waits
+    `delay_s` first, the first query for a name `cold_s`, like a resolver
+    cache miss. Received queries are kept in `queries`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, zone, delay_s=0.0, cold_s=0.0):
+        super().__init__(("127.0.0.1", 0), _DNSHandler)
+        self.zone = zone
+        self.delay_s = delay_s
+        self.cold_s = cold_s
+        self.queries = []
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class _DNSHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        import dns.message
+        import dns.rcode
+        import dns.rdatatype
+        import dns.rrset
+
+        data, sock = self.request
+        query = dns.message.from_wire(data)
+        question = query.question[0]
+        name = question.name.to_text()
+        rdtype = dns.rdatatype.to_text(question.rdtype)
+
+        with self.server.lock:
+            cold = not any(seen == name for seen, _ in self.server.queries)
+            self.server.queries.append((name, rdtype))
+        time.sleep(self.server.delay_s + (self.server.cold_s if cold else 0.0))
+
+        response = dns.message.make_response(query)
+        records = self.server.zone.get((name, rdtype))
+        if records is None:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        for owner, kind, ttl, value in records or ():
+            response.answer.append(dns.rrset.from_text(owner, ttl, "IN", kind, value))
+        sock.sendto(response.to_wire(), self.client_address)
+
+
+ZONE = {
+    ("www.example.test.", "A"): [
+        ("www.example.test.", "CNAME", 300, "edge.example.test."),
+        ("edge.example.test.", "A", 60, "192.0.2.10"),
+    ],
+    ("www.example.test.", "AAAA"): [
+        ("www.example.test.", "CNAME", 300, "edge.example.test."),
+        ("edge.example.test.", "AAAA", 60, "2001:db8::10"),
+    ],
+    ("www.example.test.", "CNAME"): [
+        ("www.example.test.", "CNAME", 300, "edge.example.test."),
+    ],
+    ("plain.example.test.", "A"): [
+        ("plain.example.test.", "A", 120, "192.0.2.20"),
+    ],
+}
+
+
+@pytest.fixture
+def dns_stub():
+    """
+    Start a DNSStub on loopback; call it with the DNSStub arguments.
+    """
+    servers = []
+
+    def start(zone=ZONE, **kwargs):
+        server = DNSStub(zone, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def stub_resolver(monkeypatch):
+    """
+    Point dnspython's default resolver (used by the layers) at a stub.
+    """
+    import dns.resolver
+
+    def use(server):
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = ["127.0.0.1"]
+        resolver.port = server.port
+        resolver.lifetime = 2.0
+        monkeypatch.setattr(dns.resolver, "default_resolver", resolver)
+        return resolver
+
+    return use
+
+
+@pytest.fixture(scope="session")
+def tls_cert(tmp_path_factory):
+    """
+    Self-signed certificate and key for localhost / 127.0.0.1.
+    """
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl not available")
+    directory = tmp_path_factory.mktemp("tls")
+    cert, key = str(directory / "cert.pem"), str(directory / "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+
+@pytest.fixture
+def tls_server(tls_cert, monkeypatch):
+    """
+    Start a TLSServer with a handler; the layers trust its certificate.
+    """
+    cert, key = tls_cert
+    monkeypatch.setenv("SSL_CERT_FILE", cert)
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    servers = []
+
+    def start(handle):
+        server = TLSServer(context, handle)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,63 @@
+import copy
+import threading
+
+from reports.baseline import Baseline, BaselineStore
+
+
+def test_saving_on_another_thread_keeps_every_observation(tmp_path):
+    path = str(tmp_path / "baselines.json")
+    store = BaselineStore(path)
+    runs = 2000
+    done = threading.Event()
+
+    def save():
+        while not done.is_set():
+            store.save()
+
+    saver = threading.Thread(target=save)
+    saver.start()
+    try:
+        for i in range(runs):
+            store.observe(f"d{i % 50}.example", {"tcp": 10.0 + i % 7, "dns": 5.0})
+    finally:
+        done.set()
+        saver.join()
+    store.save()
+
+    reloaded = BaselineStore(path)
+    counts = [reloaded.judge(f"d{i}.example", "tcp", 10.0)["count"] for i in range(50)]
+    assert sum(counts) == runs
+
+
+def test_save_merges_baselines_from_other_writers(tmp_path):
+    path = str(tmp_path / "baselines.json")
+    app, monitor = BaselineStore(path), BaselineStore(path)
+
+    app.observe("a.example", {"tcp": 10.0})
+    monitor.observe("b.example", {"tcp": 20.0})
+    app.save()
+    monitor.save()
+
+    merged = BaselineStore(path)
+    assert merged.judge("a.example", "tcp", 10.0)["count"] == 1
+    assert merged.judge("b.example", "tcp", 20.0)["count"] == 1
+
+    # The app picks up the monitor's baseline on its next save
+    app.observe("a.example", {"tcp": 11.0})
+    app.save()
+    assert app.judge("b.example", "tcp", 20.0)["count"] == 1
+    assert BaselineStore(path).judge("a.example", "tcp", 10.0)["count"] == 2
+
+
+def test_snapshot_is_not_changed_by_later_runs():
+    baseline = Baseline()
+    for value in range(20):
+        baseline.update(float(value))
+
+    snapshot = baseline.to_dict()
+    frozen = copy.deepcopy(snapshot)
+    for value in range(20):
+        baseline.update(float(value * 3))
+
+    assert snapshot == frozen
+    assert Baseline.from_dict(snapshot).count == 20
@@ -0,0 +1,39 @@
+import numpy as np
+
+from visuals import charts
+
+
+def sample_figures():
+    points = {"ts": np.arange(3) * 1000, "mean": np.ones(3), "min": np.ones(3), "max": np.ones(3),
+              "count": np.ones(3, np.int32), "lost": np.zeros(3, np.int32)}
+    return {
+        "resolver_latency_chart": charts.resolver_latency_chart(
+            [{"status": "ok", "resolver": "system", "cold_ms": 5.0, "warm_ms": 1.0}]),
+        "traceroute_chart": charts.traceroute_chart(
+            [{"hop": 1, "latency": 1.0, "host": "gw", "ip": "192.0.2.1"}]),
+        "dual_stack_chart": charts.dual_stack_chart(
+            [{"family": "ipv6", "status": "ok", "connect_ms": 1.0, "address": "::1", "start_ms": 0.0}]),
+        "tls_resumption_chart": charts.tls_resumption_chart(10.0, 2.0, True),
+        "http_waterfall_chart": charts.http_waterfall_chart({"dns": 1.0, "total": 5.0}),
+        "quic_vs_tcp_chart": charts.quic_vs_tcp_chart({"total": 5.0}, {"total": 4.0}),
+        "history_chart": charts.history_chart({"tcp": points}),
+        "region_latency_chart": charts.region_latency_chart(
+            [{"region": "eu", "layer": "tcp", "median": 1.0, "p95": 2.0}]),
+        "latency_heatmap": charts.latency_heatmap(np.ones((2, 2)), ["a", "b"], ["x", "y"], "Fleet"),
+    }
+
+
+def test_charts_take_margin_and_axes_from_the_shared_template():
+    for name, fig in sample_figures().items():
+        template = fig.layout.template.layout
+        assert template.margin.l == charts.CHART_LAYOUT["margin"]["l"], name
+        assert template.yaxis.automargin, name
+        # Nothing per chart overrides the shared margin
+        assert fig.layout.margin.l is None, name
+        assert fig.layout.title.text, name
+        fig.to_json()
+
+
+def test_height_is_on_the_figure_for_streamlit():
+    assert charts.traceroute_chart([]).layout.height == charts.CHART_LAYOUT["height"]
+    assert charts.ping_line([1.0, None]).layout.height == 260
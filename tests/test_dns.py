@@ -0,0 +1,62 @@
+from layers.dns_layer import resolve_dns
+from layers.dns_profiler import profile_dns
+
+
+def test_profiler_times_a_aaaa_and_cname_chain(dns_stub):
+    stub = dns_stub(delay_s=0.02, cold_s=0.1)
+
+    result = profile_dns("www.example.test", [f"127.0.0.1:{stub.port}"])
+    row = result["resolvers"][0]
+
+    assert row["status"] == "ok", row
+    assert result["fastest"] == f"127.0.0.1:{stub.port}"
+    assert row["a"] == ["192.0.2.10"]
+    assert row["aaaa"] == ["2001:db8::10"]
+
+    # A and AAAA run in parallel, so only one of them pays the cold delay
+    assert min(row["a_ms"], row["aaaa_ms"]) >= 20
+    assert max(row["a_ms"], row["aaaa_ms"]) >= 120
+    assert 20 <= row["warm_ms"] < 100
+    assert row["ttl"] == 60
+
+    assert [(hop["name"], hop["target"]) for hop in row["cname_chain"]] == [
+        ("www.example.test.", "edge.example.test.")
+    ]
+    assert row["cname_chain"][0]["ms"] >= 20
+    assert ("www.example.test.", "CNAME") in stub.queries
+
+
+def test_profiler_reports_cache_miss_from_the_repeat_query(dns_stub):
+    stub = dns_stub(cold_s=0.05)
+    row = profile_dns("plain.example.test", [f"127.0.0.1:{stub.port}"])["resolvers"][0]
+
+    assert row["cache"]["status"] == "cache_miss"
+    assert row["delta_ms"] >= 40
+    assert row["cname_chain"] == []
+
+
+def test_profiler_reports_unreachable_resolver_as_error(dns_stub):
+    stub = dns_stub()
+    port = stub.port
+    stub.shutdown()
+    stub.server_close()
+
+    result = profile_dns("plain.example.test", [f"127.0.0.1:{port}"], timeout=0.3)
+
+    assert result["resolvers"][0]["status"] == "error"
+    assert result["fastest"] is None
+
+
+def test_resolve_dns_repeats_only_when_asked(dns_stub, stub_resolver):
+    stub = dns_stub(cold_s=0.05)
+    stub_resolver(stub)
+
+    once = resolve_dns("plain.example.test")
+    assert once["ips"] == ["192.0.2.20"]
+    assert "cache" not in once
+    assert len(stub.queries) == 1
+
+    twice = resolve_dns("plain.example.test", repeat=True)
+    assert len(stub.queries) == 3
+    assert twice["cache"]["status"] == "cache_hit"
+    assert "repeat_latency" in twice
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from visuals.downsample import downsample_series, lttb_indices
+
+
+def series(n, seed=5):
+    rng = np.random.default_rng(seed)
+    ts = np.arange(n, dtype=np.int64) * 1000
+    mean = rng.normal(50, 5, n)
+    return {
+        "ts": ts,
+        "mean": mean,
+        "min": mean - 1,
+        "max": mean + 1,
+        "count": np.ones(n, dtype=np.int32),
+        "lost": np.zeros(n, dtype=np.int32),
+    }
+
+
+@pytest.mark.parametrize("n, threshold", [(1000, 100), (1001, 3), (50, 49), (10_000, 777)])
+def test_keeps_endpoints_and_threshold_points(n, threshold):
+    data = series(n)
+    kept, starts = lttb_indices(data["ts"], data["mean"], threshold)
+
+    assert len(kept) == threshold
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert np.all(np.diff(kept) > 0)
+    # Every kept point lies in its own bucket
+    assert len(starts) == threshold
+    assert np.all(starts <= kept)
+    assert np.all(kept[:-1] < starts[1:])
+
+
+@pytest.mark.parametrize("n, threshold", [(10, 10), (10, 50), (10, 2), (0, 5)])
+def test_short_input_or_tiny_threshold_is_left_alone(n, threshold):
+    data = series(n)
+    kept, starts = lttb_indices(data["ts"], data["mean"], threshold)
+
+    assert kept.tolist() == list(range(n))
+    assert starts.tolist() == list(range(n))
+
+
+def test_spikes_survive():
+    data = series(5000)
+    data["mean"][1234] = 900.0
+    data["mean"][4321] = -900.0
+
+    kept, _ = lttb_indices(data["ts"], data["mean"], 200)
+
+    assert 1234 in kept and 4321 in kept
+
+
+def test_all_nan_bucket_kept_as_a_gap():
+    data = series(1000)
+    data["mean"][400:600] = np.nan
+
+    kept, _ = lttb_indices(data["ts"], data["mean"], 20)
+    values = data["mean"][kept]
+
+    assert np.isnan(values).any()
+    assert not np.isnan(values[0]) and not np.isnan(values[-1])
+
+
+def test_downsample_series_reduces_every_column_over_the_buckets():
+    data = series(1000)
+    data["max"][777] = 1000.0
+    data["lost"][10] = 3
+
+    small = downsample_series(data, 50)
+
+    assert len(small["ts"]) == 50
+    assert small["count"].sum() == 1000
+    assert small["lost"].sum() == 3
+    assert small["max"].max() == 1000.0
+    assert downsample_series(data, 5000) is data
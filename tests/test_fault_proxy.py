@@ -0,0 +1,159 @@
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from layers.fault_proxy import FaultProxy, resolver, routed
+
+
+class EchoServer(socketserver.ThreadingTCPServer):
+    """
+    Loopback TCP server echoing every byte until the client half-closes;
+    what each connection sent is kept in `received`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _EchoHandler)
+        self.received = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class _EchoHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data = b""
+        try:
+            while chunk := self.request.recv(65536):
+                data += chunk
+                self.request.sendall(chunk)
+        except OSError:
+            pass
+        self.server.received.append(data)
+
+
+@pytest.fixture
+def echo():
+    server = EchoServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def exchange(proxy, port, payload, timeout=10.0):
+    """
+    Send `payload` through the proxy to the echo server and read the echo
+    until EOF. Returns (echoed bytes, seconds from connect to EOF).
+    """
+    started = time.perf_counter()
+    with socket.create_connection(proxy.connect("127.0.0.1", port, timeout), timeout=timeout) as sock:
+        sock.sendall(payload)
+        sock.shutdown(socket.SHUT_WR)
+        echoed = b""
+        while chunk := sock.recv(65536):
+            echoed += chunk
+    return echoed, time.perf_counter() - started
+
+
+def test_latency_delays_both_directions(echo):
+    with FaultProxy({"latency": 50}) as proxy:
+        echoed, elapsed = exchange(proxy, echo.port, b"ping")
+
+    assert echoed == b"ping"
+    # Request and echo each wait out the one-way latency
+    assert elapsed >= 0.1
+    assert proxy.stats["connections"] == 1
+
+
+def test_dropped_segments_wait_for_retransmission(echo):
+    with FaultProxy({"drop_rate": 0.5, "retransmit_ms": 50, "seed": 7}) as proxy:
+        echoed, elapsed = exchange(proxy, echo.port, b"x" * 20000)
+
+    assert echoed == b"x" * 20000
+    assert proxy.stats["segments_dropped"] > 0
+    assert elapsed >= 0.05
+
+
+def test_segment_lost_on_every_retransmission_aborts(echo):
+    with FaultProxy({"drop_rate": 1.0, "retransmit_ms": 10}) as proxy:
+        echoed, elapsed = exchange(proxy, echo.port, b"ping")
+
+    # 10 + 20 + ... + 640 ms of retransmission timeouts, then the connection closes
+    assert echoed == b""
+    assert elapsed >= 1.27
+    assert proxy.stats["segments_dropped"] == 7
+    assert echo.received in ([], [b""])
+
+
+def test_reset_reaches_server_but_client_sees_rst(echo):
+    with FaultProxy({"reset_rate": 1.0}) as proxy:
+        with pytest.raises(ConnectionResetError):
+            exchange(proxy, echo.port, b"GET / HTTP/1.1\r\n\r\n")
+
+    assert proxy.stats["resets"] == 1
+    deadline = time.monotonic() + 2
+    while not echo.received and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert echo.received == [b"GET / HTTP/1.1\r\n\r\n"]
+
+
+def test_bandwidth_cap_slows_transfer(echo):
+    payload = b"x" * 50_000
+    # 100 kB/s per direction: 0.5 s to serialise the payload each way
+    with FaultProxy({"bandwidth_bps": 800_000}) as proxy:
+        echoed, elapsed = exchange(proxy, echo.port, payload)
+
+    assert echoed == payload
+    assert elapsed >= 0.45
+
+
+def test_datagrams_are_delayed_both_ways(dns_stub):
+    import dns.message
+    import dns.query
+
+    stub = dns_stub()
+    with FaultProxy({"latency": 30}) as proxy:
+        host, port = proxy.datagram("127.0.0.1", stub.port)
+        started = time.perf_counter()
+        response = dns.query.udp(dns.message.make_query("plain.example.test", "A"), host, port=port, timeout=2)
+        elapsed = time.perf_counter() - started
+
+    assert [rrset.to_text() for rrset in response.answer] == ["plain.example.test. 120 IN A 192.0.2.20"]
+    assert elapsed >= 0.06
+    assert proxy.stats["datagrams"] == 2
+
+
+def test_dropped_datagram_times_out_query(dns_stub):
+    import dns.exception
+    import dns.message
+    import dns.query
+
+    stub = dns_stub()
+    with FaultProxy({"drop_rate": 1.0}) as proxy:
+        host, port = proxy.datagram("127.0.0.1", stub.port)
+        with pytest.raises(dns.exception.Timeout):
+            dns.query.udp(dns.message.make_query("plain.example.test", "A"), host, port=port, timeout=0.3)
+
+    assert proxy.stats["datagrams_dropped"] == 1
+    assert stub.queries == []
+
+
+def test_resolver_routes_queries_through_the_relay(dns_stub, stub_resolver):
+    stub = dns_stub()
+    stub_resolver(stub)
+
+    with FaultProxy({"dns": 40}) as proxy, routed(proxy):
+        started = time.perf_counter()
+        answer = resolver().resolve("plain.example.test", "A")
+        elapsed = time.perf_counter() - started
+
+    assert [record.address for record in answer] == ["192.0.2.20"]
+    assert elapsed >= 0.04
+    assert proxy.stats["datagrams"] == 2
+    assert stub.queries == [("plain.example.test.", "A")]
@@ -0,0 +1,118 @@
+import socket
+import ssl
+
+import pytest
+
+from layers.http_layer import http_keepalive_benchmark, https_exchange
+from layers.http_response import read_response
+
+
+def serve(per_connection, status_line="HTTP/1.1 200 OK", headers=""):
+    """
+    TLS handler answering up to `per_connection` requests with a 2-byte
+    body, then closing the connection without any Connection header.
+    """
+    response = f"{status_line}\r\nContent-Length: 2\r\n{headers}\r\nok".encode()
+
+    def handle(conn):
+        data = b""
+        for _ in range(per_connection):
+            while b"\r\n\r\n" not in data:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    return
+                data += chunk
+            _, _, data = data.partition(b"\r\n\r\n")
+            conn.sendall(response)
+
+    return handle
+
+
+def benchmark(server, **kwargs):
+    return http_keepalive_benchmark("localhost", ip="127.0.0.1", port=server.port, timeout=5, **kwargs)
+
+
+def test_idle_close_without_header_reconnects(tls_server):
+    server = tls_server(serve(2))
+    result = benchmark(server, requests=5)
+
+    assert result["status"] == "ok", result
+    assert [s["status_code"] for s in result["samples"]] == [200] * 5
+    assert [s["cold"] for s in result["samples"]] == [True, False, True, False, True]
+    assert result["reconnects"] == 2
+    assert server.connections == 3
+
+
+def test_http10_response_closes_the_connection(tls_server):
+    server = tls_server(serve(1, "HTTP/1.0 200 OK"))
+    result = benchmark(server, requests=3)
+
+    assert result["status"] == "ok", result
+    assert [s["cold"] for s in result["samples"]] == [True] * 3
+    assert result["reconnects"] == 2
+
+
+def test_http10_keep_alive_reuses_the_connection(tls_server):
+    server = tls_server(serve(3, "HTTP/1.0 200 OK", "Connection: keep-alive\r\n"))
+    result = benchmark(server, requests=3)
+
+    assert result["status"] == "ok", result
+    assert result["reconnects"] == 0
+    assert server.connections == 1
+
+
+def test_pipelined_requests_resent_after_close(tls_server):
+    server = tls_server(serve(2))
+    result = benchmark(server, requests=5, pipeline=True)
+
+    assert result["status"] == "ok", result
+    assert len(result["samples"]) == 5
+    assert result["reconnects"] == 2
+
+
+def test_fresh_connection_closed_without_response_is_an_error(tls_server):
+    server = tls_server(serve(0))
+    result = benchmark(server, requests=2)
+
+    assert result["status"] == "error"
+    assert "before the response started" in result["error"]
+
+
+def test_pipelined_byte_counts_include_carried_over_bytes():
+    first = b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello"
+    second = b"HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nbye"
+    client, server = socket.socketpair()
+    with client, server:
+        server.sendall(first + second)
+        server.close()
+
+        parser, _, received, leftover = read_response(client)
+        assert (parser.body_bytes, received, leftover) == (5, len(first), second)
+
+        parser, _, received, leftover = read_response(client, initial=leftover)
+        assert (parser.body_bytes, received, leftover) == (3, len(second), b"")
+
+
+def test_failed_request_closes_the_connection(tls_server, monkeypatch):
+    server = tls_server(lambda conn: conn.recv(4096))
+
+    opened = []
+    wrap_socket = ssl.SSLContext.wrap_socket
+
+    def tracked(self, *args, **kwargs):
+        wrapped = wrap_socket(self, *args, **kwargs)
+        # The server's handler thread wraps its side through the same patch
+        if not kwargs.get("server_side"):
+            opened.append(wrapped)
+        return wrapped
+
+    def broken_pipe(self, data):
+        raise BrokenPipeError("peer went away")
+
+    monkeypatch.setattr(ssl.SSLContext, "wrap_socket", tracked)
+    monkeypatch.setattr(ssl.SSLSocket, "sendall", broken_pipe)
+    with pytest.raises(BrokenPipeError):
+        https_exchange("localhost", ip="127.0.0.1", port=server.port, timeout=2)
+
+    assert len(opened) == 1
+    assert opened[0].fileno() == -1
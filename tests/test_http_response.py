@@ -0,0 +1,157 @@
+import socket
+
+import pytest
+
+from layers.http_response import ClosedBeforeResponse, HTTPResponseParser, read_response
+
+
+CHUNKED = (
+    b"HTTP/1.1 100 Continue\r\n\r\n"
+    b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\nContent-Type: text/plain\r\n\r\n"
+    b"5;ext=1\r\nhello\r\n"
+    b"b\r\n, whole wor\r\n"
+    b"2\r\nld\r\n"
+    b"0\r\nX-Checksum: abc\r\nX-Other: 1\r\n\r\n"
+)
+LENGTH = b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n0123456789"
+UNTIL_CLOSE = b"HTTP/1.0 200 OK\r\nServer: old\r\n\r\nstreamed until the end"
+
+
+def feed_split(parser, data, size):
+    """
+    Feed `data` in pieces of `size` bytes; returns the bytes left over
+    once the parser completed.
+    """
+    for offset in range(0, len(data), size):
+        piece = data[offset:offset + size]
+        consumed = parser.feed(piece)
+        if parser.complete:
+            return piece[consumed:] + data[offset + size:]
+        assert consumed == len(piece)
+    return b""
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_chunked_body_with_interim_response_and_trailers(size):
+    parser = HTTPResponseParser()
+    leftover = feed_split(parser, CHUNKED, size)
+
+    assert parser.complete
+    assert leftover == b""
+    assert parser.status_line == "HTTP/1.1 200 OK"
+    assert parser.status_code == 200
+    assert parser.headers["content-type"] == "text/plain"
+    assert parser.chunked
+    assert parser.body_bytes == len(b"hello, whole world")
+    assert not parser.closes_connection
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_content_length_body(size):
+    parser = HTTPResponseParser()
+    leftover = feed_split(parser, LENGTH, size)
+
+    assert parser.complete
+    assert leftover == b""
+    assert parser.body_bytes == 10
+    assert not parser.chunked
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_body_until_close_completes_on_eof(size):
+    parser = HTTPResponseParser()
+    feed_split(parser, UNTIL_CLOSE, size)
+
+    assert not parser.complete
+    parser.feed_eof()
+    assert parser.complete
+    assert parser.body_bytes == len(b"streamed until the end")
+    assert parser.closes_connection
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_pipelined_responses_leave_the_next_one_unconsumed(size):
+    first = HTTPResponseParser()
+    leftover = feed_split(first, CHUNKED + LENGTH, size)
+
+    assert first.complete
+    assert first.body_bytes == len(b"hello, whole world")
+    assert LENGTH.startswith(leftover)
+
+    # The rest of the second response arrives after the leftover
+    second = HTTPResponseParser()
+    consumed = second.feed(leftover)
+    assert consumed == len(leftover)
+    rest = LENGTH[len(leftover):]
+    if rest:
+        assert second.feed(rest) == len(rest)
+    assert second.complete
+    assert second.body_bytes == 10
+
+
+def test_two_pipelined_responses_in_one_recv():
+    client, server = socket.socketpair()
+    with client, server:
+        server.sendall(CHUNKED + LENGTH)
+        server.close()
+
+        first, _, received, leftover = read_response(client)
+        assert first.chunked
+        assert received == len(CHUNKED)
+        assert leftover == LENGTH
+
+        second, marks, received, leftover = read_response(client, initial=leftover)
+        assert second.body_bytes == 10
+        assert received == len(LENGTH)
+        assert leftover == b""
+        assert marks["first_byte"] == marks["headers"]
+
+
+@pytest.mark.parametrize("response", [LENGTH, CHUNKED])
+def test_eof_in_the_middle_of_the_body(response):
+    parser = HTTPResponseParser()
+    parser.feed(response[:-4])
+
+    assert parser.headers_complete
+    with pytest.raises(ConnectionError, match="before the response was complete"):
+        parser.feed_eof()
+
+
+def test_eof_before_any_byte():
+    with pytest.raises(ClosedBeforeResponse):
+        HTTPResponseParser().feed_eof()
+
+
+def test_eof_mid_body_from_the_socket():
+    client, server = socket.socketpair()
+    with client, server:
+        server.sendall(LENGTH[:-3])
+        server.close()
+
+        with pytest.raises(ConnectionError, match="before the response was complete"):
+            read_response(client)
+
+
+@pytest.mark.parametrize("head_request, status", [(True, "200 OK"), (False, "204 No Content"),
+                                                  (False, "304 Not Modified")])
+def test_responses_without_a_body(head_request, status):
+    parser = HTTPResponseParser(head_request)
+    data = f"HTTP/1.1 {status}\r\nContent-Length: 10\r\n\r\n".encode()
+
+    assert parser.feed(data + LENGTH) == len(data)
+    assert parser.complete
+    assert parser.body_bytes == 0
+
+
+def test_http10_keep_alive_keeps_the_connection():
+    parser = HTTPResponseParser()
+    parser.feed(b"HTTP/1.0 200 OK\r\nConnection: keep-alive\r\nContent-Length: 0\r\n\r\n")
+
+    assert parser.complete
+    assert not parser.closes_connection
+
+
+def test_oversized_head_is_rejected():
+    parser = HTTPResponseParser()
+    with pytest.raises(ValueError, match="head too large"):
+        parser.feed(b"HTTP/1.1 200 OK\r\nX-Big: " + b"a" * (70 * 1024))
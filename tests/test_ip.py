@@ -0,0 +1,109 @@
+import socket
+
+import pytest
+
+from layers import ip_layer
+from layers.ip_layer import _interleave, _schedule, dual_stack_race
+
+
+def listeners(v6=True):
+    """
+    Loopback listeners on one port number: IPv4, and IPv6 if `v6`.
+    """
+    for _ in range(20):
+        opened = []
+        try:
+            first = socket.create_server(("127.0.0.1", 0))
+            port = first.getsockname()[1]
+            opened.append(first)
+            if v6:
+                opened.append(socket.create_server(("::1", port), family=socket.AF_INET6))
+            return port, opened
+        except OSError:
+            for sock in opened:
+                sock.close()
+    pytest.skip("no loopback port free for both families")
+
+
+@pytest.fixture
+def addresses(monkeypatch):
+    """
+    Stand in for DNS: set the AAAA and A answers for the race.
+    """
+    answers = {"AAAA": [], "A": []}
+
+    async def lookup(host, rdtype):
+        return answers[rdtype]
+
+    monkeypatch.setattr(ip_layer, "_addresses", lookup)
+    return answers
+
+
+def test_interleave_alternates_families_starting_with_ipv6():
+    assert _interleave(["a6", "b6", "c6"], ["a4"]) == ["a6", "a4", "b6", "c6"]
+    assert _interleave([], ["a4", "b4"]) == ["a4", "b4"]
+
+
+def test_schedule_starts_the_next_attempt_early_after_a_failure():
+    attempts = [
+        {"status": "error", "failed_ms": 12.0},
+        {"status": "timeout"},
+        {"status": "ok"},
+    ]
+    _schedule(attempts, 250)
+
+    assert [a["start_ms"] for a in attempts] == [0.0, 12.0, 262.0]
+    assert "failed_ms" not in attempts[0]
+
+
+def test_ipv6_wins_when_both_families_answer(addresses):
+    port, opened = listeners()
+    addresses.update(AAAA=["::1"], A=["127.0.0.1"])
+    try:
+        result = dual_stack_race("dual.example", port)
+    finally:
+        for sock in opened:
+            sock.close()
+
+    assert result["status"] == "reachable", result
+    assert (result["ip"], result["family"]) == ("::1", "ipv6")
+    assert [a["address"] for a in result["attempts"]] == ["::1", "127.0.0.1"]
+    assert [a["start_ms"] for a in result["attempts"]] == [0.0, 250.0]
+    assert result["families"]["ipv6"] is not None and result["families"]["ipv4"] is not None
+
+
+def test_refused_ipv6_falls_back_to_ipv4_at_once(addresses):
+    port, opened = listeners(v6=False)
+    addresses.update(AAAA=["::1"], A=["127.0.0.1"])
+    try:
+        result = dual_stack_race("v4only.example", port)
+    finally:
+        for sock in opened:
+            sock.close()
+
+    assert result["status"] == "reachable", result
+    assert (result["ip"], result["family"]) == ("127.0.0.1", "ipv4")
+    assert result["attempts"][0]["status"] == "error"
+    # The IPv4 attempt starts as soon as IPv6 is refused, not after the delay
+    assert result["attempts"][1]["start_ms"] < 250
+    assert result["families"]["ipv6"] is None
+
+
+def test_no_addresses_is_unreachable(addresses):
+    result = dual_stack_race("nowhere.example", 443)
+
+    assert result["status"] == "unreachable"
+    assert "No IPv4 or IPv6 addresses" in result["error"]
+
+
+def test_nothing_listening_is_unreachable(addresses):
+    port, opened = listeners()
+    for sock in opened:
+        sock.close()
+    addresses.update(AAAA=["::1"], A=["127.0.0.1"])
+
+    result = dual_stack_race("closed.example", port)
+
+    assert result["status"] == "unreachable"
+    assert result["error"] == "No address accepted a connection"
+    assert [a["status"] for a in result["attempts"]] == ["error", "error"]
@@ -0,0 +1,132 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from layers import llm_explainer
+from layers.diagnosis import rule_explanation
+from layers.llm_explainer import BackgroundExplanation, explain_with_llm
+
+REPORT = {
+    "dns": {"status": "ok", "latency": 12.3, "ttl": 300},
+    "tcp": {"status": "ok", "connect_time_ms": 250.0},
+    "http": {"status": "error", "error": "connection reset"},
+}
+CHUNKS = ["TCP connect ", "is slow; ", "HTTP was reset."]
+
+
+class ModelServer(ThreadingHTTPServer):
+    """
+    Stand-in for the Ollama /api/generate endpoint: streams CHUNKS as
+    NDJSON, holding back the rest until `release` is set after the first.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _GenerateHandler)
+        self.requests = []
+        self.release = threading.Event()
+
+
+class _GenerateHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        for i, text in enumerate(CHUNKS):
+            self._chunk({"response": text, "done": False})
+            if i == 0:
+                self.server.release.wait(5)
+        self._chunk({"response": "", "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, message):
+        line = json.dumps(message).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    llm_explainer._cache.clear()
+    yield
+    llm_explainer._cache.clear()
+
+
+@pytest.fixture
+def model_server(monkeypatch):
+    server = ModelServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(llm_explainer, "LLM_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_chunks_stream_before_the_answer_is_complete(model_server):
+    received = []
+
+    def on_chunk(chunk):
+        received.append(chunk)
+        # The server only sends the rest once the first chunk got here
+        model_server.release.set()
+
+    result = explain_with_llm(REPORT, on_chunk)
+
+    assert result == {"status": "ok", "text": "".join(CHUNKS)}
+    assert received == CHUNKS
+
+    path, body = model_server.requests[0]
+    assert path == "/api/generate"
+    assert body["stream"] is True
+    assert '"connect_time_ms":250.0' in body["prompt"]
+
+
+def test_matching_diagnostics_are_answered_from_cache(model_server):
+    model_server.release.set()
+    explain_with_llm(REPORT)
+
+    # Differs only by noise below two significant digits
+    noisy = dict(REPORT, tcp={"status": "ok", "connect_time_ms": 251.0})
+    received = []
+    result = explain_with_llm(noisy, received.append)
+
+    assert result == {"status": "cached", "text": "".join(CHUNKS)}
+    assert received == ["".join(CHUNKS)]
+    assert len(model_server.requests) == 1
+
+
+def test_background_explanation_streams_through_a_worker(model_server):
+    model_server.release.set()
+    explanation = BackgroundExplanation(REPORT)
+
+    assert "".join(explanation.stream()) == "".join(CHUNKS)
+    assert explanation.result["status"] == "ok"
+
+
+def test_rule_based_fallback_when_the_server_is_down(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(llm_explainer, "LLM_URL", f"http://127.0.0.1:{port}")
+
+    explanation = BackgroundExplanation(REPORT)
+    text = "".join(explanation.stream())
+
+    assert explanation.result["status"] == "fallback"
+    assert text == rule_explanation(REPORT, None)
+    assert text
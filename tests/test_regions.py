@@ -0,0 +1,67 @@
+import asyncio
+
+import numpy as np
+
+from collector import Collector
+from reports.regions import MAX_LINE, CollectorClient, RegionStore
+
+START = 1_700_000_000
+
+
+async def _ship(client, runs):
+    for ts, metrics in runs:
+        client.push("example.com", ts, metrics)
+    stop = asyncio.Event()
+    stop.set()
+    # With stop already set, run() ships the buffer and returns
+    await asyncio.wait_for(client.run(stop), 10)
+
+
+def test_interleaved_agents_in_one_region_keep_every_run(tmp_path):
+    store = RegionStore(str(tmp_path))
+
+    async def scenario():
+        collector = Collector(store)
+        server = await asyncio.start_server(collector.handle, "127.0.0.1", 0, limit=MAX_LINE)
+        port = server.sockets[0].getsockname()[1]
+
+        a = CollectorClient("127.0.0.1", port, "eu-west", agent="a", batch_size=4)
+        b = CollectorClient("127.0.0.1", port, "eu-west", agent="b", batch_size=4)
+        # b's runs fall between a's, and arrive after them
+        await _ship(a, [(START + 2 * i, {"tcp": 10.0, "dns": 1.0}) for i in range(10)])
+        await _ship(b, [(START + 2 * i + 1, {"tcp": 20.0, "dns": None}) for i in range(10)])
+
+        server.close()
+        await collector.close()
+        return a, b
+
+    a, b = asyncio.run(scenario())
+    assert a.sent == b.sent == 10
+
+    region = store.store("eu-west")
+    tcp = region.query("example.com", "tcp")
+    assert list(tcp["ts"]) == [(START + i) * 1000 for i in range(20)]
+    assert list(tcp["mean"]) == [10.0, 20.0] * 10
+    assert region.query("example.com", "dns")["lost"].sum() == 10
+
+
+def test_append_reports_runs_behind_the_rolled_up_history(tmp_path):
+    store = RegionStore(str(tmp_path))
+    start = START // 60 * 60
+
+    assert store.append("us-east", [
+        {"domain": "example.com", "ts": start + 600, "metrics": {"tcp": 1.0}},
+        {"domain": "example.com", "ts": start + 30, "metrics": {"tcp": 1.0}},
+    ]) == (2, 0)
+    # Past the 7-day raw retention, both are rolled up
+    now = start + 8 * 86400
+    assert store.compact(now=now) == 2
+
+    written, late = store.append("us-east", [
+        {"domain": "example.com", "ts": start - 120, "metrics": {"tcp": 5.0}},
+        {"domain": "example.com", "ts": now - 10, "metrics": {"tcp": 5.0}},
+    ])
+    assert (written, late) == (1, 1)
+    series = store.store("us-east").query("example.com", "tcp")
+    assert np.all(np.diff(series["ts"]) >= 0)
+    assert series["count"].sum() == 3
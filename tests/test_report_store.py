@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from reports.report_store import ReportStore, _grouped_percentile
+
+
+@pytest.mark.parametrize("q", [0, 25, 50, 95, 99, 100])
+def test_grouped_percentile_matches_numpy_per_group(q):
+    rng = np.random.default_rng(3)
+    groups = rng.integers(0, 6, 500).astype(np.int32)
+    values = rng.lognormal(3, 1, 500)
+
+    ids, p = _grouped_percentile(groups, values, q)
+
+    assert ids.tolist() == sorted(set(groups.tolist()))
+    expected = [np.percentile(values[groups == g], q) for g in ids]
+    assert p == pytest.approx(expected)
+
+
+def test_grouped_percentile_of_single_values_and_ties():
+    groups = np.array([4, 1, 4, 4, 1], dtype=np.int32)
+    values = np.array([7.0, 3.0, 7.0, 7.0, 3.0])
+
+    ids, p = _grouped_percentile(groups, values, 95)
+
+    assert ids.tolist() == [1, 4]
+    assert p.tolist() == [3.0, 7.0]
+
+    ids, p = _grouped_percentile(np.array([2], dtype=np.int32), np.array([5.0]), 50)
+    assert (ids.tolist(), p.tolist()) == ([2], [5.0])
+
+
+def test_grouped_percentile_of_nothing():
+    ids, p = _grouped_percentile(np.empty(0, np.int32), np.empty(0), 95)
+
+    assert len(ids) == 0 and len(p) == 0
+
+
+def report(domain, second, tcp_ms):
+    return {
+        "meta": {"domain": domain, "timestamp": f"2026-01-01T00:00:{second:02d}Z"},
+        "results": {"tcp": {"status": "ok", "connect_time_ms": tcp_ms}},
+    }
+
+
+def test_percentile_per_domain_ignores_missing_values(tmp_path):
+    store = ReportStore(str(tmp_path))
+    store.append_many(
+        [report("a.example", i, float(i)) for i in range(1, 11)]
+        + [report("b.example", i, 100.0 + i) for i in range(1, 6)]
+        # A failed run has no connect time: NaN in that column
+        + [{"meta": {"domain": "b.example", "timestamp": "2026-01-01T00:00:30Z"},
+            "results": {"tcp": {"status": "error", "error": "refused"}}}]
+    )
+
+    per_domain = store.percentile("tcp.connect_time_ms", 50)
+    assert per_domain == {"a.example": pytest.approx(5.5), "b.example": pytest.approx(103.0)}
+
+    overall = store.percentile("tcp.connect_time_ms", 100, by_domain=False)
+    assert overall == 105.0
+
+    assert store.percentile("tcp.connect_time_ms", 50, domains=["b.example"]) == {"b.example": 103.0}
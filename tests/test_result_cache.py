@@ -0,0 +1,33 @@
+from layers.result_cache import ResultCache, cached_probes
+
+
+def _counting_probe(calls):
+    def probe(domain, upstream):
+        calls.append(domain)
+        return {"status": "ok", "run": len(calls)}
+    return probe
+
+
+def test_ttl_zero_probes_every_run_but_replays_the_last_results():
+    calls = []
+    session, shared = ResultCache(), ResultCache()
+    probes = {"tcp": _counting_probe(calls)}
+
+    def run(replay=False):
+        wrapped = cached_probes(probes, {}, 0, (session, shared), set(), replay)
+        return wrapped["tcp"]("example.com", {})
+
+    assert run() == {"status": "ok", "run": 1}
+    assert run() == {"status": "ok", "run": 2}
+    # A widget change redraws what was just shown instead of "not_run"
+    assert run(replay=True) == {"status": "ok", "run": 2}
+    assert len(calls) == 2
+
+
+def test_replay_without_a_result_does_not_probe():
+    calls = []
+    wrapped = cached_probes({"tcp": _counting_probe(calls)}, {}, 60,
+                            (ResultCache(), ResultCache()), set(), replay=True)
+
+    assert wrapped["tcp"]("example.com", {}) == {"status": "not_run"}
+    assert calls == []
@@ -0,0 +1,111 @@
+import contextvars
+import threading
+import time
+
+from layers.scheduler import report_progress, run_layers
+
+
+def test_layers_start_after_their_dependencies():
+    order = []
+
+    def probe(name):
+        def run(domain, upstream):
+            order.append((name, sorted(upstream)))
+            time.sleep(0.05)
+            return {"status": "ok", "name": name}
+        return run
+
+    probes = {name: probe(name) for name in ("dns", "tcp", "http", "quic")}
+    dependencies = {"dns": (), "tcp": ("dns",), "http": ("dns",), "quic": ("http",)}
+
+    finished = [name for name, _ in run_layers("example.com", list(probes), probes, 4, dependencies)]
+
+    assert order[0] == ("dns", [])
+    assert sorted(order[1:3]) == [("http", ["dns"]), ("tcp", ["dns"])]
+    assert order[3] == ("quic", ["http"])
+    assert finished[0] == "dns" and finished[-1] == "quic"
+
+
+def test_dependencies_on_disabled_layers_are_ignored():
+    upstreams = {}
+
+    def probe(domain, upstream):
+        upstreams["http"] = upstream
+        return {"status": "ok"}
+
+    results = dict(run_layers("example.com", ["http"], {"http": probe, "dns": probe}, 2,
+                              {"http": ("dns",)}))
+
+    assert results == {"http": {"status": "ok"}}
+    assert upstreams["http"] == {}
+
+
+def test_unknown_layers_are_skipped():
+    probes = {"dns": lambda domain, upstream: {"status": "ok"}}
+
+    assert [name for name, _ in run_layers("example.com", ["dns", "nope"], probes, 2, {})] == ["dns"]
+
+
+def test_partial_results_precede_the_final_one():
+    def probe(domain, upstream):
+        report_progress({"hops": [1]})
+        report_progress({"hops": [1, 2]})
+        return {"status": "ok", "hops": [1, 2, 3]}
+
+    events = list(run_layers("example.com", ["traceroute"], {"traceroute": probe}, 1, {}))
+
+    assert events == [
+        ("traceroute", {"status": "partial", "hops": [1]}),
+        ("traceroute", {"status": "partial", "hops": [1, 2]}),
+        ("traceroute", {"status": "ok", "hops": [1, 2, 3]}),
+    ]
+
+
+def test_report_progress_outside_run_layers_is_a_no_op():
+    report_progress({"hops": []})
+
+
+def test_failing_probe_becomes_an_error_and_dependents_still_run():
+    def broken(domain, upstream):
+        raise RuntimeError("resolver exploded")
+
+    seen = {}
+
+    def dependent(domain, upstream):
+        seen.update(upstream)
+        return {"status": "ok"}
+
+    results = dict(run_layers("example.com", ["dns", "tcp"], {"dns": broken, "tcp": dependent}, 2,
+                              {"tcp": ("dns",)}))
+
+    assert results["dns"] == {"status": "error", "error": "resolver exploded"}
+    assert results["tcp"] == {"status": "ok"}
+    assert seen == {"dns": results["dns"]}
+
+
+def test_independent_layers_run_concurrently_up_to_max_workers():
+    barrier = threading.Barrier(3, timeout=1)
+
+    def probe(domain, upstream):
+        barrier.wait()
+        return {"status": "ok"}
+
+    probes = {name: probe for name in ("a", "b", "c")}
+    results = dict(run_layers("example.com", list(probes), probes, 3, {}))
+
+    assert all(result == {"status": "ok"} for result in results.values())
+
+    # With fewer workers than the barrier needs, every probe times out waiting
+    barrier.reset()
+    results = dict(run_layers("example.com", ["a", "b"], probes, 2, {}))
+    assert all(result["status"] == "error" for result in results.values())
+
+
+def test_probes_see_the_callers_context():
+    active = contextvars.ContextVar("active", default=None)
+    token = active.set("proxy")
+    try:
+        probes = {"http": lambda domain, upstream: {"status": "ok", "active": active.get()}}
+        assert dict(run_layers("example.com", ["http"], probes, 1, {}))["http"]["active"] == "proxy"
+    finally:
+        active.reset(token)
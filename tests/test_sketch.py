@@ -0,0 +1,106 @@
+import json
+
+import numpy as np
+import pytest
+
+from reports.sketch import DDSketch, merge_sketches
+
+
+QUANTILES = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999, 1.0]
+
+
+def latencies(count=20000, seed=1):
+    return np.random.default_rng(seed).lognormal(mean=3, sigma=1.2, size=count)
+
+
+def exact(values, q):
+    # The sketch ranks like "lower" interpolation: the value at index floor(q * (n - 1))
+    return np.sort(values)[int(q * (len(values) - 1))]
+
+
+@pytest.mark.parametrize("accuracy", [0.01, 0.05])
+def test_quantiles_within_relative_accuracy(accuracy):
+    values = latencies()
+    sketch = DDSketch(accuracy)
+    sketch.add_many(values.tolist())
+
+    for q in QUANTILES:
+        true = exact(values, q)
+        assert abs(sketch.quantile(q) - true) <= accuracy * true * (1 + 1e-9), q
+
+
+def test_merged_sketches_match_one_sketch():
+    values = latencies()
+    whole = DDSketch()
+    whole.add_many(values.tolist())
+
+    merged = DDSketch()
+    for part in np.array_split(values, 7):
+        sketch = DDSketch()
+        sketch.add_many(part.tolist())
+        merged.merge(sketch)
+
+    assert merged.bins == whole.bins
+    assert merged.count == whole.count
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+    assert merged.sum == pytest.approx(whole.sum)
+    assert [merged.quantile(q) for q in QUANTILES] == [whole.quantile(q) for q in QUANTILES]
+
+
+def test_round_trip_through_json():
+    sketch = DDSketch()
+    sketch.add_many(latencies(500).tolist() + [0.0, None, float("nan")])
+
+    restored = DDSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+    assert restored.to_dict() == sketch.to_dict()
+    assert [restored.quantile(q) for q in QUANTILES] == [sketch.quantile(q) for q in QUANTILES]
+
+
+def test_empty_sketch_round_trips():
+    restored = DDSketch.from_dict(DDSketch().to_dict())
+
+    assert restored.count == 0
+    assert restored.quantile(0.5) is None
+    assert restored.mean is None
+
+
+def test_lost_probes_skipped_and_zeros_counted():
+    sketch = DDSketch()
+    sketch.add_many([None, float("nan"), 0.0, 0.0, 10.0, 20.0])
+
+    assert sketch.count == 4
+    assert sketch.zero_count == 2
+    assert sketch.quantile(0.0) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(20.0, rel=0.01)
+    assert sketch.mean == 7.5
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch(0.02))
+
+
+def test_collapsing_keeps_high_quantiles_accurate():
+    values = latencies()
+    # 256 bins at 1% span ~160x: from below the median up to the maximum
+    sketch = DDSketch(max_bins=256)
+    sketch.add_many(values.tolist())
+
+    assert len(sketch.bins) == 256
+    assert sketch.count == len(values)
+    for q in (0.5, 0.9, 0.99, 1.0):
+        true = exact(values, q)
+        assert abs(sketch.quantile(q) - true) <= 0.01 * true * (1 + 1e-9), q
+
+
+def test_merge_sketches_combines_serialised_reports():
+    first, second = DDSketch(), DDSketch()
+    first.add_many([1.0, 2.0])
+    second.add_many([3.0])
+
+    merged = merge_sketches({}, {"tcp.connect_time_ms": first.to_dict()})
+    merge_sketches(merged, {"tcp.connect_time_ms": second.to_dict(), "dns.latency": second.to_dict()})
+
+    assert merged["tcp.connect_time_ms"].count == 3
+    assert merged["dns.latency"].count == 1
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import numpy as np
+
+from reports.timeseries import TimeSeriesStore
+
+
+def test_compaction_on_another_thread_keeps_concurrent_appends(tmp_path):
+    # Everything older than 1 s rolls up, so every compaction rewrites raw
+    store = TimeSeriesStore(str(tmp_path), raw_retention_s=1, minute_retention_s=86400)
+    start = 1_700_000_000
+    points = 3000
+    latest = [start]
+    done = threading.Event()
+
+    def compact():
+        while not done.is_set():
+            store.compact(now=latest[0] + 2)
+
+    compactor = threading.Thread(target=compact)
+    compactor.start()
+    try:
+        for i in range(points):
+            latest[0] = start + i * 0.1
+            assert store.append("example.com", latest[0], {"tcp": 1.0, "dns": None})
+    finally:
+        done.set()
+        compactor.join()
+
+    tcp = store.query("example.com", "tcp")
+    dns = store.query("example.com", "dns")
+    assert tcp["count"].sum() == points
+    assert dns["lost"].sum() == points
+    assert np.all(np.diff(tcp["ts"]) >= 0)
+
+
+def test_late_points_are_merged_into_place(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    start = 1_700_000_000
+
+    skipped = store.append_many("example.com", [
+        (start + 3, {"tcp": 3.0}), (start + 1, {"tcp": 1.0}), (start + 4, {"tcp": 4.0})
+    ])
+    assert skipped == 0
+    assert store.append("example.com", start + 2, {"tcp": 2.0})
+
+    series = store.query("example.com", "tcp")
+    assert list(series["ts"]) == [(start + i) * 1000 for i in range(1, 5)]
+    assert list(series["mean"]) == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_points_behind_rolled_up_history_are_skipped(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), raw_retention_s=60)
+    start = 1_700_000_000 // 60 * 60
+
+    store.append("example.com", start + 30, {"tcp": 1.0, "dns": 1.0})
+    store.append("example.com", start + 600, {"tcp": 1.0, "dns": 1.0})
+    assert store.compact(now=start + 600) == 2
+
+    assert not store.append("example.com", start - 60, {"tcp": 9.0, "dns": 9.0})
+    assert store.query("example.com", "tcp")["count"].sum() == 2
+    assert store.query("example.com", "dns")["count"].sum() == 2
+
+
+def test_append_drops_rows_left_by_a_torn_append(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    start = 1_700_000_000
+    store.append("example.com", start, {"tcp": 1.0})
+
+    # A writer died after writing the timestamp column but not the values
+    path = store._series_path("example.com", "tcp")
+    with open(os.path.join(path, "raw.ts"), "ab") as f:
+        f.write(np.asarray([(start + 1) * 1000], dtype="<i8").tobytes())
+
+    store.append("example.com", start + 2, {"tcp": 3.0})
+    store.append("example.com", start + 3, {"tcp": 4.0})
+
+    tcp = store.query("example.com", "tcp")
+    assert tcp["ts"].tolist() == [start * 1000, (start + 2) * 1000, (start + 3) * 1000]
+    assert tcp["mean"].tolist() == [1.0, 3.0, 4.0]
@@ -0,0 +1,68 @@
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+from layers import traceroute_layer
+from layers.traceroute_layer import udp_traceroute
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs IP_RECVERR")
+def test_udp_prober_reaches_loopback_on_port_unreachable():
+    result = udp_traceroute("127.0.0.1", max_hops=3, deadline=2.0)
+
+    assert result["reached"]
+    assert [hop["ip"] for hop in result["hops"]] == ["127.0.0.1"]
+    assert len(result["hops"][0]["rtts"]) == 3
+
+
+def fake_traceroute(tmp_path, monkeypatch, *lines):
+    """
+    Put a traceroute on PATH that prints `lines`, then hangs.
+    """
+    fake = tmp_path / "traceroute"
+    fake.write_text("#!/bin/sh\n" + "".join(f"echo '{line}'\n" for line in lines) + "exec sleep 30\n")
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def no_udp_prober(*args):
+    raise OSError("The UDP prober needs Linux IP_RECVERR")
+
+
+def test_system_traceroute_keeps_hops_printed_before_timeout(tmp_path, monkeypatch):
+    fake_traceroute(tmp_path, monkeypatch,
+                    " 1  gw (192.0.2.1)  1.201 ms  1.105 ms  1.320 ms", " 2  * * *")
+    monkeypatch.setattr(traceroute_layer, "PROBE_WAIT_S", 0.2)
+
+    result = traceroute_layer._subprocess_traceroute("192.0.2.99", max_hops=2, probes_per_hop=1)
+
+    assert result["status"] == "ok"
+    assert not result["complete"]
+    assert [hop["ip"] for hop in result["hops"]] == ["192.0.2.1", None]
+    assert result["hops"][0]["latency"] == pytest.approx(1.105)
+
+
+def test_fallback_stops_at_the_overall_deadline(tmp_path, monkeypatch):
+    fake_traceroute(tmp_path, monkeypatch, " 1  gw (192.0.2.1)  1.201 ms")
+    monkeypatch.setattr(traceroute_layer, "udp_traceroute", no_udp_prober)
+
+    started = time.monotonic()
+    result = traceroute_layer.traceroute_host("192.0.2.99", deadline=0.5)
+
+    assert time.monotonic() - started < 2
+    assert result["status"] == "ok"
+    assert not result["complete"]
+    assert [hop["ip"] for hop in result["hops"]] == ["192.0.2.1"]
+
+
+def test_fallback_without_hops_by_the_deadline_is_an_error(tmp_path, monkeypatch):
+    fake_traceroute(tmp_path, monkeypatch)
+    monkeypatch.setattr(traceroute_layer, "udp_traceroute", no_udp_prober)
+
+    result = traceroute_layer.traceroute_host("192.0.2.99", deadline=0.3)
+
+    assert result["status"] == "error"
+    assert "no hops" in result["error"]
@@ -1,22 +1,168 @@
-import plotly.graph_objects as go
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from visuals.downsample import downsample_series
+
+
+# Distinct figures kept by memoized()
+CHART_CACHE_SIZE = 256
+
+# Line charts switch to WebGL traces above this many points, and time
+# series are downsampled to at most HISTORY_MAX_POINTS per metric
+WEBGL_POINTS = 1000
+HISTORY_MAX_POINTS = 1500
+
+# Each layer keeps its colour across charts; other series take PALETTE in order
+LAYER_COLORS = {"dns": "#58a6ff", "ip": "#2ecc71", "tcp": "#f1c40f", "http": "#f78166"}
+PALETTE = ["#58a6ff", "#2ecc71", "#f1c40f", "#f78166", "#a371f7", "#79c0ff", "#ff7b72", "#56d4dd"]
+
+# Layout shared by every chart, on top of Plotly's default template;
+# charts only set what differs (title, axis titles, a compact height).
+# Axes grow the margin to fit long category labels.
+CHART_LAYOUT = dict(
+    paper_bgcolor="rgba(0,0,0,0)",
+    plot_bgcolor="rgba(0,0,0,0)",
+    font=dict(color="#e6e6e6"),
+    colorway=PALETTE,
+    height=320,
+    margin=dict(l=50, r=20, t=50, b=40),
+    xaxis=dict(automargin=True, zeroline=False),
+    yaxis=dict(automargin=True, zeroline=False),
+)
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+
+def memoized(chart):
+    """
+    Build a chart once per distinct input. Figures are cached under their
+    arguments (compared by value, NumPy arrays included) and shared
+    between callers, so they must not be modified after building.
+    """
+    @functools.wraps(chart)
+    def cached(*args, **kwargs):
+        key = (chart.__name__, json.dumps([args, kwargs], sort_keys=True, default=_jsonable))
+
+        with _figures_lock:
+            fig = _figures.get(key)
+            if fig is not None:
+                _figures.move_to_end(key)
+                return fig
+
+        fig = chart(*args, **kwargs)
+
+        with _figures_lock:
+            _figures[key] = fig
+            while len(_figures) > CHART_CACHE_SIZE:
+                _figures.popitem(last=False)
+        return fig
+
+    return cached
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        # Fleet grids run to 100k+ cells; hashing beats spelling them out
+        digest = hashlib.blake2b(np.ascontiguousarray(value).tobytes(), digest_size=16).hexdigest()
+        return [value.dtype.str, value.shape, digest]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return repr(value)
+
+
+@functools.lru_cache(maxsize=None)
+def warm_up():
+    """
+    Load Plotly in the background, once per process. Its trace classes
+    load on first use, so otherwise the first chart shown pays for it.
+    """
+    thread = threading.Thread(target=_build_sample, daemon=True)
+    thread.start()
+    return thread
+
+
+def _build_sample():
+    import plotly.graph_objects as go
+
+    _figure([go.Bar(), go.Scatter(), go.Scattergl(), go.Heatmap(), go.Indicator()]).to_json()
+
+
+@functools.lru_cache(maxsize=None)
+def chart_template():
+    """
+    Plotly template with CHART_LAYOUT, built once and shared by every figure.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    template = go.layout.Template(pio.templates[pio.templates.default])
+    template.layout.update(CHART_LAYOUT)
+    return template
+
+
+def _figure(data=None):
+    import plotly.graph_objects as go
+
+    # Streamlit sizes a chart from layout.height alone, not the template's
+    return go.Figure(data, layout=dict(template=chart_template(), height=CHART_LAYOUT["height"]))
+
+
+def _scatter(points: int):
+    # SVG redraws every point on each hover and zoom; WebGL keeps long series responsive
+    import plotly.graph_objects as go
+
+    return go.Scattergl if points > WEBGL_POINTS else go.Scatter
+
+
+def layer_color(layer: str, index: int = 0):
+    """
+    Colour of a layer's series, the same in every chart; unknown layers
+    take the `index`th palette colour.
+    """
+    return LAYER_COLORS.get(layer.lower(), PALETTE[index % len(PALETTE)])
 
 
 # ======================================================
 # DNS — Latency Gauge Bar
 # ======================================================
-def latency_bar(title: str, latency_ms: float):
+# Bar colours for a baseline verdict (reports.baseline)
+VERDICT_COLORS = {
+    "normal": "#2ecc71",     # green
+    "elevated": "#f1c40f",   # yellow
+    "anomalous": "#e74c3c",  # red
+}
+
+
+def latency_color(latency_ms: float, verdict: str = None):
+    """
+    Colour for a latency: from its baseline verdict once the domain has
+    one, otherwise from fixed thresholds.
+    """
+    if verdict in VERDICT_COLORS:
+        return VERDICT_COLORS[verdict]
+    if latency_ms < 100:
+        return "#2ecc71"   # green
+    if latency_ms < 300:
+        return "#f1c40f"   # yellow
+    return "#e74c3c"       # red
+
+
+@memoized
+def latency_bar(title: str, latency_ms: float, verdict: str = None):
     """
     Clean, semantic latency bar (observability style).
     """
+    import plotly.graph_objects as go
 
-    if latency_ms < 100:
-        color = "#2ecc71"   # green
-    elif latency_ms < 300:
-        color = "#f1c40f"   # yellow
-    else:
-        color = "#e74c3c"   # red
+    color = latency_color(latency_ms, verdict)
 
-    fig = go.Figure()
+    fig = _figure()
 
     fig.add_trace(
         go.Bar(
@@ -32,17 +178,51 @@ def latency_bar(title: str, latency_ms: float):
 
     fig.update_layout(
         title=dict(text=title, x=0.02, font=dict(size=18)),
-        xaxis=dict(
-            title="Milliseconds",
-            showgrid=False,
-            zeroline=False,
-        ),
+        xaxis=dict(title="Milliseconds", showgrid=False),
         yaxis=dict(showticklabels=False),
         height=180,
         margin=dict(l=20, r=20, t=50, b=20),
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font=dict(color="#e6e6e6"),
+    )
+
+    return fig
+
+
+# ======================================================
+# DNS — Resolver Comparison
+# ======================================================
+@memoized
+def resolver_latency_chart(rows):
+    """
+    Cold vs repeat query latency for each resolver.
+    """
+    import plotly.graph_objects as go
+
+    rows = [row for row in rows if row["status"] == "ok"]
+    names = [row["resolver"] for row in rows]
+
+    fig = _figure()
+
+    fig.add_trace(
+        go.Bar(
+            x=names,
+            y=[row["cold_ms"] for row in rows],
+            marker=dict(color="#f78166"),
+            name="First query",
+        )
+    )
+    fig.add_trace(
+        go.Bar(
+            x=names,
+            y=[row["warm_ms"] for row in rows],
+            marker=dict(color="#2ecc71"),
+            name="Repeat query",
+        )
+    )
+
+    fig.update_layout(
+        title="DNS Resolvers — First vs Repeat Query",
+        yaxis_title="Milliseconds",
+        barmode="group",
     )
 
     return fig
@@ -51,14 +231,16 @@ def latency_bar(title: str, latency_ms: float):
 # ======================================================
 # IP — Ping Sparkline
 # ======================================================
-def ping_line(latencies):
+@memoized
+def ping_line(latencies, title: str = "Ping Latency Over Time"):
     """
     Sparkline-style ping latency over packets.
+    Lost packets (None) show up as gaps.
     """
-    fig = go.Figure()
+    fig = _figure()
 
     fig.add_trace(
-        go.Scatter(
+        _scatter(len(latencies))(
             y=latencies,
             mode="lines+markers",
             line=dict(color="#58a6ff", width=2),
@@ -68,14 +250,10 @@ def ping_line(latencies):
     )
 
     fig.update_layout(
-        title="Ping Latency Over Time",
+        title=title,
         xaxis_title="Packet Index",
         yaxis_title="Milliseconds",
         height=260,
-        margin=dict(l=40, r=20, t=50, b=40),
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font=dict(color="#e6e6e6"),
     )
 
     return fig
@@ -84,15 +262,22 @@ def ping_line(latencies):
 # ======================================================
 # Traceroute — Hop Latency Curve
 # ======================================================
+@memoized
 def traceroute_chart(hops):
     """
-    Hop-by-hop traceroute latency curve.
+    Hop-by-hop traceroute latency curve. Hops that never replied have no
+    latency and show as gaps.
     """
+    import plotly.graph_objects as go
+
     x = [hop["hop"] for hop in hops]
     y = [hop["latency"] for hop in hops]
-    labels = [f'{hop["host"]} ({hop["ip"]})' for hop in hops]
+    labels = [
+        f'{hop["host"]} ({hop["ip"]})' if hop["ip"] else "* no reply"
+        for hop in hops
+    ]
 
-    fig = go.Figure()
+    fig = _figure()
 
     fig.add_trace(
         go.Scatter(
@@ -111,11 +296,56 @@ def traceroute_chart(hops):
         title="Traceroute — Hop-by-Hop Latency",
         xaxis_title="Hop Number",
         yaxis_title="Latency (ms)",
-        height=320,
-        margin=dict(l=50, r=20, t=50, b=40),
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font=dict(color="#e6e6e6"),
+    )
+
+    return fig
+
+
+# ======================================================
+# IP — Dual-stack Race
+# ======================================================
+@memoized
+def dual_stack_chart(attempts):
+    """
+    Connect attempt per address, placed where a Happy Eyeballs client
+    would start it. Failed and timed-out addresses are marked in red.
+    """
+    import plotly.graph_objects as go
+
+    fig = _figure()
+
+    for family, color in (("ipv6", "#58a6ff"), ("ipv4", "#2ecc71")):
+        rows = [a for a in attempts if a["family"] == family and a["status"] == "ok"]
+        fig.add_trace(
+            go.Bar(
+                x=[a["connect_ms"] for a in rows],
+                y=[a["address"] for a in rows],
+                base=[a["start_ms"] for a in rows],
+                orientation="h",
+                marker=dict(color=color),
+                name="IPv6" if family == "ipv6" else "IPv4",
+                hovertemplate="%{y}<br>Start: %{base} ms<br>Connect: %{x} ms",
+            )
+        )
+
+    failed = [a for a in attempts if a["status"] != "ok"]
+    fig.add_trace(
+        go.Scatter(
+            x=[a["start_ms"] for a in failed],
+            y=[a["address"] for a in failed],
+            mode="markers",
+            marker=dict(color="#e74c3c", symbol="x", size=12),
+            text=[a["error"] for a in failed],
+            hovertemplate="%{y}<br>%{text}",
+            name="Failed",
+        )
+    )
+
+    fig.update_layout(
+        title="IPv4 / IPv6 Race — Connect Attempts",
+        xaxis_title="Milliseconds since first attempt",
+        yaxis=dict(autorange="reversed"),
+        height=max(220, 60 + 40 * len(attempts)),
     )
 
     return fig
@@ -124,21 +354,25 @@ def traceroute_chart(hops):
 # ======================================================
 # TCP — Handshake Timeline
 # ======================================================
-def tcp_handshake_timeline(connect_time_ms: float):
+@memoized
+def tcp_handshake_timeline(connect_time_ms: float, verdict: str = None):
     """
-    Visual timeline of TCP three-way handshake.
+    Visual timeline of TCP three-way handshake, coloured by the baseline
+    verdict when there is one.
     """
+    import plotly.graph_objects as go
+
     steps = ["SYN", "SYN-ACK", "ACK"]
     times = [0, connect_time_ms * 0.6, connect_time_ms]
 
-    fig = go.Figure()
+    fig = _figure()
 
     fig.add_trace(
         go.Scatter(
             x=times,
             y=steps,
             mode="lines+markers",
-            line=dict(color="#a371f7", width=3),
+            line=dict(color=VERDICT_COLORS.get(verdict, "#a371f7"), width=3),
             marker=dict(size=10),
             name="TCP Handshake",
         )
@@ -149,10 +383,6 @@ def tcp_handshake_timeline(connect_time_ms: float):
         xaxis_title="Time (ms)",
         yaxis_title="Step",
         height=260,
-        margin=dict(l=50, r=20, t=50, b=40),
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font=dict(color="#e6e6e6"),
     )
 
     return fig
@@ -161,14 +391,17 @@ def tcp_handshake_timeline(connect_time_ms: float):
 # ======================================================
 # TLS — Status Card
 # ======================================================
+@memoized
 def tls_status_card(expired: bool):
     """
     TLS certificate validity indicator.
     """
+    import plotly.graph_objects as go
+
     status = "EXPIRED" if expired else "VALID"
     color = "#e74c3c" if expired else "#2ecc71"
 
-    fig = go.Figure(
+    fig = _figure(
         go.Indicator(
             mode="number",
             value=1,
@@ -177,10 +410,40 @@ def tls_status_card(expired: bool):
         )
     )
 
+    fig.update_layout(height=180)
+
+    return fig
+
+
+# ======================================================
+# TLS — Full vs Resumed Handshake
+# ======================================================
+@memoized
+def tls_resumption_chart(full_ms: float, resumed_ms: float, reused: bool):
+    """
+    Full handshake next to the resumed one.
+    """
+    import plotly.graph_objects as go
+
+    labels = ["Full Handshake", "Resumed" if reused else "Resumption Failed"]
+    values = [full_ms, resumed_ms]
+    colors = ["#f78166", "#2ecc71" if reused else "#e74c3c"]
+
+    fig = _figure()
+
+    fig.add_trace(
+        go.Bar(
+            x=labels,
+            y=values,
+            marker=dict(color=colors),
+            text=[f"{v:.1f} ms" for v in values],
+            textposition="auto",
+        )
+    )
+
     fig.update_layout(
-        height=180,
-        paper_bgcolor="rgba(0,0,0,0)",
-        font=dict(color="#e6e6e6"),
+        title="TLS Handshake — Session Resumption",
+        yaxis_title="Milliseconds",
     )
 
     return fig
@@ -189,21 +452,29 @@ def tls_status_card(expired: bool):
 # ======================================================
 # HTTP — Waterfall Breakdown
 # ======================================================
-def http_waterfall_chart(timings: dict):
+@memoized
+def http_waterfall_chart(timings: dict, verdict: str = None):
     """
-    Horizontal waterfall of HTTP request phases.
+    Horizontal waterfall of HTTP request phases; the total bar takes the
+    baseline verdict's colour.
     """
+    import plotly.graph_objects as go
+
     phases = list(timings.keys())
     values = list(timings.values())
+    colors = [
+        VERDICT_COLORS.get(verdict, "#79c0ff") if phase == "total" else "#79c0ff"
+        for phase in phases
+    ]
 
-    fig = go.Figure()
+    fig = _figure()
 
     fig.add_trace(
         go.Bar(
             x=values,
             y=phases,
             orientation="h",
-            marker=dict(color="#79c0ff"),
+            marker=dict(color=colors),
             text=[f"{v:.1f} ms" for v in values],
             textposition="inside",
         )
@@ -213,11 +484,6 @@ def http_waterfall_chart(timings: dict):
         title="HTTP Request Waterfall",
         xaxis_title="Milliseconds",
         yaxis_title="Phase",
-        height=320,
-        margin=dict(l=120, r=20, t=50, b=40),
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font=dict(color="#e6e6e6"),
     )
 
     return fig
@@ -226,38 +492,55 @@ def http_waterfall_chart(timings: dict):
 # ======================================================
 # QUIC vs TCP — Comparison
 # ======================================================
-def quic_vs_tcp_chart(tcp_time_ms: float, quic_time_ms: float):
+QUIC_PHASES = [
+    # (label, curl timer it ends at, colour)
+    ("DNS", "namelookup", "#2ecc71"),
+    ("Connect", "connect", "#a371f7"),
+    ("Handshake", "appconnect", "#f1c40f"),
+    ("Server", "starttransfer", "#79c0ff"),
+    ("Transfer", "total", "#f78166"),
+]
+
+
+@memoized
+def quic_vs_tcp_chart(tcp_timings: dict, quic_timings: dict):
     """
-    Side-by-side protocol comparison.
+    Side-by-side protocol comparison, each bar split into its phases.
+    Timings are curl's cumulative timers (quic_layer.curl_probe).
     """
-    protocols = ["TCP (HTTP/1.1)", "QUIC (HTTP/3)"]
-    values = [tcp_time_ms, quic_time_ms]
-    colors = ["#f78166", "#2ecc71"]
+    import plotly.graph_objects as go
 
-    fig = go.Figure()
-
-    fig.add_trace(
-        go.Bar(
-            x=protocols,
-            y=values,
-            marker=dict(color=colors),
-            text=[f"{v:.1f} ms" for v in values],
-            textposition="auto",
+    protocols = ["TCP (HTTP/1.1)", "QUIC (HTTP/3)"]
+    timings = [tcp_timings or {}, quic_timings]
+
+    fig = _figure()
+
+    previous = [0.0, 0.0]
+    for label, timer, color in QUIC_PHASES:
+        ends = [t.get(timer, 0.0) for t in timings]
+        # With QUIC the transport and TLS handshakes finish together
+        durations = [max(end - start, 0.0) for start, end in zip(previous, ends)]
+        previous = [max(start, end) for start, end in zip(previous, ends)]
+
+        fig.add_trace(
+            go.Bar(
+                x=protocols,
+                y=durations,
+                name=label,
+                marker=dict(color=color),
+                hovertemplate="%{y:.1f} ms",
+            )
         )
-    )
 
     fig.update_layout(
-        title="QUIC vs TCP — Total Request Time",
+        title="QUIC vs TCP — Request Phases (median)",
         yaxis_title="Milliseconds",
-        height=300,
-        margin=dict(l=40, r=20, t=50, b=40),
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font=dict(color="#e6e6e6"),
+        barmode="stack",
     )
 
     return fig
 
+@memoized
 def request_time_breakdown(timings: dict):
     """
     Stacked bar showing where time was spent across layers.
@@ -269,33 +552,173 @@ def request_time_breakdown(timings: dict):
         "HTTP": 280
     }
     """
-    labels = list(timings.keys())
-    values = list(timings.values())
-
-    fig = go.Figure()
-
-    fig.add_trace(
-        go.Bar(
-            x=values,
-            y=["Total Request Time"],
-            orientation="h",
-            marker=dict(
-                color=["#2ecc71", "#a371f7", "#f1c40f", "#79c0ff"]
-            ),
-            text=[f"{v:.0f} ms" for v in values],
-            textposition="inside"
+    import plotly.graph_objects as go
+
+    fig = _figure()
+
+    # One segment per layer, so any number of layers stack and get a legend entry
+    for index, (label, value) in enumerate(timings.items()):
+        fig.add_trace(
+            go.Bar(
+                x=[value],
+                y=["Total Request Time"],
+                orientation="h",
+                marker=dict(color=layer_color(label, index)),
+                name=label,
+                text=[f"{label} {value:.0f} ms"],
+                textposition="inside",
+                hovertemplate=f"{label}: %{{x:.1f}} ms<extra></extra>",
+            )
         )
-    )
 
     fig.update_layout(
         title="Where Time Was Spent (End-to-End)",
         xaxis_title="Milliseconds",
         yaxis=dict(showticklabels=False),
+        barmode="stack",
         height=220,
-        margin=dict(l=40, r=20, t=50, b=30),
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font=dict(color="#e6e6e6")
     )
 
     return fig
+
+
+# ======================================================
+# History — Monitored Latency Over Time
+# ======================================================
+@memoized
+def history_chart(series: dict):
+    """
+    Mean latency per metric over time, with the min-max range shaded.
+    `series` maps metric name to a TimeSeriesStore.query result; long
+    series are downsampled to HISTORY_MAX_POINTS first.
+    """
+    fig = _figure()
+
+    for index, (metric, points) in enumerate(series.items()):
+        points = downsample_series(points, HISTORY_MAX_POINTS)
+        color = layer_color(metric, index)
+        when = points["ts"].astype("datetime64[ms]")
+        scatter = _scatter(len(when))
+
+        fig.add_trace(
+            scatter(
+                x=when,
+                y=points["max"],
+                mode="lines",
+                line=dict(width=0),
+                hoverinfo="skip",
+                showlegend=False,
+            )
+        )
+        fig.add_trace(
+            scatter(
+                x=when,
+                y=points["min"],
+                mode="lines",
+                line=dict(width=0),
+                fill="tonexty",
+                fillcolor=_with_alpha(color, 0.15),
+                hoverinfo="skip",
+                showlegend=False,
+            )
+        )
+        fig.add_trace(
+            scatter(
+                x=when,
+                y=points["mean"],
+                mode="lines",
+                line=dict(color=color, width=2),
+                customdata=points["lost"],
+                hovertemplate="%{y:.1f} ms<br>Lost: %{customdata}",
+                name=metric.upper(),
+            )
+        )
+
+    fig.update_layout(
+        title="Latency History",
+        yaxis_title="Milliseconds",
+        hovermode="x unified",
+    )
+
+    return fig
+
+
+# ======================================================
+# Regions — Latency by Region
+# ======================================================
+@memoized
+def region_latency_chart(rows):
+    """
+    Median latency of each layer per region, p95 as the error bar.
+    `rows` are RegionStore.latest results.
+    """
+    import plotly.graph_objects as go
+
+    fig = _figure()
+
+    for index, layer in enumerate(dict.fromkeys(row["layer"] for row in rows)):
+        layer_rows = [row for row in rows if row["layer"] == layer and row["median"] is not None]
+        fig.add_trace(
+            go.Bar(
+                x=[row["region"] for row in layer_rows],
+                y=[row["median"] for row in layer_rows],
+                error_y=dict(
+                    type="data",
+                    symmetric=False,
+                    array=[row["p95"] - row["median"] for row in layer_rows],
+                    arrayminus=[0] * len(layer_rows),
+                ),
+                marker=dict(color=layer_color(layer, index)),
+                name=layer.upper(),
+            )
+        )
+
+    fig.update_layout(
+        title="Latency by Region (median, p95)",
+        xaxis_title="Region",
+        yaxis_title="Milliseconds",
+        barmode="group",
+    )
+
+    return fig
+
+
+# ======================================================
+# Fleet — Latency Heatmaps
+# ======================================================
+@memoized
+def latency_heatmap(z, domains, columns, title: str, column_title: str = None):
+    """
+    One row per domain, one column per layer or time bucket, coloured by
+    latency in ms (NaN cells are left blank). A heatmap is drawn as a
+    single image, so hundreds of domains by hundreds of columns stay
+    responsive where one line per domain would not.
+    """
+    import plotly.graph_objects as go
+
+    fig = _figure(
+        go.Heatmap(
+            z=z,
+            x=columns,
+            y=domains,
+            colorscale="Turbo",
+            colorbar=dict(title="ms"),
+            hoverongaps=False,
+            hovertemplate="%{y}<br>%{x}<br>%{z:.1f} ms<extra></extra>",
+        )
+    )
+
+    fig.update_layout(
+        title=title,
+        xaxis_title=column_title,
+        # Labels are skipped automatically once rows get too dense to read
+        yaxis=dict(autorange="reversed"),
+        height=min(max(240, 18 * len(domains) + 100), 900),
+    )
+
+    return fig
+
+
+def _with_alpha(hex_color: str, alpha: float):
+    r, g, b = (int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+    return f"rgba({r},{g},{b},{alpha})"
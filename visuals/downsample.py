@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def lttb_indices(x, y, threshold: int):
+    """
+    Indices of the `threshold` points Largest-Triangle-Three-Buckets keeps
+    of (x, y): the first and last point, plus the one point per bucket
+    that spans the largest triangle with its neighbours, so peaks and
+    dips survive. NaN points are only kept for buckets that are all NaN,
+    where they show as gaps.
+
+    Returns:
+        (indices, starts): kept indices and the start index of each
+        point's bucket, for reducing other columns over the same buckets
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        index = np.arange(n)
+        return index, index
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # The first and last points are buckets of their own
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts = np.r_[0, edges]
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    a = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_lo, next_hi = hi, edges[bucket + 2] if bucket + 2 < len(edges) else n
+
+        next_y = y[next_lo:next_hi]
+        finite = next_y[~np.isnan(next_y)]
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = finite.mean() if len(finite) else y[a]
+
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        area = np.where(np.isnan(area), -1.0, area)
+        kept[bucket + 1] = lo + int(np.argmax(area))
+
+        if not np.isnan(y[kept[bucket + 1]]):
+            a = kept[bucket + 1]
+
+    return kept, starts
+
+
+def downsample_series(series: dict, max_points: int):
+    """
+    A TimeSeriesStore.query result cut to at most `max_points` buckets.
+    The mean line keeps its shape (LTTB); min and max are the extremes of
+    each bucket, so the shaded range still shows every spike, and counts
+    are bucket totals.
+    """
+    kept, starts = lttb_indices(series["ts"], series["mean"], max_points)
+    if len(kept) == len(series["ts"]):
+        return series
+
+    return {
+        "ts": series["ts"][kept],
+        "mean": series["mean"][kept],
+        # fmin/fmax skip NaN from buckets that were entirely lost
+        "min": np.fmin.reduceat(series["min"], starts),
+        "max": np.fmax.reduceat(series["max"], starts),
+        "count": np.add.reduceat(series["count"], starts),
+        "lost": np.add.reduceat(series["lost"], starts)
+    }